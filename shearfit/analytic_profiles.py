@@ -53,6 +53,11 @@ class NFW:
         proper radii :math:`r`.
     radius_to_mass():
         Converts the :math:`r_{200c}` radius of the halo to a mass in :math:`M_\\odot`
+    mass_to_radius(m200c):
+        Converts masses :math:`M_{200c}` to radii :math:`r_{200c}`, at the redshift of the halo
+    delta_sigma_grid(r, r200c, c)
+        Computes :math:`\\Delta\\Sigma(r)` for many NFW lenses at once, given arrays of 
+        :math:`r_{200c}` and :math:`c`.
     """
 
     def __init__(self, r200c, c, zl, r200c_err=0, c_err=0, cosmo=WMAP7): 
@@ -68,6 +73,8 @@ class NFW:
         self.r200c_err = r200c_err
         self._rs = r200c / c
         self._x = None
+        self._rho_crit_zl = None
+        self._rho_crit_value = None
 
     @property
     def r200c(self): return self._r200c
@@ -101,24 +108,65 @@ class NFW:
         self._del_c = (200/3) * self._c**3 / (np.log(1+self._c) - self.c/(1+self._c))
  
 
-    def radius_to_mass(self):
+    def _rho_crit(self):
+        """
+        Returns the critical density at the redshift `zl` in proper :math:`M_{\\odot}/\\text{Mpc}^3`. 
+        The value is cached, and only recomputed if `zl` has changed, since this object is typically
+        evaluated many times at a fixed redshift (e.g. on every iteration of a fit).
+        """
+        if(self._rho_crit_zl is None or self._rho_crit_zl != self.zl):
+            rho_crit = self._cosmo.critical_density(self.zl)
+            self._rho_crit_value = rho_crit.to(units.Msun/units.Mpc**3).value
+            self._rho_crit_zl = self.zl
+        return self._rho_crit_value
+ 
+
+    def radius_to_mass(self, r200c=None):
         """
         Computes the halo mass contained within :math:`r_{200c}`.
 
+        Parameters
+        ----------
+        r200c : float or float array, optional
+            The radii to convert, in :math:`Mpc`. Defaults to `None`, in which case the radius
+            of this object, `r200c`, is used.
+
         Returns
         -------
-        m200c : float
+        m200c : float or float array
             The halo mass :math:`M_{200c}` in units of :math:`M_\\odot`.
         """
        
+        if(r200c is None): r200c = self._r200c
+        
         # critical density in proper M_sun/Mpc^3
-        rho_crit = self._cosmo.critical_density(self.zl)
-        rho_crit = rho_crit.to(units.Msun/units.Mpc**3).value
+        rho_crit = self._rho_crit()
      
-        m200c = (4/3) * np.pi * (self._r200c)**3 * (rho_crit * 200)
+        m200c = (4/3) * np.pi * np.asarray(r200c)**3 * (rho_crit * 200)
         return m200c
 
 
+    def mass_to_radius(self, m200c):
+        """
+        Computes the radius :math:`r_{200c}` of halos of mass :math:`M_{200c}` at the redshift 
+        of this object (the inverse of `radius_to_mass()`).
+
+        Parameters
+        ----------
+        m200c : float or float array
+            The masses to convert, in :math:`M_\\odot`.
+
+        Returns
+        -------
+        r200c : float or float array
+            The radii :math:`r_{200c}`, in :math:`Mpc`.
+        """
+        
+        rho_crit = self._rho_crit()
+        r200c = (np.asarray(m200c) / ((4/3) * np.pi * rho_crit * 200))**(1/3)
+        return r200c
+
+
     def _g(self, x):
         """
         Computes the NFW prediction for the reduced shear g at the scaled radii x 
@@ -127,7 +175,8 @@ class NFW:
         Parameters
         ----------
         x : float array
-            The normalized radii r/r_s at which to compute the reduced shear g(x).
+            The normalized radii r/r_s at which to compute the reduced shear g(x). May be
+            of any shape.
 
         Returns
         -------
@@ -148,7 +197,7 @@ class NFW:
         m2 = np.where(x == 1)
         m3 = np.where(x > 1)
         
-        reduced_profile = np.empty(len(x),dtype=np.float64)
+        reduced_profile = np.empty(np.shape(x),dtype=np.float64)
         reduced_profile[m1] = g1( x[m1] )
         reduced_profile[m2] = 10./3 + 4.*np.log(1./2)
         reduced_profile[m3] = g2( x[m3] )
@@ -228,6 +277,56 @@ class NFW:
             return [self._delta_sigma(r), dsig_stderr]
 
 
+    def delta_sigma_grid(self, r, r200c, c, zl=None):
+        """
+        Computes :math:`\\Delta\\Sigma` at projected proper radii `r` for a collection of NFW lenses,
+        in a single vectorized evaluation. The parameters of this object are not modified, and the 
+        radii and concentrations are instead given by the `r200c` and `c` arguments, which may be arrays
+        of any (mutually broadcastable) shape. This is intended for computations over many points in 
+        parameter space at once, such as grid scans, or ensemble samplers.
+        
+        Parameters
+        ----------
+        r : float array
+            Proper projected radius relative to the center of the lens, in :math:`Mpc`. Either a 1d 
+            array, in which case all lenses are evaluated at the same radii, or an array with trailing
+            dimension `nr`, which broadcasts against the parameter arrays (e.g. shape `(N, nr)` for 
+            `N` lenses with distinct radii).
+        r200c : float or float array
+            The radii :math:`r_{200c}` of the lenses, in :math:`Mpc`.
+        c : float or float array
+            The concentrations of the lenses.
+        zl : float or float array, optional
+            The lens redshifts. Defaults to `None`, in which case the redshift of this object, 
+            `zl`, is used for all lenses.
+        
+        Returns
+        -------
+        dSigma : float array
+            The differential surface density :math:`\\Delta\\Sigma` in proper 
+            :math:`M_{\\odot}/\\text{pc}^2`, with shape given by the broadcast shape of the parameter 
+            arrays, followed by the trailing dimension of `r`.
+        """
+        
+        # parameters gain a trailing axis to broadcast against the radii
+        r200c = np.asarray(r200c, dtype=np.float64)[..., np.newaxis]
+        c = np.asarray(c, dtype=np.float64)[..., np.newaxis]
+        if(zl is None): zl = self.zl
+        
+        # define critical density rho_crit in proper M_sun pc^-3,
+        rho_crit = self._cosmo.critical_density(zl)
+        rho_crit = np.asarray(rho_crit.to(units.Msun/units.pc**3).value)[..., np.newaxis]
+        
+        # 1e6 in rs to get Mpc to pc
+        rs = r200c / c
+        del_c = (200/3) * c**3 / (np.log(1+c) - c/(1+c))
+        x = r / rs
+        
+        # proper mean surface density dSigma in (solMass) (pc)^2
+        dSigma = (rs * 1e6 * del_c * rho_crit) * self._g(x)
+        return dSigma
+
+
     def _delta_sigma(self, r):
         """
         Computes :math:`\\Delta\\Sigma` at projected proper radii `r`, for an NFW lens. The implementation
@@ -256,8 +355,7 @@ class NFW:
         x = r / self._rs
 
         # define critical density rho_crit in proper M_sun pc^-3,
-        rho_crit = self._cosmo.critical_density(self.zl)
-        rho_crit = rho_crit.to(units.Msun/units.pc**3).value
+        rho_crit = self._rho_crit() / 1e18
         
         # proper mean surface density dSigma in (solMass) (pc)^2
         dSigma = (rs * self._del_c * rho_crit) * self._g(x)
@@ -288,8 +386,7 @@ class NFW:
         x = r / self._rs
 
         # define critical density rho_crit in proper M_sun pc^-3,
-        rho_crit = self._cosmo.critical_density(self.zl)
-        rho_crit = rho_crit.to(units.Msun/units.pc**3).value
+        rho_crit = self._rho_crit() / 1e18
          
         # NFW prediction for surface density
         f1 = lambda x: (2/(x**2-1)) * (1 - ( 2/np.sqrt(1-x**2) * np.arctanh(np.sqrt((1-x)/(1+x))) ))
@@ -329,8 +426,7 @@ class NFW:
         """
 
         # define critical density rho_crit in proper M_sun Mpc^-3,
-        rho_crit = self._cosmo.critical_density(self.zl)
-        rho_crit = rho_crit.to(units.Msun/units.Mpc**3).value
+        rho_crit = self._rho_crit()
 
         # evaluate NFW profile
         pref = self._del_c * rho_crit
@@ -0,0 +1,60 @@
+'''
+This module provides the communicator used by the fitting driver for each of its execution
+backends. With the `'mpi'` backend, the driver runs as one process per MPI rank, communicating
+through `mpi4py`; with the `'pool'` and `'serial'` backends, it runs as a single process (which,
+for `'pool'`, hands out halos to a local pool of worker processes), and the collective operations
+of the driver are those of a communicator of one rank. `mpi4py` is only imported by the `'mpi'`
+backend, such that the other backends run without an MPI installation.
+'''
+
+backends = ['mpi', 'pool', 'serial']
+
+class serial_comm:
+    """
+    This class constructs a stand-in for an `mpi4py` communicator of a single rank, providing the
+    subset of its interface used by the fitting driver, such that the same driver code runs with
+    or without MPI.
+
+    Methods
+    -------
+    Get_rank()
+        Returns `0`.
+    Get_size()
+        Returns `1`.
+    Barrier()
+        Does nothing.
+    bcast(obj, root)
+        Returns `obj`.
+    gather(obj, root)
+        Returns `[obj]`.
+    allgather(obj)
+        Returns `[obj]`.
+    """
+    def Get_rank(self): return 0
+    def Get_size(self): return 1
+    def Barrier(self): return None
+    def bcast(self, obj, root=0): return obj
+    def gather(self, obj, root=0): return [obj]
+    def allgather(self, obj): return [obj]
+
+
+def get_comm(backend):
+    '''
+    Returns the communicator of an execution backend.
+
+    Parameters
+    ----------
+    backend : string
+        The backend; `'mpi'`, `'pool'`, or `'serial'`.
+
+    Returns
+    -------
+    communicator
+        `MPI.COMM_WORLD` for `'mpi'`, and a `serial_comm` otherwise.
+    '''
+    if(backend not in backends):
+        raise ValueError('backend must be one of {}'.format(backends))
+    if(backend == 'mpi'):
+        from mpi4py import MPI
+        return MPI.COMM_WORLD
+    return serial_comm()
@@ -0,0 +1,325 @@
+import time
+import numpy as np
+from analytic_profiles import NFW
+from example_run import _gen_mock_data
+from scipy import optimize
+from fit_profile import fit_nfw_profile_lstq as fit
+from fit_profile import fit_nfw_profiles_batched, _nfw_fit_residual
+
+'''
+This module contains benchmarks of the fitting routines in `fit_profile.py`, run against synthetically
+generated background source data (as in `example_run.mock_example_run()`). Each benchmark prints a
+short summary, and returns its measurements as a dictionary.
+'''
+
+def benchmark_warm_start(zl=0.35, r200c=2, c=3.7, nsources=5000, fov=1500, z_dls=1.0, noisef=1.0,
+                         rbins=20, bootN=200, seed=0):
+    """
+    Compares the cost of the bootstrap error estimation in `fit_nfw_profile_lstq` with and without
+    warm-started realization fits, on a mock lens with binned data.
+
+    Parameters
+    ----------
+    zl : float
+        The lens redshift. Defaults to `0.35`.
+    r200c : float
+        The :math:`r_{200c}` radius of the lens, in Mpc. Defaults to `2`.
+    c : float
+        The dimensionless NFW concentration of the lens. Defaults to `3.7`.
+    nsources : int
+        The number of sources to place in the background. Defaults to `5000`.
+    fov : float
+        The side length of the field of view, in arcseconds. Defaults to `1500`.
+    z_dls : float
+        The maximum redshift difference between the lens and sources. Defaults to `1.0`.
+    noisef : float
+        The amount of scatter to add to the mock data (see `example_run.mock_example_run()`).
+        Defaults to `1.0`.
+    rbins : int
+        Number of radial bins to fit to. Defaults to `20`.
+    bootN : int
+        Number of bootstrap realizations. Defaults to `200`.
+    seed : int
+        Seed for both the mock data, and the bootstrap realizations. Defaults to `0`.
+
+    Returns
+    -------
+    dict
+        For each of the warm start modes `False`, `True`, and `'previous'`, a dictionary giving the
+        mean number of residual evaluations per bootstrap fit `'nfev'`, the wall time `'time'`, and
+        the bootstrap errors `'err'`.
+    """
+
+    np.random.seed(seed)
+    [mock_lens, true_profile] = _gen_mock_data(zl, r200c, c, nsources, fov, z_dls, noisef=noisef)
+
+    results = {}
+    for warm_start in [False, True, 'previous']:
+        fitted_profile = NFW(0.75, 3.0, zl)
+        start = time.time()
+        [res, err] = fit(mock_lens, fitted_profile, r200_bounds=[0.1, 15], conc_bounds=[1, 10],
+                         bin_data=True, bins=rbins, bootstrap=True, bootN=bootN,
+                         warm_start=warm_start, seed=seed)
+        results[warm_start] = {'nfev':res.boot_nfev, 'time':time.time()-start, 'err':err}
+        print('warm_start = {}: {:.2f} evaluations per bootstrap fit, {:.2f} s, '\
+              'errors = [{:.4f}, {:.4f}]'.format(warm_start, res.boot_nfev,
+                                                 results[warm_start]['time'], err[0], err[1]))
+    return results
+
+
+
+def benchmark_fisher_errors(zl=0.35, r200c=2, c=3.7, nsources=5000, fov=1500, z_dls=1.0, 
+                            noisefs=[0.1, 1.0, 10.0], rbins=20, bootN=200, seed=0):
+    """
+    Compares the parameter errors, and their cost, given by the Fisher matrix and bootstrap modes 
+    of `fit_nfw_profile_lstq`, on mock lenses of varying noise, with binned data. Both the fit with 
+    a floating concentration, and with the `'child2018'` c-M relation, are included.
+
+    Parameters
+    ----------
+    zl : float
+        The lens redshift. Defaults to `0.35`.
+    r200c : float
+        The :math:`r_{200c}` radius of the lens, in Mpc. Defaults to `2`.
+    c : float
+        The dimensionless NFW concentration of the lens. Defaults to `3.7`.
+    nsources : int
+        The number of sources to place in the background. Defaults to `5000`.
+    fov : float
+        The side length of the field of view, in arcseconds. Defaults to `1500`.
+    z_dls : float
+        The maximum redshift difference between the lens and sources. Defaults to `1.0`.
+    noisefs : float list
+        The amounts of scatter to add to the mock data (see `example_run.mock_example_run()`);
+        one mock lens is generated per entry. Defaults to `[0.1, 1.0, 10.0]`.
+    rbins : int
+        Number of radial bins to fit to. Defaults to `20`.
+    bootN : int
+        Number of bootstrap realizations. Defaults to `200`.
+    seed : int
+        Seed for both the mock data, and the bootstrap realizations. Defaults to `0`.
+
+    Returns
+    -------
+    dict
+        Keyed by `(noisef, cM_relation)`, a dictionary giving the errors `'fisher_err'` and 
+        `'boot_err'`, and the wall times `'fisher_time'` and `'boot_time'`, of each mode.
+    """
+
+    np.random.seed(seed)
+    results = {}
+    for noisef in noisefs:
+        [mock_lens, true_profile] = _gen_mock_data(zl, r200c, c, nsources, fov, z_dls, noisef=noisef)
+        
+        for cM_relation in [None, 'child2018']:
+            result = {}
+            for mode in ['fisher', 'boot']:
+                fitted_profile = NFW(0.75, 3.0, zl)
+                start = time.time()
+                [res, err] = fit(mock_lens, fitted_profile, r200_bounds=[0.1, 15], conc_bounds=[1, 10], 
+                                 cM_relation=cM_relation, bin_data=True, bins=rbins, 
+                                 bootstrap=(mode=='boot'), bootN=bootN, seed=seed, 
+                                 errors=('fisher' if mode=='fisher' else None))
+                result['{}_time'.format(mode)] = time.time() - start
+                result['{}_err'.format(mode)] = err
+            results[(noisef, cM_relation)] = result
+            print('noisef = {}, cM_relation = {}: fisher errors = [{:.4f}, {:.4f}] in {:.3f} s, '\
+                  'bootstrap errors = [{:.4f}, {:.4f}] in {:.3f} s'.format(noisef, cM_relation, 
+                   result['fisher_err'][0], result['fisher_err'][1], result['fisher_time'], 
+                   result['boot_err'][0], result['boot_err'][1], result['boot_time']))
+    return results
+
+
+def benchmark_batched_fitting(nhalos=2000, nbins=30, nloop=200, seed=0):
+    """
+    Compares the cost of fitting a stack of binned halo profiles with `fit_nfw_profiles_batched`, to 
+    that of fitting each profile separately with `scipy.optimize.least_squares`, as done per-halo by
+    `fit_nfw_profile_lstq`. The profiles are analytic NFW profiles with Gaussian noise, for halos with 
+    random redshifts, radii and concentrations.
+
+    Parameters
+    ----------
+    nhalos : int
+        The number of halo profiles to fit. Defaults to `2000`.
+    nbins : int
+        The number of radial bins of each profile. Defaults to `30`.
+    nloop : int
+        The number of profiles to fit one at a time, from which the time to fit all `nhalos` profiles 
+        in a loop is extrapolated. Defaults to `200`.
+    seed : int
+        Seed for the mock profiles. Defaults to `0`.
+
+    Returns
+    -------
+    dict
+        A dictionary giving the wall times `'batched_time'` and (extrapolated) `'loop_time'`, the 
+        fraction of converged batched fits `'converged'`, and the maximum relative difference of the 
+        batched and looped best fit parameters `'max_rel_diff'`.
+    """
+
+    rng = np.random.default_rng(seed)
+    zl = rng.uniform(0.2, 1.0, nhalos)
+    r200c = rng.uniform(0.5, 2.5, nhalos)
+    c = rng.uniform(2, 8, nhalos)
+    r = np.outer(rng.uniform(0.9, 1.1, nhalos), np.linspace(0.3, 4, nbins))
+    dSigma_true = NFW(1.0, 1.0, 0.5).delta_sigma_grid(r, r200c, c, zl=zl)
+    dSigma_data = dSigma_true + (0.2*np.abs(dSigma_true) + 2) * rng.standard_normal(r.shape)
+
+    start = time.time()
+    out = fit_nfw_profiles_batched(r, dSigma_data, zl, r200_bounds=[0.1, 15], conc_bounds=[1, 10])
+    batched_time = time.time() - start
+
+    start = time.time()
+    loop_params = np.zeros((nloop, 2))
+    for i in range(nloop):
+        fitted_profile = NFW(0.75, 3.0, zl[i])
+        res = optimize.least_squares(_nfw_fit_residual, [0.75, 3.0], 
+                                     args=(fitted_profile, r[i], dSigma_data[i], None), 
+                                     bounds=([0.1, 1], [15, 10]))
+        loop_params[i] = res.x
+    loop_time = (time.time() - start) * nhalos / nloop
+    
+    batched_params = np.vstack([out['r200c'][:nloop], out['c'][:nloop]]).T
+    max_rel_diff = np.max(np.abs(batched_params - loop_params) / loop_params, axis=0)
+    print('{} halos: batched fit in {:.2f} s ({:.1f}% converged), loop of fits in {:.2f} s, max '\
+          'relative difference = [{:.2e}, {:.2e}]'.format(nhalos, batched_time, 
+           100*np.mean(out['converged']), loop_time, max_rel_diff[0], max_rel_diff[1]))
+    return {'batched_time':batched_time, 'loop_time':loop_time, 
+            'converged':np.mean(out['converged']), 'max_rel_diff':max_rel_diff}
+
+
+def benchmark_adaptive_bootstrap(zl=0.35, r200c=2, c=3.7, nsources=5000, fov=1500, z_dls=1.0, 
+                                 noisefs=[0.1, 1.0], rbins=20, bootN=1000, boot_tol=0.05, seed=0):
+    """
+    Compares the cost of the bootstrap error estimation in `fit_nfw_profile_lstq` with a fixed 
+    number of realizations, and with early stopping once the errors have converged to a relative 
+    precision `boot_tol`, on mock lenses of varying noise, with binned data.
+
+    Parameters
+    ----------
+    zl : float
+        The lens redshift. Defaults to `0.35`.
+    r200c : float
+        The :math:`r_{200c}` radius of the lens, in Mpc. Defaults to `2`.
+    c : float
+        The dimensionless NFW concentration of the lens. Defaults to `3.7`.
+    nsources : int
+        The number of sources to place in the background. Defaults to `5000`.
+    fov : float
+        The side length of the field of view, in arcseconds. Defaults to `1500`.
+    z_dls : float
+        The maximum redshift difference between the lens and sources. Defaults to `1.0`.
+    noisefs : float list
+        The amounts of scatter to add to the mock data (see `example_run.mock_example_run()`);
+        one mock lens is generated per entry. Defaults to `[0.1, 1.0]`.
+    rbins : int
+        Number of radial bins to fit to. Defaults to `20`.
+    bootN : int
+        The (maximum) number of bootstrap realizations. Defaults to `1000`.
+    boot_tol : float
+        The relative precision target of the early-stopping bootstrap. Defaults to `0.05`.
+    seed : int
+        Seed for both the mock data, and the bootstrap realizations. Defaults to `0`.
+
+    Returns
+    -------
+    dict
+        Keyed by `(noisef, boot_tol)`, where `boot_tol` is `None` for the fixed bootstrap, a 
+        dictionary giving the number of realizations fit `'boot_n'`, the wall time `'time'`, and 
+        the bootstrap errors `'err'`.
+    """
+
+    np.random.seed(seed)
+    results = {}
+    for noisef in noisefs:
+        [mock_lens, true_profile] = _gen_mock_data(zl, r200c, c, nsources, fov, z_dls, noisef=noisef)
+        
+        for tol in [None, boot_tol]:
+            fitted_profile = NFW(0.75, 3.0, zl)
+            start = time.time()
+            [res, err] = fit(mock_lens, fitted_profile, r200_bounds=[0.1, 15], conc_bounds=[1, 10],
+                             bin_data=True, bins=rbins, bootstrap=True, bootN=bootN, boot_tol=tol, 
+                             seed=seed)
+            results[(noisef, tol)] = {'boot_n':res.boot_n, 'time':time.time()-start, 'err':err}
+            print('noisef = {}, boot_tol = {}: {} realizations in {:.2f} s, errors = [{:.4f}, {:.4f}]'\
+                  .format(noisef, tol, res.boot_n, results[(noisef, tol)]['time'], err[0], err[1]))
+    return results
+
+
+def benchmark_log_mass(nhalos=50, zl_range=[0.2, 0.8], r200c_range=[0.5, 2.5], c_range=[2, 8], 
+                       nsources=2000, fov=1500, z_dls=1.0, noisef=5.0, rbins=20, seed=0):
+    """
+    Compares the convergence of `fit_nfw_profile_lstq` in the :math:`(r_{200c}, c)` and 
+    :math:`(\\log_{10}M_{200c}, \\log_{10}c)` parameterizations (see the `log_mass` argument), over a 
+    sample of low S/N mock lenses with random redshifts, radii and concentrations, with binned data.
+    Both the fit with a floating concentration, and with the `'child2018'` c-M relation, are included.
+
+    Parameters
+    ----------
+    nhalos : int
+        The number of mock lenses. Defaults to `50`.
+    zl_range : 2-element list
+        The range of the (uniformly drawn) lens redshifts. Defaults to `[0.2, 0.8]`.
+    r200c_range : 2-element list
+        The range of the (uniformly drawn) lens radii, in Mpc. Defaults to `[0.5, 2.5]`.
+    c_range : 2-element list
+        The range of the (uniformly drawn) lens concentrations. Defaults to `[2, 8]`.
+    nsources : int
+        The number of sources to place in the background of each lens. Defaults to `2000`.
+    fov : float
+        The side length of the field of view, in arcseconds. Defaults to `1500`.
+    z_dls : float
+        The maximum redshift difference between the lens and sources. Defaults to `1.0`.
+    noisef : float
+        The amount of scatter to add to the mock data (see `example_run.mock_example_run()`).
+        Defaults to `5.0`.
+    rbins : int
+        Number of radial bins to fit to. Defaults to `20`.
+    seed : int
+        Seed for the mock lenses. Defaults to `0`.
+
+    Returns
+    -------
+    dict
+        Keyed by `(log_mass, cM_relation)`, a dictionary giving the mean number of residual 
+        evaluations per fit `'nfev'` (including those used for the finite-difference Jacobian), the 
+        fraction of fits which did not converge, or which ended on a bound, `'failure_rate'`, the 
+        median fractional error of the recovered :math:`r_{200c}` `'r200c_frac_err'`, and the wall 
+        time `'time'`.
+    """
+
+    np.random.seed(seed)
+    lenses = []
+    for i in range(nhalos):
+        zl = np.random.uniform(*zl_range)
+        r200c = np.random.uniform(*r200c_range)
+        c = np.random.uniform(*c_range)
+        lenses.append(_gen_mock_data(zl, r200c, c, nsources, fov, z_dls, noisef=noisef))
+
+    results = {}
+    for cM_relation in [None, 'child2018']:
+        for log_mass in [False, True]:
+            nfev, failures, frac_err = [], [], []
+            start = time.time()
+            for [mock_lens, true_profile] in lenses:
+                fitted_profile = NFW(0.75, 3.0, mock_lens.zl)
+                [res, err] = fit(mock_lens, fitted_profile, r200_bounds=[0.1, 15], conc_bounds=[1, 10], 
+                                 cM_relation=cM_relation, bin_data=True, bins=rbins, log_mass=log_mass)
+                nfev.append(res.nfev + res.njev * len(res.x))
+                failures.append(not res.success or np.any(res.active_mask != 0))
+                frac_err.append(np.abs(fitted_profile.r200c / true_profile.r200c - 1))
+            results[(log_mass, cM_relation)] = {'nfev':np.mean(nfev), 'failure_rate':np.mean(failures),
+                                                'r200c_frac_err':np.median(frac_err), 
+                                                'time':time.time()-start}
+            print('log_mass = {}, cM_relation = {}: {:.2f} evaluations per fit, {:.1f}% failures, '\
+                  'median r200c error {:.3f}, {:.2f} s'.format(log_mass, cM_relation, np.mean(nfev), 
+                  100*np.mean(failures), np.median(frac_err), results[(log_mass, cM_relation)]['time']))
+    return results
+
+
+if(__name__ == "__main__"):
+    benchmark_warm_start()
+    benchmark_fisher_errors()
+    benchmark_batched_fitting()
+    benchmark_adaptive_bootstrap()
+    benchmark_log_mass()
@@ -0,0 +1,143 @@
+import os
+import glob
+import h5py
+import numpy as np
+from results_store import results_store, read_results
+
+'''
+This module builds and loads an index of the halo cutouts of a ray-tracing campaign, giving the
+path of each cutout, the depth of its lensing mocks and density planes, its number of sources, the
+mass and redshift of its halo, and whether or not it is complete enough to be fit. Scanning the
+cutouts requires opening several files per halo on a shared filesystem; the manifest does so once
+(with the work split across MPI ranks, if a communicator is given), after which later runs load a
+single file. Usage is as follows:
+
+    import cutout_manifest
+    manifest = cutout_manifest.build_manifest('{}/halo*'.format(lensing_dir), manifest_file)
+    ... or, on a later run ...
+    manifest = cutout_manifest.load_manifest(manifest_file)
+    cutouts = manifest['path'][manifest['valid']]
+'''
+
+def build_manifest(cutout_pattern, out_file, comm=None, executor=None):
+    '''
+    Scans halo cutout directories and writes their manifest.
+
+    Parameters
+    ----------
+    cutout_pattern : string
+        A glob pattern matching the cutout directories (e.g. `'{lensing_dir}/halo*'`). A 
+        `ValueError` is raised if it matches none.
+    out_file : string
+        The path of the manifest file to write (replaced if it exists).
+    comm : `mpi4py` communicator, optional
+        If given, the cutouts are scanned in parallel by all ranks of `comm`, and the manifest is
+        written by rank 0 and returned on every rank. Must be called by all ranks. Defaults to
+        `None`, in which case the scan is serial.
+    executor : `concurrent.futures.Executor` class instance, optional
+        If given (and `comm` is not), the cutouts are scanned in parallel by the workers of 
+        `executor`. Defaults to `None`.
+
+    Returns
+    -------
+    dict
+        The manifest, as returned by `load_manifest()`.
+    '''
+    rank = 0 if comm is None else comm.Get_rank()
+    numranks = 1 if comm is None else comm.Get_size()
+
+    cutouts = sorted(glob.glob(cutout_pattern)) if rank == 0 else None
+    if(comm is not None): cutouts = comm.bcast(cutouts, root=0)
+    if(len(cutouts) == 0):
+        raise ValueError('no cutouts match {}'.format(cutout_pattern))
+
+    # scan an interleaved subset of the cutouts on each rank, to even out any ordering in the
+    # sizes of the cutouts
+    indices = range(rank, len(cutouts), numranks)
+    if(executor is not None and comm is None):
+        rows = list(zip(indices, executor.map(scan_cutout, [cutouts[i] for i in indices], 
+                                              chunksize=16)))
+    else:
+        rows = [[i, scan_cutout(cutouts[i])] for i in indices]
+    if(comm is not None):
+        rows = comm.gather(rows, root=0)
+        if(rank == 0): rows = [row for rank_rows in rows for row in rank_rows]
+
+    if(rank == 0):
+        rows = [row for _, row in sorted(rows, key=lambda row: row[0])]
+        tmp_file = '{}.tmp{}'.format(out_file, os.getpid())
+        results_store(tmp_file).append(rows)
+        os.replace(tmp_file, out_file)
+    if(comm is not None): comm.Barrier()
+    return load_manifest(out_file)
+
+
+def load_manifest(manifest_file):
+    '''
+    Loads a manifest written by `build_manifest()`.
+
+    Parameters
+    ----------
+    manifest_file : string
+        The path of the manifest file.
+
+    Returns
+    -------
+    dict
+        The manifest columns, as 1d numpy arrays with one entry per cutout (see `scan_cutout()`).
+    '''
+    return read_results(manifest_file)
+
+
+def scan_cutout(cutout):
+    '''
+    Collects the metadata of one halo cutout, and checks that it is complete; that it contains a
+    lensing mock with at least one source plane, which is as deep as its density planes, and a
+    properties file which includes the halo concentration.
+
+    Parameters
+    ----------
+    cutout : string
+        The path of the cutout directory.
+
+    Returns
+    -------
+    dict
+        The cutout path `'path'` and name `'halo'`, the number of source planes `'nplanes'`, the
+        index of the deepest mock plane `'mock_depth'` and density plane `'dens_depth'` (`-1` if
+        there are none), the total number of sources `'nsources'`, the halo mass `'mass'` and
+        redshift `'zl'` (`NaN` if there is no properties file), whether or not the properties file
+        includes the concentration `'has_concentration'`, and whether or not the cutout can be fit
+        `'valid'`.
+    '''
+    row = {'path':cutout, 'halo':os.path.basename(os.path.normpath(cutout)), 'nplanes':0,
+           'mock_depth':-1, 'dens_depth':-1, 'nsources':0, 'mass':np.nan, 'zl':np.nan,
+           'has_concentration':False, 'valid':False}
+
+    # lensing mock planes (only the metadata of each plane is read)
+    mock_files = glob.glob('{}/*lensing_mocks.hdf5'.format(cutout))
+    if(len(mock_files) > 0):
+        with h5py.File(mock_files[0], 'r') as f:
+            planes = list(f.keys())
+            row['nplanes'] = len(planes)
+            if(len(planes) > 0):
+                row['mock_depth'] = max([int(s.split('plane')[-1]) for s in planes])
+                row['nsources'] = int(sum([f[s]['xr1'].shape[0] for s in planes]))
+
+    # density planes
+    dens_files = glob.glob('{}/dtfe_dens/*plane*'.format(cutout))
+    if(len(dens_files) > 0):
+        row['dens_depth'] = max([int(os.path.basename(s).split('plane')[-1].split('_')[0])
+                                 for s in dens_files])
+
+    # halo properties
+    props_file = '{}/properties.csv'.format(cutout)
+    if(os.path.exists(props_file)):
+        props = np.genfromtxt(props_file, delimiter=',', names=True)
+        row['mass'] = float(props['sod_halo_mass'])
+        row['zl'] = float(props['halo_redshift'])
+        row['has_concentration'] = len(props.dtype) == 11
+
+    row['valid'] = bool(row['nplanes'] > 0 and row['mock_depth'] == row['dens_depth'] and
+                        row['has_concentration'])
+    return row
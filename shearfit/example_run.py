@@ -1,4 +1,6 @@
 import os
+import csv
+import time
 import pdb
 import sys
 import h5py
@@ -15,6 +17,7 @@ from lensing_system import obs_lens_system
 from mass_concentration import child2018 as cm
 from fit_profile import fit_nfw_profile_lstq as fit
 from fit_profile import fit_nfw_profile_gridscan as fit_gs
+import instrumentation
 
 pprint = lambda s: print(s, flush=True)
 
@@ -62,7 +65,8 @@ def mock_example_run(zl=0.35, r200c=2, c=3.7, nsources=1000, fov=1500, z_dls=1.0
 
 def sim_example_run(halo_cutout_dir='/projects/DarkUniverse_esp/jphollowed/outerRim/cutouts_raytracing/'\
                                      'halo_4781763152100605952_0', 
-                    makeplot = True, showfig=True, stdout=True, bin_data=True, rbins=25, rmin=0):
+                    makeplot = True, showfig=True, stdout=True, bin_data=True, rbins=25, rmin=0, cache=None, 
+                    store=None):
     """
     This function performs an example run of the package, fitting an NFW profile to background 
     source data as obtained from ray-tracing through Outer Rim lightcone halo cutouts. The process 
@@ -100,6 +104,19 @@ def sim_example_run(halo_cutout_dir='/projects/DarkUniverse_esp/jphollowed/outer
     rmin : float
         The minimum radial distance of sources to include in the fit (e.g. `rmin = 0.3`) will
         remove the inner 300kpc of source information. Defaults to `0`.
+    cache : `fit_cache` class instance or string, optional
+        A cache of fit results (or the path to its directory) to consult before performing, and 
+        to update after performing, each profile fit (see `fit_profile.fit_nfw_profile_lstq`). 
+        Defaults to `None`, in which case every fit is performed.
+    store : `results_store` class instance, optional
+        A table to append the fit results to. Defaults to `None`, in which case the results are 
+        written to a CSV file in the `profile_fits` subdirectory of the cutout.
+
+    Returns
+    -------
+    list of dicts
+        The results of the fits with a floating concentration, and with the c-M relation, as 
+        rows given by `_result_row`.
     """
     
     global pprint
@@ -107,12 +124,159 @@ def sim_example_run(halo_cutout_dir='/projects/DarkUniverse_esp/jphollowed/outer
     else: pprint = lambda s: None
 
     pprint('reading lensing mock data')
-    [sim_lens, true_profile] = _read_sim_data(halo_cutout_dir)
+    with instrumentation.stage('read'):
+        [sim_lens, true_profile] = _read_sim_data(halo_cutout_dir)
     out_dir = '{}/profile_fits'.format(halo_cutout_dir)
     if not os.path.exists(out_dir): os.makedirs(out_dir)
-    _fit_test_data(sim_lens, true_profile, showfig=showfig, 
-                   out_dir=out_dir, makeplot = makeplot, bin_data=bin_data, 
-                   rbins=rbins, rmin=rmin)
+    return _fit_test_data(sim_lens, true_profile, showfig=showfig, 
+                          out_dir=out_dir, makeplot = makeplot, bin_data=bin_data, 
+                          rbins=rbins, rmin=rmin, cache=cache, store=store,
+                          halo=os.path.basename(os.path.normpath(halo_cutout_dir)))
+
+
+def sim_sweep_run(halo_cutout_dir, configs, makeplot=False, showfig=False, stdout=True, cache=None, 
+                  out_file=None, store=None, data=None):
+    """
+    This function fits an NFW profile to background source data as obtained from ray-tracing through 
+    an Outer Rim lightcone halo cutout (as in `sim_example_run`), for each of a list of fit 
+    configurations. The cutout is read once, and the derived quantities of the `obs_lens_system` 
+    (the critical surface density of each source, and the sorted radial prefix sums from which 
+    binned profiles are computed) are reused across configurations, such that each additional 
+    configuration costs only its fit. The results of all configurations are written in one pass.
+
+    Parameters
+    ----------
+    halo_cutout_dir : string
+        Path to a halo cutout ray-tacing output directory (see `sim_example_run`).
+    configs : list of dicts
+        The fit configurations. Each is a dictionary of keyword arguments to pass to 
+        `fit_profile.fit_nfw_profile_lstq` (e.g. `{'rmin':0.3, 'bin_data':True, 'bins':30, 
+        'cM_relation':'child2018'}`). The bounds `r200_bounds` and `conc_bounds` default to 
+        `[0.1, 15]` and `[1, 10]`, as in `sim_example_run`.
+    makeplot : boolean, optional
+        Whether or not to additionally render the plot of `sim_example_run` from the loaded data, 
+        with the `rmin` and `bins` of the first configuration. Defaults to `False`.
+    showfig : boolean, optional
+        Whether or not to `show` the plot, if `makeplot` is `True`. Defaults to `False`.
+    stdout : bool, optional
+        Whether or not to supress print statements. Defaults to `True`.
+    cache : `fit_cache` class instance or string, optional
+        A cache of fit results (or the path to its directory) to consult before performing, and 
+        to update after performing, each fit. Defaults to `None`.
+    out_file : string, optional
+        The path of the CSV file to write the results to. Defaults to `None`, in which case the 
+        results are written to `sweep_fits.csv` in the `profile_fits` subdirectory of the cutout, 
+        unless a `store` is given. If `False`, no CSV file is written (e.g. when the caller writes 
+        the returned results itself).
+    store : `results_store` class instance, optional
+        A table to append the results to (e.g. that of an MPI rank, shared by all of the cutouts 
+        that it fits). Defaults to `None`.
+    data : list, optional
+        The lensing system and true profile of the cutout, as returned by `load_sim_data`, if 
+        already loaded (e.g. by a prefetching thread). Defaults to `None`, in which case they are 
+        read from `halo_cutout_dir`.
+
+    Returns
+    -------
+    list of dicts
+        One row per configuration, as written to `out_file`, giving the configuration, the true 
+        and fitted halo parameters, and the fit diagnostics (see `_result_row`).
+    """
+    
+    global pprint
+    if(stdout == True): pprint = lambda s: print(s, flush=True)
+    else: pprint = lambda s: None
+
+    if(data is None):
+        pprint('reading lensing mock data')
+        with instrumentation.stage('read'):
+            [sim_lens, true_profile] = _read_sim_data(halo_cutout_dir)
+    else:
+        [sim_lens, true_profile] = data
+    out_dir = '{}/profile_fits'.format(halo_cutout_dir)
+    if not os.path.exists(out_dir): os.makedirs(out_dir)
+    if(out_file is None and store is None): out_file = '{}/sweep_fits.csv'.format(out_dir)
+    halo = os.path.basename(os.path.normpath(halo_cutout_dir))
+
+    rows = []
+    for i in range(len(configs)):
+        config = dict({'r200_bounds':[0.1, 15], 'conc_bounds':[1, 10]}, **configs[i])
+        pprint('fitting configuration {}/{}: {}'.format(i+1, len(configs), configs[i]))
+        fitted_profile = NFW(0.75, 3.0, sim_lens.zl)
+        start = time.perf_counter()
+        with instrumentation.stage('fit'):
+            [res, _] = fit(sim_lens, fitted_profile, cache=cache, **config)
+        rows.append(_result_row(halo, configs[i], true_profile, fitted_profile, res, 
+                                fit_time=time.perf_counter()-start))
+    
+    with instrumentation.stage('write'):
+        if(store is not None): store.append(rows)
+        if(out_file): _write_rows(rows, out_file)
+    
+    if(makeplot):
+        _fit_test_data(sim_lens, true_profile, makeplot=True, showfig=showfig, out_dir=out_dir, 
+                       bin_data=configs[0].get('bin_data', True), rbins=configs[0].get('bins', 25), 
+                       rmin=configs[0].get('rmin', 0), cache=cache, halo=halo)
+    return rows
+
+
+def _result_row(halo, config, true_profile, fitted_profile, res, fit_time=None):
+    """
+    Collects the result of one fit into a flat dictionary.
+
+    Parameters
+    ----------
+    halo : string
+        An identifier of the halo (e.g. the name of its cutout directory).
+    config : dict
+        The keyword arguments passed to `fit_profile.fit_nfw_profile_lstq`.
+    true_profile : `NFW` class instance
+        The true profile of the halo.
+    fitted_profile : `NFW` class instance
+        The fitted profile.
+    res : SciPy `OptimizeResult` object
+        The least squares result returned by `fit_profile.fit_nfw_profile_lstq`.
+    fit_time : float, optional
+        The wall time of the fit in seconds. Defaults to `None`, in which case it is not recorded.
+
+    Returns
+    -------
+    dict
+        The halo identifier `'halo'` and redshift `'zl'`, the entries of `config`, the true 
+        parameters `'r200c_true'` and `'c_true'`, the fitted parameters and errors `'r200c'`, `'c'`, 
+        `'r200c_err'` and `'c_err'`, the final cost `'cost'`, sum of squared residuals `'chi2'`, 
+        number of residual evaluations `'nfev'`, and termination `'status'` and `'success'` of the 
+        fit, and its wall time `'fit_time'`.
+    """
+    row = {'halo':halo, 'zl':float(true_profile.zl)}
+    row.update(config)
+    row.update({'r200c_true':float(true_profile.r200c), 'c_true':float(true_profile.c), 
+                'r200c':float(fitted_profile.r200c), 'c':float(fitted_profile.c), 
+                'r200c_err':float(fitted_profile.r200c_err), 'c_err':float(fitted_profile.c_err), 
+                'cost':float(res.cost), 'chi2':2*float(res.cost), 'nfev':int(res.nfev), 
+                'status':int(res.status), 'success':bool(res.success), 'fit_time':fit_time})
+    return row
+
+
+def _write_rows(rows, out_file):
+    """
+    Writes result rows to a CSV file, with a header given by the union of the row keys (in order
+    of first appearance). Entries missing from a row are left empty.
+
+    Parameters
+    ----------
+    rows : list of dicts
+        The rows to write, as given by `_result_row`.
+    out_file : string
+        The output file path.
+    """
+    fields = []
+    for row in rows:
+        fields.extend([k for k in row if k not in fields])
+    with open(out_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
 
 
 def _gen_mock_data(zl, r200c, c, nsources, fov, z_dls, noisef=0.1):
@@ -149,7 +313,41 @@ def _gen_mock_data(zl, r200c, c, nsources, fov, z_dls, noisef=0.1):
     return [mock_lens, true_profile]
     
 
-def _read_sim_data(halo_cutout_dir):
+def load_sim_data(halo_cutout_dir, read_stats=None):
+    """
+    Reads the lensing mock data of a halo cutout, as in `sim_sweep_run`, and precomputes the 
+    quantities which all fits to it share (the critical surface density of each source, and the 
+    radially sorted sums from which binned profiles are computed), such that the whole cost of 
+    preparing a cutout can be paid ahead of its fits (e.g. in a prefetching thread).
+
+    Parameters
+    ----------
+    halo_cutout_dir : string
+        Path to a halo cutout ray-tacing output directory.
+    read_stats : dict, optional
+        If given, the wall time in seconds of reading `'read_time'` and of precomputing 
+        `'prepare_time'`, the number of bytes of source data read `'bytes_read'`, and the number 
+        of sources kept `'nsources'` are written to it. Unlike the `instrumentation` counters, 
+        these are recorded per call, and so are attributed to the right cutout when loading in 
+        a background thread. Defaults to `None`.
+
+    Returns
+    -------
+    list
+        The `obs_lens_system` of the cutout sources, and the true `NFW` profile of the halo.
+    """
+    if(read_stats is None): read_stats = {}
+    start = time.perf_counter()
+    [sim_lens, true_profile] = _read_sim_data(halo_cutout_dir, read_stats=read_stats)
+    read_end = time.perf_counter()
+    sim_lens.calc_sigma_crit()
+    sim_lens._sorted_prefix_sums()
+    read_stats.update({'read_time':read_end - start, 'prepare_time':time.perf_counter() - read_end, 
+                  'nsources':len(sim_lens.zs)})
+    return [sim_lens, true_profile]
+
+
+def _read_sim_data(halo_cutout_dir, read_stats=None):
 
     # get ray-trace hdf5 and properties csv
     rtfs = glob.glob('{}/*lensing_mocks.hdf5'.format(halo_cutout_dir))
@@ -169,64 +367,88 @@ def _read_sim_data(halo_cutout_dir):
     m200c = props['sod_halo_mass']
     true_profile = NFW(r200c, c, zl, c_err = c_err)
     
-    raytrace_file = h5py.File(rtfs[0], 'r')
-    nplanes = len(list(raytrace_file.keys()))
-    t1, t2, y1, y2, k, zs = [], [], [], [], [], []
-
-    # stack data from each source plane
-    for i in range(nplanes):
-        plane_key = list(raytrace_file.keys())[i]
-        plane = raytrace_file[plane_key]
-        plane_z = plane['zs'][:]
-
-        #ignore this plane if infront of the halo
-        #YYY if(i > 0): continue
-        if(plane_z < zl): continue
-       
-        t1 = np.hstack([t1, plane['xr1'][:]])
-        t2 = np.hstack([t2, plane['xr2'][:]])
-        y1 = np.hstack([y1, plane['sr1'][:]])
-        y2 = np.hstack([y2, plane['sr2'][:]])
-        k = np.hstack([k, plane['kr0'][:]])
-        zs = np.hstack([zs, np.ones(len(t1)-len(zs)) * plane_z])
-        
-        #YYY y1 = np.hstack([y1, np.ravel(plane['shear1'][:])])
-        #YYY y2 = np.hstack([y2, np.ravel(plane['shear2'][:])])
-        #YYY k = np.hstack([k, np.ravel(plane['kappa0'][:])])
-        #YYY T1 = np.linspace(-props['boxRadius_arcsec'], props['boxRadius_arcsec'], 1024)
-        #YYY T2 = np.linspace(-props['boxRadius_arcsec'], props['boxRadius_arcsec'], 1024)
-        #YYY grid = np.meshgrid(T1, T2)
-        #YYY t1 = np.ravel(grid[0])
-        #YYY t2 = np.ravel(grid[1])
-        #YYY zs = np.hstack([zs, np.ones(len(t1)-len(zs)) * 10])
-
-     
     # trim the fov borders by 10% to be safe
-    mask = np.logical_and(np.abs(t1)<props['boxRadius_arcsec']*0.9, 
-                          np.abs(t2)<props['boxRadius_arcsec']*0.9)
-    t1 = t1[mask]
-    t2 = t2[mask]
-    zs = zs[mask]
-    y1 = y1[mask]
-    y2 = y2[mask]
-    k = k[mask]
+    fov_radius = props['boxRadius_arcsec'] * 0.9
+    with h5py.File(rtfs[0], 'r') as raytrace_file:
+        sources = _read_source_planes(raytrace_file, zl, fov_radius, read_stats=read_stats)
     
     sim_lens = obs_lens_system(zl)
-    sim_lens.set_background(t1, t2, zs, y1=y1, y2=y2, k=k)
+    sim_lens.set_background(sources['t1'], sources['t2'], sources['zs'], 
+                            y1=sources['y1'], y2=sources['y2'], k=sources['k'])
 
-    raytrace_file.close()
-    
     return [sim_lens, true_profile]
 
+
+def _read_source_planes(raytrace_file, zl, fov_radius, read_stats=None):
+    '''
+    Reads the sources behind a lens from the planes of a ray-trace hdf5 file. The plane redshifts 
+    and sizes are read first, and the output arrays allocated once, at the total size of the 
+    background planes; the data of foreground planes is never read, and the FOV cut is applied 
+    to each plane as it is read, such that the output is never copied (the peak memory is about 
+    the size of the background sources, plus one plane).
+
+    Parameters
+    ----------
+    raytrace_file : `h5py.File`
+        The open ray-trace file, with one group per source plane, each containing the plane 
+        redshift `zs`, the source positions `xr1`, `xr2` in arcseconds, shears `sr1`, `sr2`, and 
+        convergence `kr0`.
+    zl : float
+        The lens redshift; planes at lower redshift are skipped.
+    fov_radius : float
+        The half-width of the square FOV in arcseconds; sources outside of it are removed.
+    read_stats : dict, optional
+        If given, the number of bytes read `'bytes_read'` is written to it. Defaults to `None`.
+
+    Returns
+    -------
+    dict
+        The source positions `'t1'`, `'t2'`, redshifts `'zs'`, shears `'y1'`, `'y2'`, and 
+        convergence `'k'`, as 1d arrays.
+    '''
+    
+    # read plane metadata
+    planes = [raytrace_file[key] for key in raytrace_file.keys()]
+    plane_z = [float(np.ravel(plane['zs'][()])[0]) for plane in planes]
+    planes = [[plane, z] for plane, z in zip(planes, plane_z) if z >= zl]
+    nmax = sum([plane['xr1'].shape[0] for plane, _ in planes])
+    
+    columns = {'y1':'sr1', 'y2':'sr2', 'k':'kr0'}
+    sources = {name:np.empty(nmax) for name in ['t1', 't2', 'zs'] + list(columns.keys())}
+    n = 0
+    nbytes = 0
+    for plane, z in planes:
+        t1 = plane['xr1'][:]
+        t2 = plane['xr2'][:]
+        mask = np.logical_and(np.abs(t1) < fov_radius, np.abs(t2) < fov_radius)
+        m = np.sum(mask)
+        sources['t1'][n:n+m] = t1[mask]
+        sources['t2'][n:n+m] = t2[mask]
+        sources['zs'][n:n+m] = z
+        nbytes += t1.nbytes + t2.nbytes
+        for name, key in columns.items():
+            values = plane[key][:]
+            sources[name][n:n+m] = values[mask]
+            nbytes += values.nbytes
+        n += m
+    if(instrumentation.enabled): instrumentation.count('hdf5_bytes_read', nbytes)
+    if(read_stats is not None): read_stats['bytes_read'] = nbytes
+   
+    # shrink the outputs to the kept sources in place
+    for values in sources.values():
+        values.resize(n, refcheck=False)
+    return sources
+
     
 def _fit_test_data(lens, true_profile, makeplot=True, showfig=False, out_dir='.', 
-                   bin_data=True, rbins=25, rmin = 0):
+                   bin_data=True, rbins=25, rmin = 0, cache=None, halo='', store=None):
 
     zl = lens.zl
     r200c = true_profile.r200c
     c = true_profile.c
-    bg = lens.get_background()
-    sigmaCrit = lens.calc_sigma_crit()
+    with instrumentation.stage('sigma_crit'):
+        bg = lens.get_background()
+        sigmaCrit = lens.calc_sigma_crit()
     yt = bg['yt']
     r = bg['r']
     k = bg['k']
@@ -237,29 +459,35 @@ def _fit_test_data(lens, true_profile, makeplot=True, showfig=False, out_dir='.'
 
     # do inner radius cut and bin data
     pprint('doing radial masking and binning')
-    radial_mask = (r >= rmin)
-    sigmaCrit = sigmaCrit[radial_mask]
-    yt = yt[radial_mask]
-    r = r[radial_mask]
-    k = k[radial_mask]
-    zs = zs[radial_mask]
-    binned_dsig = stats.binned_statistic(r, yt*sigmaCrit, statistic='mean', bins=rbins)
-    binned_r = stats.binned_statistic(r, r, statistic='mean', bins=rbins)
-
-    rsamp = np.linspace(min(r), max(r), 1000)
-    dSigma_true = true_profile.delta_sigma(rsamp)
-
-    e = true_profile.sigma(r)
-    se = true_profile.delta_sigma(r)
-    kk = k * sigmaCrit
-    binned_kk = stats.binned_statistic(r, kk, statistic='mean', bins=rbins)
-    binned_yt = stats.binned_statistic(r, yt, statistic='mean', bins=rbins) 
+    with instrumentation.stage('binning'):
+        radial_mask = (r >= rmin)
+        sigmaCrit = sigmaCrit[radial_mask]
+        yt = yt[radial_mask]
+        r = r[radial_mask]
+        k = k[radial_mask]
+        zs = zs[radial_mask]
+        binned_dsig = stats.binned_statistic(r, yt*sigmaCrit, statistic='mean', bins=rbins)
+        binned_r = stats.binned_statistic(r, r, statistic='mean', bins=rbins)
+
+        rsamp = np.linspace(min(r), max(r), 1000)
+        dSigma_true = true_profile.delta_sigma(rsamp)
+
+        e = true_profile.sigma(r)
+        se = true_profile.delta_sigma(r)
+        kk = k * sigmaCrit
+        binned_kk = stats.binned_statistic(r, kk, statistic='mean', bins=rbins)
+        binned_yt = stats.binned_statistic(r, yt, statistic='mean', bins=rbins) 
 
     # fit the concentration and radius
     pprint('fitting with floating concentration')
     fitted_profile = NFW(0.75, 3.0, zl)
-    fit(lens, fitted_profile, rad_bounds = [0.1, 15], conc_bounds = [1, 10], 
-        bootstrap=True, bin_data=bin_data, bins=rbins)
+    # (the bootstraps are seeded, such that they are reproducible, and so can be cached)
+    config = {'r200_bounds':[0.1, 15], 'conc_bounds':[1, 10], 'rmin':rmin, 'bootstrap':True, 
+              'seed':0, 'bin_data':bin_data, 'bins':rbins}
+    start = time.perf_counter()
+    with instrumentation.stage('fit'):
+        [res, _] = fit(lens, fitted_profile, cache=cache, **config)
+    fit_time = time.perf_counter() - start
     #[dSigma_fitted, dSigma_fitted_err] = fitted_profile.delta_sigma(rsamp, bootstrap=True)
     dSigma_fitted = fitted_profile.delta_sigma(rsamp, bootstrap=False)
     dSigma_fitted_err = np.zeros(len(dSigma_fitted))
@@ -267,19 +495,24 @@ def _fit_test_data(lens, true_profile, makeplot=True, showfig=False, out_dir='.'
     # and now do it again, iteratively using a c-M relation instead of fitting for c
     pprint('fitting with inferred c-M concentration')
     fitted_cm_profile = NFW(0.75, 3.0, zl)
-    fit(lens, fitted_cm_profile, rad_bounds = [0.1, 15], cM_relation='child2018', 
-        bootstrap=True, bin_data=bin_data, bins=rbins)
+    config_cm = {'r200_bounds':[0.1, 15], 'cM_relation':'child2018', 'rmin':rmin, 'bootstrap':True, 
+                 'seed':0, 'bin_data':bin_data, 'bins':rbins}
+    start = time.perf_counter()
+    with instrumentation.stage('fit_cM'):
+        [res_cm, _] = fit(lens, fitted_cm_profile, cache=cache, **config_cm)
+    fit_time_cm = time.perf_counter() - start
     #[dSigma_fitted_cm, dSigma_fitted_cm_err] = fitted_cm_profile.delta_sigma(rsamp, bootstrap=True)
-    dSigma_fitted_cm = fitted_profile.delta_sigma(rsamp, bootstrap=False)
+    dSigma_fitted_cm = fitted_cm_profile.delta_sigma(rsamp, bootstrap=False)
     dSigma_fitted_cm_err = np.zeros(len(dSigma_fitted_cm))
     
     # write out fitting result
+    rows = [_result_row(halo, config, true_profile, fitted_profile, res, fit_time=fit_time), 
+            _result_row(halo, config_cm, true_profile, fitted_cm_profile, res_cm, fit_time=fit_time_cm)]
     pprint('r200c_fit = {}; c_fit = {}'.format(fitted_profile.r200c, fitted_profile.c))
     pprint('r200c_cm = {}; c_cm = {}'.format(fitted_cm_profile.r200c, fitted_cm_profile.c))
-    np.save('{}/r200c_fit_{}bins_{}rmin.npy'.format(out_dir, rbins, rmin), fitted_profile.r200c)
-    np.save('{}/r200c_cM_fit_{}bins_{}rmin.npy'.format(out_dir, rbins, rmin), fitted_cm_profile.r200c)
-    np.save('{}/c_fit_{}bins_{}rmin.npy'.format(out_dir, rbins, rmin), fitted_profile.c)
-    np.save('{}/c_cM_fit_{}bins_{}rmin.npy'.format(out_dir, rbins, rmin), fitted_cm_profile.c)
+    with instrumentation.stage('write'):
+        if(store is not None): store.append(rows)
+        else: _write_rows(rows, '{}/fits_{}bins_{}rmin.csv'.format(out_dir, rbins, rmin))
 
     # all done if not plotting
     #RRR if(not makeplot): return
@@ -289,78 +522,81 @@ def _fit_test_data(lens, true_profile, makeplot=True, showfig=False, out_dir='.'
     gridscan_profile = NFW(0.75, 3.0, zl)
     grid_r_bounds = [0.1, 4]
     grid_c_bounds = [1, 10]
-    [grid_pos, grid_res] = fit_gs(lens, gridscan_profile, rad_bounds = grid_r_bounds, conc_bounds = grid_c_bounds, 
-                                  n=200, bin_data=bin_data, bins=rbins)
+    with instrumentation.stage('gridscan'):
+        [grid_pos, grid_res] = fit_gs(lens, gridscan_profile, r200_bounds = grid_r_bounds, 
+                                      conc_bounds = grid_c_bounds, n=200, bin_data=bin_data, bins=rbins)
     
     # visualize results... 
-    rc('text', usetex=True)
-    color = plt.cm.plasma(np.linspace(0.2, 0.8, 3))
-    mpl.rcParams['axes.prop_cycle'] = cycler.cycler('color', color)
-
-    # plot sources vs truth and both fits
-    f = plt.figure(figsize=(12,6))
-    ax = f.add_subplot(121)
+    with instrumentation.stage('plot'):
+        rc('text', usetex=True)
+        color = plt.cm.plasma(np.linspace(0.2, 0.8, 3))
+        mpl.rcParams['axes.prop_cycle'] = cycler.cycler('color', color)
+
+        # plot sources vs truth and both fits
+        f = plt.figure(figsize=(12,6))
+        ax = f.add_subplot(121)
     
-    if(not bin_data):
-        ax.plot(r, yt*sigmaCrit, 'xk', 
-                label=r'$\gamma_{T,\mathrm{NFW}} \Sigma_c\>\>+\>\>\mathrm{Gaussian\>noise}$', alpha=0.33)
-    else:
-        ax.plot(binned_r[0], binned_dsig[0], '-xk', 
-                label=r'$\gamma_{T,\mathrm{NFW}} \Sigma_c\>\>+\>\>\mathrm{Gaussian\>noise}$')
-    ax.plot(rsamp, dSigma_true, '--', label=r'$\Delta\Sigma_\mathrm{{NFW}},\>\>r_{{200c}}={:.3f}; c={:.3f}$'\
-                                            .format(r200c, c), color=color[0], lw=2)
-    ax.plot(rsamp, dSigma_fitted, label=r'$\Delta\Sigma_\mathrm{{fit}},\>\>r_{{200c}}={:.3f}; c={:.3f}$'\
-                                        .format(fitted_profile.r200c, fitted_profile.c), color=color[1], lw=2)
-    ax.plot(rsamp, dSigma_fitted_cm, label=r'$\Delta\Sigma_{{\mathrm{{fit}},c-M}},\>\>r_{{200c}}={:.3f}; c={:.3f}$'\
-                                           .format(fitted_cm_profile.r200c, fitted_cm_profile.c), 
-                                           color=color[2], lw=2)
-    ax.fill_between(rsamp, dSigma_fitted - dSigma_fitted_err.T[0], 
-                           dSigma_fitted + dSigma_fitted_err.T[1], 
-                           color=color[1], alpha=0.2, lw=0)
-    ax.fill_between(rsamp, dSigma_fitted_cm - dSigma_fitted_cm_err.T[0], 
-                           dSigma_fitted_cm + dSigma_fitted_cm_err.T[1], 
-                           color=color[2], alpha=0.33, lw=0)
-
-    # format
-    ax.legend(fontsize=14, loc='upper right')
-    ax.set_xlabel(r'$r\>\>\lbrack\mathrm{Mpc}\rbrack$', fontsize=14)
-    ax.set_ylabel(r'$\Delta\Sigma\>\>\lbrack\mathrm{M}_\odot\mathrm{pc}^{-2}\rbrack$', fontsize=14)
-
-
-    # plot fit cost in the radius-concentration plane
-    ax2 = f.add_subplot(122)
-    chi2 = ax2.pcolormesh(grid_pos[0], grid_pos[1], (1/grid_res)/(np.max(1/grid_res)), cmap='plasma')
-    ax2.plot([r200c], [c], 'xk', ms=10, label=r'$\mathrm{{truth}}$')
-    ax2.errorbar(fitted_profile.r200c, fitted_profile.c, 
-                 xerr=fitted_profile.r200c_err, yerr=fitted_profile.c_err, 
-                 ms=10, marker='.', c=color[1], label=r'$\mathrm{{fit}}$')
-    ax2.errorbar(fitted_cm_profile.r200c, fitted_cm_profile.c, 
-                 xerr=fitted_cm_profile.r200c_err, yerr=fitted_cm_profile.c_err, 
-                 ms=10, marker='.', c=color[2], label=r'${\mathrm{{fit\>w/}c\mathrm{-}M}}$')
-
-    # include c-M relation curve
-    tmp_profile = NFW(1,1,zl)
-    tmp_m200c = np.zeros(len(grid_pos[0][0]))
-    for i in range(len(tmp_m200c)):
-        tmp_profile.r200c = grid_pos[0][0][i]
-        tmp_m200c[i] = tmp_profile.radius_to_mass()
-    tmp_c, tmp_dc = cm(tmp_m200c, zl, tmp_profile._cosmo)
-    ax2.plot(grid_pos[0][0], tmp_c, '--k', lw=2, label=r'$c\mathrm{-}M\mathrm{\>relation\>(Child+2018)}$')
-    ax2.fill_between(grid_pos[0][0], tmp_c - tmp_dc, tmp_c + tmp_dc, color='k', alpha=0.1, lw=0)
-
-    # format
-    ax2.set_xlim(grid_r_bounds)
-    ax2.set_ylim(grid_c_bounds)
-    ax2.legend(fontsize=14, loc='upper right')
-    cbar = f.colorbar(chi2, ax=ax2)
-    cbar.set_label(r'$\left[(\chi^2/\mathrm{min}(\chi^2))\right]^{-1}$', fontsize=14)
-    ax2.set_xlabel(r'$r_{200c}\>\>\left[\mathrm{Mpc}\right]$', fontsize=14)
-    ax2.set_ylabel(r'$c_{200c}$', fontsize=14)
-
-    plt.tight_layout()
-    plt.show()
-    #RRR if(showfig): plt.show()
-    #RRR else: f.savefig('{}/{}_shearprof_fit_{}bins_{}rmin.png'.format(out_dir, zl, rbins, rmin), dpi=200)
+        if(not bin_data):
+            ax.plot(r, yt*sigmaCrit, 'xk', 
+                    label=r'$\gamma_{T,\mathrm{NFW}} \Sigma_c\>\>+\>\>\mathrm{Gaussian\>noise}$', alpha=0.33)
+        else:
+            ax.plot(binned_r[0], binned_dsig[0], '-xk', 
+                    label=r'$\gamma_{T,\mathrm{NFW}} \Sigma_c\>\>+\>\>\mathrm{Gaussian\>noise}$')
+        ax.plot(rsamp, dSigma_true, '--', label=r'$\Delta\Sigma_\mathrm{{NFW}},\>\>r_{{200c}}={:.3f}; c={:.3f}$'\
+                                                .format(r200c, c), color=color[0], lw=2)
+        ax.plot(rsamp, dSigma_fitted, label=r'$\Delta\Sigma_\mathrm{{fit}},\>\>r_{{200c}}={:.3f}; c={:.3f}$'\
+                                            .format(fitted_profile.r200c, fitted_profile.c), color=color[1], lw=2)
+        ax.plot(rsamp, dSigma_fitted_cm, label=r'$\Delta\Sigma_{{\mathrm{{fit}},c-M}},\>\>r_{{200c}}={:.3f}; c={:.3f}$'\
+                                               .format(fitted_cm_profile.r200c, fitted_cm_profile.c), 
+                                               color=color[2], lw=2)
+        ax.fill_between(rsamp, dSigma_fitted - dSigma_fitted_err.T[0], 
+                               dSigma_fitted + dSigma_fitted_err.T[1], 
+                               color=color[1], alpha=0.2, lw=0)
+        ax.fill_between(rsamp, dSigma_fitted_cm - dSigma_fitted_cm_err.T[0], 
+                               dSigma_fitted_cm + dSigma_fitted_cm_err.T[1], 
+                               color=color[2], alpha=0.33, lw=0)
+
+        # format
+        ax.legend(fontsize=14, loc='upper right')
+        ax.set_xlabel(r'$r\>\>\lbrack\mathrm{Mpc}\rbrack$', fontsize=14)
+        ax.set_ylabel(r'$\Delta\Sigma\>\>\lbrack\mathrm{M}_\odot\mathrm{pc}^{-2}\rbrack$', fontsize=14)
+
+
+        # plot fit cost in the radius-concentration plane
+        ax2 = f.add_subplot(122)
+        chi2 = ax2.pcolormesh(grid_pos[0], grid_pos[1], (1/grid_res)/(np.max(1/grid_res)), cmap='plasma')
+        ax2.plot([r200c], [c], 'xk', ms=10, label=r'$\mathrm{{truth}}$')
+        ax2.errorbar(fitted_profile.r200c, fitted_profile.c, 
+                     xerr=fitted_profile.r200c_err, yerr=fitted_profile.c_err, 
+                     ms=10, marker='.', c=color[1], label=r'$\mathrm{{fit}}$')
+        ax2.errorbar(fitted_cm_profile.r200c, fitted_cm_profile.c, 
+                     xerr=fitted_cm_profile.r200c_err, yerr=fitted_cm_profile.c_err, 
+                     ms=10, marker='.', c=color[2], label=r'${\mathrm{{fit\>w/}c\mathrm{-}M}}$')
+
+        # include c-M relation curve
+        tmp_profile = NFW(1,1,zl)
+        tmp_m200c = tmp_profile.radius_to_mass(grid_pos[0][0])
+        tmp_c, tmp_dc = cm(tmp_m200c, zl, tmp_profile._cosmo)
+        if(instrumentation.enabled): instrumentation.count('child2018')
+        ax2.plot(grid_pos[0][0], tmp_c, '--k', lw=2, label=r'$c\mathrm{-}M\mathrm{\>relation\>(Child+2018)}$')
+        ax2.fill_between(grid_pos[0][0], tmp_c - tmp_dc, tmp_c + tmp_dc, color='k', alpha=0.1, lw=0)
+
+        # format
+        ax2.set_xlim(grid_r_bounds)
+        ax2.set_ylim(grid_c_bounds)
+        ax2.legend(fontsize=14, loc='upper right')
+        cbar = f.colorbar(chi2, ax=ax2)
+        cbar.set_label(r'$\left[(\chi^2/\mathrm{min}(\chi^2))\right]^{-1}$', fontsize=14)
+        ax2.set_xlabel(r'$r_{200c}\>\>\left[\mathrm{Mpc}\right]$', fontsize=14)
+        ax2.set_ylabel(r'$c_{200c}$', fontsize=14)
+
+        plt.tight_layout()
+        plt.show()
+        #RRR if(showfig): plt.show()
+        #RRR else: f.savefig('{}/{}_shearprof_fit_{}bins_{}rmin.png'.format(out_dir, zl, rbins, rmin), dpi=200)
+
+    return rows
+
 
 if(__name__ == "__main__"): 
     mock_example_run()
@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import pickle
+import hashlib
+import numpy as np
+
+class fit_cache:
+    """
+    This class constructs an object representing an on-disk, content-addressed cache of fit results.
+    Each result is stored under a key which is a hash of the input source data, the fit configuration,
+    and the version of the fitting code, such that a cached result is only reused if none of these
+    has changed. Changing one option of a fitting campaign then only recomputes the fits that the
+    option actually affects.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The directory in which to store the cached results. Created if it does not exist.
+    refresh : boolean, optional
+        If `True`, never read results from the cache, but still write new results to it (i.e. force
+        all fits to be redone, and the cache to be updated). Defaults to `False`.
+
+    Attributes
+    ----------
+    cache_dir : string
+        The directory in which the cached results are stored.
+    refresh : boolean
+        Whether or not reading from the cache is disabled.
+    hits : int
+        The number of results found in the cache by `load()`.
+    misses : int
+        The number of results not found in the cache by `load()`.
+
+    Methods
+    -------
+    key(data_key, config)
+        Returns the cache key for the given data hash and fit configuration.
+    load(key)
+        Returns the cached result for the given key, or `None`.
+    save(key, result)
+        Writes a result to the cache under the given key.
+    """
+
+    def __init__(self, cache_dir, refresh=False):
+        self.cache_dir = cache_dir
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(cache_dir): os.makedirs(cache_dir, exist_ok=True)
+
+
+    def key(self, data_key, config):
+        '''
+        Returns the cache key for a fit of the data identified by `data_key`, with the configuration
+        `config`, by the current version of the fitting code.
+
+        Parameters
+        ----------
+        data_key : string
+            A hash identifying the input source data, as given by `data_checksum()`, or a checksum
+            of the file from which the data was read.
+        config : dict
+            The fit configuration. Must be serializable by `json`, after the conversion of any numpy
+            scalars and arrays to lists.
+
+        Returns
+        -------
+        key : string
+            The hexadecimal SHA-256 digest of the data hash, configuration, and code version.
+        '''
+        config = json.dumps(config, sort_keys=True, default=_json_default)
+        content = '\n'.join([data_key, config, code_version()])
+        return hashlib.sha256(content.encode()).hexdigest()
+
+
+    def _path(self, key):
+        return '{}/{}.pkl'.format(self.cache_dir, key)
+
+
+    def load(self, key):
+        '''
+        Returns the cached result for the given key.
+
+        Parameters
+        ----------
+        key : string
+            The cache key, as given by `key()`.
+
+        Returns
+        -------
+        result : object
+            The cached result, or `None` if there is no result for `key` in the cache (or if `refresh`
+            is `True`).
+        '''
+        path = self._path(key)
+        if(self.refresh or not os.path.exists(path)):
+            self.misses += 1
+            return None
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+        self.hits += 1
+        return result
+
+
+    def save(self, key, result):
+        '''
+        Writes a result to the cache under the given key. The result is first written to a temporary
+        file, which then replaces the target file, such that concurrent readers (e.g. other MPI ranks
+        sharing the cache directory) never see a partially written result.
+
+        Parameters
+        ----------
+        key : string
+            The cache key, as given by `key()`.
+        result : object
+            The result to cache. Must be picklable.
+        '''
+        path = self._path(key)
+        tmp_path = '{}.tmp{}'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f)
+        os.replace(tmp_path, path)
+
+
+def data_checksum(data):
+    '''
+    Returns a hash of the source data held by an `obs_lens_system` object; the lens redshift and
+    cosmology, and the source positions, redshifts, and tangential shears. Radial cuts are not
+    included, and should be given in the fit configuration.
+
+    Parameters
+    ----------
+    data : `obs_len_system` class instance
+        The lensing system whose source data to hash.
+
+    Returns
+    -------
+    checksum : string
+        The hexadecimal SHA-256 digest of the source data.
+    '''
+    data._check_sources()
+    h = hashlib.sha256()
+    h.update(repr((float(data.zl), getattr(data._cosmo, 'name', repr(data._cosmo)))).encode())
+    for v in [data._theta1, data._theta2, data._zs, data._yt]:
+        v = np.ascontiguousarray(v, dtype=float)
+        h.update(repr(v.shape).encode())
+        h.update(v.data)
+    return h.hexdigest()
+
+
+_code_version = None
+_versioned_modules = ['__init__.py', 'analytic_profiles.py', 'fit_profile.py', 'lensing_system.py', 
+                      'mass_concentration.py']
+def code_version():
+    '''
+    Returns a hash of the package version (that of the installed distribution, or else the one
+    declared in the `setup.py` of the source tree) and the source of the modules which determine a
+    fit result, such that cached results are invalidated by a new release, or by any change to the
+    fitting code (but not to drivers, plotting, or benchmarks). Computed once per process.
+
+    Returns
+    -------
+    version : string
+        The hexadecimal SHA-256 digest of the package source.
+    '''
+    global _code_version
+    if(_code_version is None):
+        h = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        h.update('{}\n'.format(_package_version(package_dir)).encode())
+        for module in _versioned_modules:
+            with open('{}/{}'.format(package_dir, module), 'rb') as f:
+                h.update(f.read())
+        _code_version = h.hexdigest()
+    return _code_version
+
+
+def _package_version(package_dir):
+    # the modules are usually run from the source tree (imported by name, rather than from the 
+    # installed package), in which case the distribution metadata may be missing, or stale
+    setup_file = '{}/../setup.py'.format(package_dir)
+    if(os.path.exists(setup_file)):
+        with open(setup_file) as f:
+            match = re.search(r'version\s*=\s*[\'"]([^\'"]+)[\'"]', f.read())
+        if(match is not None): return match.group(1)
+    try:
+        from importlib import metadata
+        return metadata.version('shearfit')
+    except Exception:
+        return ''
+
+
+def _json_default(obj):
+    # numpy scalars and arrays in the fit configuration
+    if(isinstance(obj, np.generic)): return obj.item()
+    if(isinstance(obj, np.ndarray)): return obj.tolist()
+    raise TypeError('{} is not serializable in a fit configuration'.format(type(obj)))
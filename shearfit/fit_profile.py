@@ -1,24 +1,38 @@
+import os
 import pdb
 import copy
+import json
+import warnings
+import multiprocessing
 import numpy as np
 from scipy import stats
+from scipy import sparse
 from scipy import optimize
+from scipy import interpolate
+from concurrent import futures
 import matplotlib.pyplot as plt
+from astropy.cosmology import WMAP7
 from analytic_profiles import NFW
 from mass_concentration import child2018
 from lensing_system import obs_lens_system
+from fit_cache import fit_cache, data_checksum
+from shared_arrays import shared_arrays
+import instrumentation
 cM_dict = {'child2018':child2018}
+_boot_state = None
 
 def fit_nfw_profile_lstq(data, profile, r200_bounds, conc_bounds = [0,10], rmin=0, rmax=None, cM_relation=None, 
                          bin_data = False, bins=None, bootstrap=False, bootN = 1000, bootF = 1.0, 
-                         replace=True, skipShear=False):
+                         boot_tol=None, boot_batch=100, replace=True, boot_engine='resample', warm_start=False, errors=None, 
+                         skipShear=False, executor=None, nworkers=None, seed=None, cache=None, 
+                         log_mass=False):
     """
     Fits an NFW-predicted :math:`\\Delta\\Sigma(r)` profile to a background shear dataset. To use
     this function, the user should first instantiate a `obs_lens_system` object, which will hold the
     observed data to fit to, and an `NFW` object, which will give the analytic form which should
     describe the data. The present function is then the mediator between these objects that will
-    facilitate the minimization routine. Parameter errors can be estaimted via a bootstrap routine
-    (turned off by default). Note: This function modifies the input `profile` object;  
+    facilitate the minimization routine. Parameter errors can be estaimted via a bootstrap routine, 
+    or from the Fisher matrix at the best fit (both turned off by default). Note: This function modifies the input `profile` object;  
     final fit parameters, and their errors, will be given in the `r200c`, `c`, `r200c_err`, and `c_err`
     attributes of `profile`.
 
@@ -58,19 +72,88 @@ def fit_nfw_profile_lstq(data, profile, r200_bounds, conc_bounds = [0,10], rmin=
     bins : int or float array, optional
         The `bins` argument to pass to `data.calc_delta_sigma_binned`, if `bin_data` ia set to `True`. 
         Defaults to `None`, though will crash if not provided while `bin_data` is `True`.
+    log_mass : boolean, optional
+        Whether or not to fit in the parameters :math:`(\\log_{10}M_{200c}, \\log_{10}c)` (or only 
+        :math:`\\log_{10}M_{200c}`, if using a c-M relation), rather than :math:`(r_{200c}, c)`. The 
+        problem is then better conditioned, since the profile depends on each parameter over a 
+        similar logarithmic scale, which reduces the number of iterations and the rate of fits which 
+        end on a bound, for low S/N data. The radius is recovered from the mass with a conversion 
+        factor computed once for the lens redshift. The bounds are still given in :math:`r_{200c}` 
+        and :math:`c`, and the results (including errors) are still returned in the `r200c`, `c`, 
+        `r200c_err` and `c_err` attributes of `profile`. Defaults to `False`.
     bootstrap : boolean, optional
         Whether or not to perform fitted parameter bootstrap error estaimtion. If False, and also using 
         a c-M relation rather than fitting the concentration, then the intrinsic scatter of the c-M relation 
         is still given as an error on the best-fit `c` value. Else, no errors are given for either parameter.
         Defaults to `False`.
     bootN : int, optional
-        The number of realizations from the input data given by `data` to include in the bootstrap. 
-        Defaults to `1000`.
+        The number of realizations from the input data given by `data` to include in the bootstrap 
+        (the maximum number, if `boot_tol` is given). Defaults to `1000`.
     bootF : float, optional
         The fraction of the initial dataset `data` to include in each bootstrap realization. 
         Defaults to `1.0`.
+    boot_tol : float, optional
+        If given, the bootstrap realizations are fit in batches of `boot_batch`, and the bootstrap 
+        stops once the Monte-Carlo relative error of the standard deviation of both parameters is 
+        below `boot_tol` (e.g. `0.05` for a 5% precision on the errors), or once `bootN` realizations
+        have been fit. The realizations used are the first of those drawn for `bootN`, such that 
+        the result is reproducible given `seed`. Defaults to `None`, in which case all `bootN` 
+        realizations are fit.
+    boot_batch : int, optional
+        The number of realizations per batch, if `boot_tol` is given. Defaults to `100`.
     replace : boolean, optional
         Whether or not to perform the bootstrap resamples with replacement. Defaults to `True`.
+    boot_engine : string, optional
+        How to construct the bootstrap realizations, if `bin_data` is `True`. Options are `'resample'`, 
+        which draws source indices and re-bins the resampled catalog for every realization, or 
+        `'weights'`, which assigns sources to bins once, draws all realizations as vectors of 
+        per-source counts, and computes the binned means of every realization with a single sparse 
+        matrix product, such that each realization's fit starts from the binned data only. Note that 
+        with `'weights'`, the bin edges are fixed by the full sample, rather than by the radial range 
+        of each realization. Defaults to `'resample'`.
+    warm_start : boolean or string, optional
+        How to initialize the fit of each bootstrap realization. If `False`, start from the initial 
+        parameters of `profile`, as for the full-sample fit. If `True`, start from the full-sample
+        best fit, with the variables scaled by the column norms of its Jacobian, and with the 
+        termination tolerances of the least squares routine loosened to `1e-6` (which is still far 
+        below the typical bootstrap spread). If `'previous'`, additionally start each realization 
+        from the solution and Jacobian scaling of the previous realization fit by the same worker; 
+        in this case, the result depends (slightly) on how realizations are divided among workers. 
+        Defaults to `False`.
+    errors : string, optional
+        An alternative to `bootstrap` for parameter error estimation. If `'fisher'`, then the 
+        covariance of the fit parameters is estimated from the Jacobian of the residuals at the best 
+        fit, at the cost of no additional fits. If `bin_data` is `True`, the variance of each bin is 
+        the squared standard error of its mean, and the covariance is propagated through the 
+        (unweighted) least squares estimator. Otherwise, the per-source variance is estimated from 
+        the residuals at the best fit. If using a c-M relation, the radius error is propagated to the
+        concentration, and the intrinsic c-M scatter is added. This is a local approximation, which 
+        is unreliable if the best fit lies on a bound. Cannot be used along with `bootstrap`.
+        Defaults to `None`.
+    executor : string or MPI communicator, optional
+        How to distribute the bootstrap realizations. Options are `None` (run serially), `'thread'`
+        (a thread pool), `'process'` (a process pool, where the source data is sent to each worker 
+        once at startup, rather than with every task; unless the workers are forked, the source data 
+        is placed in shared memory, which all workers read, rather than each receiving a copy), or 
+        an `mpi4py` communicator, in which case the realizations are divided among its ranks, and 
+        every rank of the communicator must call this function with the same arguments. Defaults 
+        to `None`.
+    nworkers : int, optional
+        The number of workers to use if `executor` is `'thread'` or `'process'`. Defaults to `None`,
+        in which case the number of CPUs on the machine is used.
+    seed : int, optional
+        The seed of the `numpy.random.SeedSequence` from which the random stream of each bootstrap
+        realization is spawned. Given a seed, the bootstrap result is reproducible, regardless of 
+        `executor` and `nworkers`. Defaults to `None`, in which case fresh entropy is drawn (and 
+        so a bootstrap fit is not cached).
+    cache : `fit_cache` class instance or string, optional
+        A cache of fit results, as provided by `fit_cache.py`, or the path to its directory. If given, 
+        the result is looked up under a hash of the source data of `data`, the fit configuration 
+        (including the initial parameters of `profile`), and the version of the fitting code, and the 
+        fit is only performed (and then cached) if no result is found. The executor is not part of the
+        configuration, so a cached bootstrap with `warm_start='previous'` is reused even if the work is
+        divided differently. A bootstrap fit without a `seed` is never cached, since its result is 
+        meant to differ between calls. Defaults to `None`, in which case no cache is used.
     skipShear : boolean, optional
         **DEPRECATED** 
         If this flag is set to `True`, then rather than scaling the shear magnitude by the critical surface, 
@@ -83,24 +166,57 @@ def fit_nfw_profile_lstq(data, profile, r200_bounds, conc_bounds = [0,10], rmin=
         Fields for the first element of the return list are defined as detailed in the return signature 
         of `scipy.optimize.least_squares`. See documentation here: 
         https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.least_squares.html
-        The second element is a list of the bootstrap errors, for the radius and concentration parameters.
+        If `bootstrap` is `True`, the additional field `boot_nfev` gives the mean number of residual 
+        evaluations per bootstrap fit (including those used for the finite-difference Jacobian), 
+        `boot_n` gives the number of realizations fit, and `boot_err_rel` gives the estimated 
+        Monte-Carlo relative error of the bootstrap standard deviation of each parameter.
+        If `errors` is `'fisher'`, the additional field `cov` gives the estimated covariance matrix of
+        the fit parameters (of the log parameters, if `log_mass` is `True`).
+        The second element is a list of the bootstrap (or Fisher) errors, for the radius and concentration 
+        parameters.
         Note that this return is redundant; this function updates the input `profile` object to contain 
         the best fit parameters, and their errors.
     """
     
     # set radial cuts, get the background data, and ΔΣ
     data.set_radial_cuts(rmin, rmax)
-    sources = data.get_background()
-    r_all = sources['r']
-    dSigma_data_all = data.calc_delta_sigma()
-    if(bin_data): 
-        if(bins is None): raise Exception('bin_data set to True but bins arg not provided')
-        binned_data = data.calc_delta_sigma_binned(nbins=bins)
-        r = binned_data['r_mean']
-        dSigma_data = binned_data['delta_sigma_mean']
-    else:
-        r = r_all
-        dSigma_data = dSigma_data_all
+    if(bootstrap and errors is not None): 
+        raise Exception('only one of bootstrap or errors can be used for error estimation')
+    
+    # return the cached result of this fit, if available (an unseeded bootstrap is not replayed)
+    if(bootstrap and seed is None): cache = None
+    if(cache is not None):
+        if(isinstance(cache, str)): cache = fit_cache(cache)
+        # (the concentration bounds are unused with a c-M relation)
+        config = {'fit':'nfw_lstq', 'r200_bounds':r200_bounds, 
+                  'conc_bounds':(conc_bounds if cM_relation is None else None), 
+                  'rmin':rmin, 'rmax':rmax, 'cM_relation':cM_relation, 'bin_data':bin_data, 
+                  'bins':bins, 'errors':errors, 'bootstrap':bootstrap, 'r200c_init':profile.r200c, 
+                  'c_init':profile.c, 'cosmo':getattr(profile._cosmo, 'name', repr(profile._cosmo))}
+        if(bootstrap):
+            config.update({'bootN':bootN, 'bootF':bootF, 'replace':replace, 'boot_engine':boot_engine, 
+                           'warm_start':warm_start, 'seed':seed, 'boot_tol':boot_tol, 
+                           'boot_batch':boot_batch})
+        if(log_mass): config['log_mass'] = True
+        cache_key = cache.key(data_checksum(data), config)
+        cached = cache.load(cache_key)
+        if(cached is not None):
+            for attr in ['r200c', 'c', 'r200c_err', 'c_err']: 
+                setattr(profile, attr, cached[attr])
+            return [cached['res'], cached['param_err']]
+    
+    with instrumentation.stage('lstq_data'):
+        sources = data.get_background()
+        r_all = sources['r']
+        dSigma_data_all = data.calc_delta_sigma()
+        if(bin_data): 
+            if(bins is None): raise Exception('bin_data set to True but bins arg not provided')
+            binned_data = data.calc_delta_sigma_binned(nbins=bins, return_std=(errors=='fisher'))
+            r = binned_data['r_mean']
+            dSigma_data = binned_data['delta_sigma_mean']
+        else:
+            r = r_all
+            dSigma_data = dSigma_data_all
     
     # get parameter guesses from initial NFW form
     rad_init = profile.r200c
@@ -116,9 +232,24 @@ def fit_nfw_profile_lstq(data, profile, r200_bounds, conc_bounds = [0,10], rmin=
         fit_params = [rad_init]
         bounds = ([r200_bounds[0], r200_bounds[1]])
     
-    res = optimize.least_squares(_nfw_fit_residual, fit_params, 
-                                 args=(profile, r, dSigma_data, cM_relation), 
-                                 bounds = bounds)
+    # if fitting in log-mass, transform the initial parameters and the bounds, using 
+    # M200c = mass_factor * r200c^3
+    if(log_mass):
+        mass_factor = profile.radius_to_mass(1.0)
+        fit_params = _to_log_params(fit_params, mass_factor)
+        bounds = (_to_log_params(np.atleast_1d(bounds[0]), mass_factor), 
+                  _to_log_params(np.atleast_1d(bounds[1]), mass_factor))
+    else:
+        mass_factor = None
+    
+    with instrumentation.stage('lstq_fit'):
+        res = optimize.least_squares(_nfw_fit_residual, fit_params, 
+                                     args=(profile, r, dSigma_data, cM_relation, mass_factor), 
+                                     bounds = bounds)
+    if(log_mass):
+        best_params = _from_log_params(res.x, mass_factor)
+        profile.r200c = best_params[0]
+        if(cM_relation is None): profile.c = best_params[1]
     
     # if inferring the concentration from a c-M relation, then the final minimization 
     # iteration updated the radius only; update c before return, and calculate the 
@@ -126,6 +257,7 @@ def fit_nfw_profile_lstq(data, profile, r200_bounds, conc_bounds = [0,10], rmin=
     if(cM_relation is not None):
         m200c = profile.radius_to_mass()
         c_final, c_err_final = cM_func(m200c, profile.zl, profile._cosmo)
+        if(instrumentation.enabled): instrumentation.count(cM_relation)
         profile.c = c_final
         profile.c_err = c_err_final
     else:
@@ -135,38 +267,32 @@ def fit_nfw_profile_lstq(data, profile, r200_bounds, conc_bounds = [0,10], rmin=
     # if bootstrap==True, then repeat the entire process above bootN times to estimate the
     # recovered parameter errors. Else, return zero error on the radius, and return the 
     # intrinsic c-M scatter on the concentration (zero if c is free)
-    # Because we are defining a unique mask on the population per-iteration of the bootstrap, 
-    # we have to bin here, rather than use the built-in binning functions offered by the 
-    # 'data' object
     if(bootstrap):
-        bootstrap_profile = copy.deepcopy(profile)
-        params_bootstrap = np.zeros((bootN, 2))
-        c_intr_scatter_bootstrap = np.zeros(bootN)
-
-        for n in range(bootN):
-            bootstrap_profile.r200c = rad_init
-            bootstrap_profile.c = conc_init
-            
-            boot_i = np.random.choice(np.arange(len(r_all)), int(len(r_all)*bootF), replace=replace)
-            if(bin_data == True):
-                r_i = r_all[boot_i]
-                dSigma_data_i = dSigma_data_all[boot_i]
-                [dSigma_data_i,_,_] = stats.binned_statistic(r_i, dSigma_data_i, statistic='mean', bins=bins)
-                [r_i,_,_] = stats.binned_statistic(r_i, r_i, statistic='mean', bins=bins)
-            else:
-                r_i = r[boot_i]
-                dSigma_data_i = dSigma_data[boot_i]
-
-            res_i = optimize.least_squares(_nfw_fit_residual, fit_params, 
-                                           args=(bootstrap_profile, r_i, dSigma_data_i, 
-                                           cM_relation), bounds = bounds)
-            if(cM_relation is not None):
-                m200c = bootstrap_profile.radius_to_mass()
-                params_bootstrap[n][0] = res_i.x[0]
-                params_bootstrap[n][1], c_intr_scatter_bootstrap[n] = cM_func(m200c, profile.zl, profile._cosmo)
-            else:
-                params_bootstrap[n] = res_i.x
-                c_intr_scatter_bootstrap[n] = 0
+        boot_state = {'profile':profile, 'rad_init':rad_init, 'conc_init':conc_init, 
+                      'fit_params':fit_params, 'bounds':bounds, 'cM_relation':cM_relation,
+                      'r':r, 'dSigma_data':dSigma_data, 'r_all':r_all, 'dSigma_data_all':dSigma_data_all, 
+                      'bin_data':bin_data, 'bins':bins, 'bootF':bootF, 'replace':replace, 
+                      'warm_start':warm_start, 'x_best':res.x, 'x_scale':_jac_scale(res.jac), 
+                      'mass_factor':mass_factor}
+        
+        # each realization draws from its own random stream, spawned from a single seed, so 
+        # that the result does not depend on how the realizations are divided among workers.
+        # If drawing realizations as weights, then they are instead all drawn up front from 
+        # one stream, and the workers receive the binned data of each realization
+        if(boot_engine == 'resample'):
+            boot_state['seeds'] = np.random.SeedSequence(seed).spawn(bootN)
+        elif(boot_engine == 'weights'):
+            if(not bin_data): raise Exception('boot_engine \'weights\' requires bin_data to be True')
+            boot_state['binned_realizations'] = _bootstrap_binned_weights(r_all, dSigma_data_all, bins, 
+                                                                          bootN, bootF, replace, seed)
+        else:
+            raise Exception('boot_engine {} not understood'.format(boot_engine))
+        with instrumentation.stage('lstq_bootstrap'):
+            [params_bootstrap, c_intr_scatter_bootstrap, nfev_bootstrap] = _run_bootstrap(boot_state, bootN, 
+                                                                          executor, nworkers, boot_tol, boot_batch)
+        res.boot_nfev = np.mean(nfev_bootstrap)
+        res.boot_n = len(params_bootstrap)
+        res.boot_err_rel = _std_rel_error(params_bootstrap)
         
         # estimate the parameter uncertainty as the spread of the bootstrap fit values, 
         # adding the intrinsic c-M scatter to the concentration error (zero if c is free)
@@ -177,13 +303,495 @@ def fit_nfw_profile_lstq(data, profile, r200_bounds, conc_bounds = [0,10], rmin=
         profile.r200c_err = param_err[0]
         profile.c_err = param_err[1]
     
+    elif(errors == 'fisher'):
+        if(np.any(res.active_mask != 0)):
+            warnings.warn('Warning: best fit lies on a parameter bound; Fisher errors will be unreliable')
+        if(bin_data): dSigma_var = binned_data['delta_sigma_se_mean']**2
+        else: dSigma_var = None
+        with instrumentation.stage('lstq_fisher'):
+            res.cov = _fisher_covariance(res, dSigma_var)
+        param_err = np.sqrt(np.diag(res.cov))
+        
+        # propagate the errors of the log parameters to r200c (which scales as M200c^(1/3)) and c
+        if(log_mass):
+            param_err = param_err * np.log(10) * np.array([profile.r200c/3, profile.c])[:len(param_err)]
+        
+        # propagate the radius error through the c-M relation, and add the intrinsic scatter
+        if(cM_relation is not None):
+            dc_dr = _cM_derivative(profile, cM_func)
+            param_err = np.array([param_err[0], np.abs(dc_dr)*param_err[0] + profile.c_err])
+        
+        profile.r200c_err = param_err[0]
+        profile.c_err = param_err[1]
+    
+    elif(errors is not None):
+        raise Exception('errors {} not understood'.format(errors))
+    
     else:
         param_err = [0,0]
 
+    if(cache is not None):
+        cache.save(cache_key, {'res':res, 'param_err':param_err, 'r200c':profile.r200c, 'c':profile.c, 
+                               'r200c_err':profile.r200c_err, 'c_err':profile.c_err})
     return [res, param_err]
 
+
+def _run_bootstrap(state, nboot, executor=None, nworkers=None, boot_tol=None, boot_batch=100):
+    """
+    Distributes bootstrap realizations across workers, and collects the fit results in order. 
+    This function is meant to be called from `fit_nfw_profile_lstq` only.
+
+    Parameters
+    ----------
+    state : dict
+        The data and fit configuration shared by all realizations, as built in `fit_nfw_profile_lstq`.
+    nboot : int
+        The number of bootstrap realizations (the maximum number, if `boot_tol` is given).
+    executor : string or MPI communicator, optional
+        See `fit_nfw_profile_lstq`. Defaults to `None`.
+    nworkers : int, optional
+        See `fit_nfw_profile_lstq`. Defaults to `None`.
+    boot_tol : float, optional
+        See `fit_nfw_profile_lstq`. Defaults to `None`, in which case all `nboot` realizations are fit.
+    boot_batch : int, optional
+        See `fit_nfw_profile_lstq`. Defaults to `100`.
+
+    Returns
+    -------
+    list of three arrays
+        The fit parameters of each realization, with shape `(n, 2)`, the intrinsic c-M scatter on 
+        the concentration of each realization (zero if c is free), and the number of residual 
+        evaluations used by each realization's fit, where `n` is the number of realizations fit.
+    """
+    
+    # realizations are fit in batches if stopping early, with the convergence of the 
+    # parameter spread checked after each batch
+    if(boot_tol is None): batches = [np.arange(nboot)]
+    else: batches = np.array_split(np.arange(nboot), np.ceil(nboot/boot_batch))
+    
+    pool = None
+    shared = None
+    mpi = hasattr(executor, 'allgather')
+    if(executor is not None and not mpi):
+        if(nworkers is None): nworkers = os.cpu_count()
+        if(executor == 'thread'):
+            pool = futures.ThreadPoolExecutor(nworkers)
+        elif(executor == 'process'):
+            context = multiprocessing.get_context()
+            [worker_state, shared] = _share_bootstrap_state(state, context.get_start_method())
+            pool = futures.ProcessPoolExecutor(nworkers, mp_context=context, 
+                                               initializer=_init_bootstrap_worker, 
+                                               initargs=(worker_state,))
+        else:
+            raise Exception('executor {} not understood'.format(executor))
+    
+    chunk_results = []
+    try:
+        for batch in batches:
+            if(executor is None):
+                chunk_results.append(_bootstrap_fit_chunk(batch, state))
+            
+            elif(mpi):
+                # MPI communicator; every rank holds the state already, so only results are communicated
+                rank, numranks = executor.Get_rank(), executor.Get_size()
+                chunks = np.array_split(batch, numranks)
+                this_rank_result = _bootstrap_fit_chunk(chunks[rank], state)
+                chunk_results.extend(executor.allgather(this_rank_result))
+            
+            else:
+                chunks = np.array_split(batch, min(len(batch), 4*nworkers))
+                if(executor == 'thread'):
+                    chunk_results.extend(pool.map(_bootstrap_fit_chunk, chunks, [state]*len(chunks)))
+                else:
+                    chunk_results.extend(pool.map(_bootstrap_fit_chunk, chunks))
+            
+            if(boot_tol is not None):
+                params_bootstrap = np.vstack([chunk[0] for chunk in chunk_results])
+                if(np.all(_std_rel_error(params_bootstrap) <= boot_tol)): break
+    finally:
+        if(pool is not None): pool.shutdown()
+        if(shared is not None): shared.unlink()
+
+    params_bootstrap = np.vstack([chunk[0] for chunk in chunk_results])
+    c_intr_scatter_bootstrap = np.hstack([chunk[1] for chunk in chunk_results])
+    nfev_bootstrap = np.hstack([chunk[2] for chunk in chunk_results])
+    return [params_bootstrap, c_intr_scatter_bootstrap, nfev_bootstrap]
+
+
+def _std_rel_error(samples):
+    """
+    Estimates the Monte-Carlo relative error of the standard deviation of each column of `samples`,
+    as :math:`\\sigma_{\\hat{\\sigma}}/\\hat{\\sigma} \\approx \\sqrt{(m_4/\\hat{\\sigma}^4 - 1)/4n}`, 
+    where :math:`m_4` is the fourth central moment, such that non-Gaussian tails of the bootstrap 
+    distribution are accounted for. 
+
+    Parameters
+    ----------
+    samples : 2d float array
+        The samples, with shape `(n, ndim)`.
+
+    Returns
+    -------
+    float array
+        The relative error of the standard deviation of each column. Columns with zero spread (e.g. 
+        a parameter fixed at a bound in every realization) are given zero error.
+    """
     
-def _nfw_fit_residual(fit_params, profile, r, dSigma_data, cM_relation):
+    n = len(samples)
+    if(n < 2): return np.full(samples.shape[1], np.inf)
+    dev = samples - np.mean(samples, axis=0)
+    var = np.mean(dev**2, axis=0)
+    m4 = np.mean(dev**4, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel_err = np.sqrt(np.maximum(m4/var**2 - 1, 0) / (4*n))
+    return np.where(var > 0, rel_err, 0)
+
+
+def _share_bootstrap_state(state, start_method):
+    """
+    Places the per-source arrays of the bootstrap state in shared memory, for the workers of a 
+    process pool. Forked workers already share the memory of the calling process (until written), 
+    but spawned workers would otherwise each receive, and hold, a pickled copy. This function is 
+    meant to be called from `_run_bootstrap` only.
+
+    Parameters
+    ----------
+    state : dict
+        The data and fit configuration shared by all realizations, as built in `fit_nfw_profile_lstq`.
+    start_method : string
+        The start method of the worker processes.
+
+    Returns
+    -------
+    list
+        The state to pass to the workers, with the per-source arrays replaced by the `shared_arrays` 
+        block holding them (under `'shared'`), and the block, which the caller should unlink once 
+        the workers are done. If the workers are forked, or the arrays do not fit in shared memory, 
+        the state is returned unchanged, along with `None`.
+    """
+    if(start_method == 'fork'): return [state, None]
+    keys = [key for key in ['r_all', 'dSigma_data_all', 'r', 'dSigma_data'] if key in state]
+    try:
+        shared = shared_arrays({key:state[key] for key in keys})
+    except MemoryError:
+        return [state, None]
+    worker_state = dict(state, shared=shared)
+    for key in keys: worker_state[key] = None
+    return [worker_state, shared]
+
+
+def _init_bootstrap_worker(state):
+    """
+    Sets the bootstrap state for a worker process, such that the source data is transferred to each 
+    worker only once (or, if the state holds a block of shared memory, attached to). This function 
+    is meant to be passed as the initializer of a process pool in `_run_bootstrap` only.
+
+    Parameters
+    ----------
+    state : dict
+        The data and fit configuration shared by all realizations, as built in `fit_nfw_profile_lstq`.
+    """
+    global _boot_state
+    if(state.get('shared') is not None): state = dict(state, **state['shared'].arrays)
+    _boot_state = state
+
+
+def _bootstrap_fit_chunk(realizations, state=None):
+    """
+    Performs the least squares fit for a set of bootstrap realizations of the source data. 
+    This function is meant to be called from `_run_bootstrap` only.
+
+    Parameters
+    ----------
+    realizations : int array
+        The indices of the bootstrap realizations to fit.
+    state : dict, optional
+        The data and fit configuration shared by all realizations, as built in `fit_nfw_profile_lstq`.
+        Defaults to `None`, in which case the state set by `_init_bootstrap_worker` is used.
+
+    Returns
+    -------
+    list of three arrays
+        The fit parameters of each realization, with shape `(len(realizations), 2)`, the intrinsic 
+        c-M scatter on the concentration of each realization (zero if c is free), and the number
+        of residual evaluations used by each realization's fit.
+    """
+    
+    if(state is None): state = _boot_state
+    r_all, dSigma_data_all = state['r_all'], state['dSigma_data_all']
+    r, dSigma_data = state['r'], state['dSigma_data']
+    bins = state['bins']
+    cM_relation = state['cM_relation']
+    
+    bootstrap_profile = copy.deepcopy(state['profile'])
+    params_bootstrap = np.zeros((len(realizations), 2))
+    c_intr_scatter_bootstrap = np.zeros(len(realizations))
+    nfev_bootstrap = np.zeros(len(realizations), dtype=int)
+    
+    # each realization is a small perturbation of the full sample, so if warm starting, begin 
+    # at the full-sample solution, and stop once well within the bootstrap spread
+    x0, lsq_kwargs = state['fit_params'], {}
+    if(state['warm_start']):
+        x0 = state['x_best']
+        lsq_kwargs = {'x_scale':state['x_scale'], 'xtol':1e-6, 'ftol':1e-6}
+
+    # Because we are defining a unique mask on the population per-iteration of the bootstrap, 
+    # we have to bin here, rather than use the built-in binning functions offered by the 
+    # 'data' object (unless the realizations were already binned by weight)
+    for n in range(len(realizations)):
+        bootstrap_profile.r200c = state['rad_init']
+        bootstrap_profile.c = state['conc_init']
+        
+        if('binned_realizations' in state):
+            r_i = state['binned_realizations'][0][realizations[n]]
+            dSigma_data_i = state['binned_realizations'][1][realizations[n]]
+        elif(state['bin_data'] == True):
+            rng = np.random.default_rng(state['seeds'][realizations[n]])
+            boot_i = rng.choice(len(r_all), int(len(r_all)*state['bootF']), replace=state['replace'])
+            r_i = r_all[boot_i]
+            dSigma_data_i = dSigma_data_all[boot_i]
+            [dSigma_data_i,_,_] = stats.binned_statistic(r_i, dSigma_data_i, statistic='mean', bins=bins)
+            [r_i,_,_] = stats.binned_statistic(r_i, r_i, statistic='mean', bins=bins)
+        else:
+            rng = np.random.default_rng(state['seeds'][realizations[n]])
+            boot_i = rng.choice(len(r), int(len(r)*state['bootF']), replace=state['replace'])
+            r_i = r[boot_i]
+            dSigma_data_i = dSigma_data[boot_i]
+
+        res_i = optimize.least_squares(_nfw_fit_residual, x0, 
+                                       args=(bootstrap_profile, r_i, dSigma_data_i, 
+                                       cM_relation, state['mass_factor']), bounds = state['bounds'], 
+                                       **lsq_kwargs)
+        nfev_bootstrap[n] = res_i.nfev + res_i.njev * len(res_i.x)
+        if(state['warm_start'] == 'previous'):
+            x0 = res_i.x
+            lsq_kwargs['x_scale'] = _jac_scale(res_i.jac)
+        x_i = res_i.x
+        if(state['mass_factor'] is not None): 
+            x_i = _from_log_params(x_i, state['mass_factor'])
+            bootstrap_profile.r200c = x_i[0]
+        if(cM_relation is not None):
+            cM_func = cM_dict[cM_relation]
+            m200c = bootstrap_profile.radius_to_mass()
+            params_bootstrap[n][0] = x_i[0]
+            params_bootstrap[n][1], c_intr_scatter_bootstrap[n] = cM_func(m200c, bootstrap_profile.zl, 
+                                                                          bootstrap_profile._cosmo)
+            if(instrumentation.enabled): instrumentation.count(cM_relation)
+        else:
+            params_bootstrap[n] = x_i
+            c_intr_scatter_bootstrap[n] = 0
+    
+    return [params_bootstrap, c_intr_scatter_bootstrap, nfev_bootstrap]
+
+
+def _fisher_covariance(res, dSigma_var=None):
+    """
+    Estimates the covariance of least squares fit parameters from the Jacobian of the residuals at 
+    the best fit. This function is meant to be called from `fit_nfw_profile_lstq` only.
+
+    Parameters
+    ----------
+    res : SciPy `OptimizeResult` object
+        The result of the least squares fit, as returned by `scipy.optimize.least_squares`.
+    dSigma_var : float array, optional
+        The variance of each data point. Since the fit is unweighted, the covariance is given by the
+        sandwich estimator :math:`(J^TJ)^{-1}J^TVJ(J^TJ)^{-1}`, with :math:`V` the diagonal matrix of 
+        these variances. Defaults to `None`, in which case all data points are assumed to have the same
+        variance, estimated from the residuals at the best fit, giving :math:`(J^TJ)^{-1}s^2`.
+
+    Returns
+    -------
+    cov : 2d float array
+        The covariance matrix of the fit parameters.
+    """
+    
+    # data points with undefined values or variances (e.g. empty bins) carry no information
+    jac = res.jac
+    valid = np.isfinite(res.fun)
+    if(dSigma_var is not None): valid = np.logical_and(valid, np.isfinite(dSigma_var))
+    jac = jac[valid]
+    
+    jtj_inv = np.linalg.pinv(jac.T @ jac)
+    if(dSigma_var is None):
+        dof = max(np.sum(valid) - jac.shape[1], 1)
+        s2 = np.sum(res.fun[valid]**2) / dof
+        cov = jtj_inv * s2
+    else:
+        cov = jtj_inv @ (jac.T * dSigma_var[valid]) @ jac @ jtj_inv
+    return cov
+
+
+def _cM_derivative(profile, cM_func, frac_step=1e-3):
+    """
+    Computes the derivative of the concentration with respect to :math:`r_{200c}` along a c-M 
+    relation, at the current radius of `profile`, by a central finite difference. This function is
+    meant to be called from `fit_nfw_profile_lstq` only.
+
+    Parameters
+    ----------
+    profile : `NFW` class instance
+        An instance of a `NFW` object as provided by `analytic_profiles.py`.
+    cM_func : function
+        The c-M relation, as given by an entry of `cM_dict`.
+    frac_step : float, optional
+        The finite difference step, as a fraction of :math:`r_{200c}`. Defaults to `1e-3`.
+
+    Returns
+    -------
+    float
+        The derivative :math:`dc/dr_{200c}`.
+    """
+    
+    # mass scales as the radius cubed
+    m200c = profile.radius_to_mass()
+    m_step = m200c * np.array([(1-frac_step)**3, (1+frac_step)**3])
+    c_step, _ = cM_func(m_step, profile.zl, profile._cosmo)
+    if(instrumentation.enabled): instrumentation.count(cM_func.__name__)
+    return (c_step[1] - c_step[0]) / (2 * frac_step * profile.r200c)
+
+
+def _jac_scale(jac):
+    """
+    Computes the characteristic scale of each fit parameter from a least squares Jacobian, as 
+    the inverse of the Jacobian column norms (this is what `scipy.optimize.least_squares` does 
+    internally with `x_scale='jac'`, but without waiting for the first Jacobian evaluation).
+
+    Parameters
+    ----------
+    jac : 2d float array
+        The Jacobian of the residuals with respect to the fit parameters.
+
+    Returns
+    -------
+    x_scale : float array
+        The scale of each fit parameter.
+    """
+    col_norms = np.linalg.norm(jac, axis=0)
+    col_norms[col_norms == 0] = 1
+    return 1/col_norms
+
+
+
+def _bootstrap_binned_weights(r_all, dSigma_data_all, bins, bootN, bootF, replace, seed=None, 
+                              max_block_size=2**22):
+    """
+    Draws bootstrap realizations of the binned source data, representing each realization as a 
+    vector of per-source counts rather than a resampled catalog. Sources are assigned to bins once, 
+    and the binned means of a block of realizations are computed with a single sparse matrix product.
+    This function is meant to be called from `fit_nfw_profile_lstq` only.
+
+    Parameters
+    ----------
+    r_all : float array
+        The halo-centric radial distances of all sources.
+    dSigma_data_all : float array
+        The :math:`\Delta\Sigma` values of all sources.
+    bins : int or float array
+        The number of radial bins, or the bin edges, as passed to `scipy.stats.binned_statistic`.
+    bootN : int
+        The number of realizations to draw.
+    bootF : float
+        The fraction of the sources to include in each realization.
+    replace : boolean
+        Whether or not to draw each realization with replacement.
+    seed : int, optional
+        The seed of the random stream from which all realizations are drawn. Defaults to `None`.
+    max_block_size : int, optional
+        The maximum number of per-source counts to hold in memory at once; realizations are drawn
+        in blocks of `max_block_size // len(r_all)`. Defaults to `2**22`.
+
+    Returns
+    -------
+    list of two 2d float arrays
+        The mean radius, and mean :math:`\Delta\Sigma`, of each bin, for each realization, each 
+        with shape `(bootN, nbins)`.
+    """
+    
+    # assign each source to a bin, and build the sparse (N, 3*nbins) matrix which maps 
+    # per-source counts to the per-bin counts, radius sums, and ΔΣ sums
+    N = len(r_all)
+    [_, bin_edges, bin_number] = stats.binned_statistic(r_all, r_all, statistic='count', bins=bins)
+    nbins = len(bin_edges) - 1
+    in_range = np.logical_and(bin_number >= 1, bin_number <= nbins)
+    src = np.arange(N)[in_range]
+    col = bin_number[in_range] - 1
+    ones = np.ones(len(src))
+    binning_matrix = sparse.csr_matrix(
+                     (np.hstack([ones, r_all[in_range], dSigma_data_all[in_range]]), 
+                     (np.hstack([src, src, src]), np.hstack([col, col+nbins, col+2*nbins]))), 
+                     shape=(N, 3*nbins))
+    
+    rng = np.random.default_rng(np.random.SeedSequence(seed))
+    m = int(N*bootF)
+    block_size = max(1, max_block_size // N)
+    r_boot = np.zeros((bootN, nbins))
+    dSigma_boot = np.zeros((bootN, nbins))
+    
+    for i0 in range(0, bootN, block_size):
+        nblock = min(block_size, bootN - i0)
+        if(replace):
+            counts = rng.multinomial(m, np.ones(N)/N, size=nblock)
+        else:
+            counts = rng.multivariate_hypergeometric(np.ones(N, dtype=np.int64), m, size=nblock, 
+                                                     method='count')
+        
+        # binned means; empty bins give NaN, as with scipy.stats.binned_statistic
+        binned_sums = np.asarray(counts @ binning_matrix)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r_boot[i0:i0+nblock] = binned_sums[:, nbins:2*nbins] / binned_sums[:, :nbins]
+            dSigma_boot[i0:i0+nblock] = binned_sums[:, 2*nbins:] / binned_sums[:, :nbins]
+        
+    return [r_boot, dSigma_boot]
+
+    
+def _to_log_params(fit_params, mass_factor):
+    """
+    Converts fit parameters :math:`[r_{200c}, c]` (or :math:`[r_{200c}]`) to 
+    :math:`[\\log_{10}M_{200c}, \\log_{10}c]` (or :math:`[\\log_{10}M_{200c}]`).
+
+    Parameters
+    ----------
+    fit_params : float list or array
+        The parameters to convert. Zero values map to `-inf` (e.g. for a lower bound).
+    mass_factor : float
+        The mass of a halo with :math:`r_{200c}` of :math:`1\\text{Mpc}` at the lens redshift, such 
+        that :math:`M_{200c}` is `mass_factor * r200c**3`.
+
+    Returns
+    -------
+    float array
+        The log parameters.
+    """
+    fit_params = np.asarray(fit_params, dtype=float)
+    with np.errstate(divide='ignore'):
+        log_params = np.log10(fit_params)
+    log_params[0] = np.log10(mass_factor) + 3*log_params[0]
+    return log_params
+
+
+def _from_log_params(log_params, mass_factor):
+    """
+    Converts fit parameters :math:`[\\log_{10}M_{200c}, \\log_{10}c]` (or :math:`[\\log_{10}M_{200c}]`)
+    to :math:`[r_{200c}, c]` (or :math:`[r_{200c}]`); the inverse of `_to_log_params`.
+
+    Parameters
+    ----------
+    log_params : float list or array
+        The log parameters to convert.
+    mass_factor : float
+        See `_to_log_params`.
+
+    Returns
+    -------
+    float list
+        The parameters, as python floats (as required by the `NFW` setters).
+    """
+    fit_params = [float((10**log_params[0] / mass_factor)**(1/3))]
+    if(len(log_params) > 1): fit_params.append(float(10**log_params[1]))
+    return fit_params
+
+
+def _nfw_fit_residual(fit_params, profile, r, dSigma_data, cM_relation, mass_factor=None):
     """
     Evaluate the residual of an NFW profile fit to data, given updated parameter values. 
     This function meant to be called iteratively from `fit_nfw_profile_lstq` only.
@@ -208,6 +816,9 @@ def _nfw_fit_residual(fit_params, profile, r, dSigma_data, cM_relation):
         minimization will proceed with respect to both :math:`r_200c` and :math:`c`. If provided
         as a `string`, then infer the concentration from the :math:`c-M` relation on each iteration of 
         the least squares routine. Options are `{'child2018'}`.
+    mass_factor : float, optional
+        If given, `fit_params` are the log parameters of `_to_log_params`, with this mass factor. 
+        Defaults to `None`, in which case `fit_params` are :math:`[r_{200c}, c]` (or :math:`[r_{200c}]`).
 
     Returns
     -------
@@ -216,6 +827,9 @@ def _nfw_fit_residual(fit_params, profile, r, dSigma_data, cM_relation):
         The residuals, in this case, are the difference `dSigma_data - dSigma_nfw`.
     """
    
+    if(mass_factor is not None):
+        fit_params = _from_log_params(fit_params, mass_factor)
+    
     # update the NFW profile object
     if(len(fit_params) > 1):
         # floating concentration
@@ -232,21 +846,28 @@ def _nfw_fit_residual(fit_params, profile, r, dSigma_data, cM_relation):
         m200c = profile.radius_to_mass()
         c_new, _ = cM_func(m200c, profile.zl, profile._cosmo)
         profile.c = c_new
+        if(instrumentation.enabled): instrumentation.count(cM_relation)
         
     # evaluate NFW form
     dSigma_nfw = profile.delta_sigma(r, bootstrap=False)
     
     # residuals
     residuals = dSigma_nfw - dSigma_data
+    if(instrumentation.enabled): instrumentation.count('nfw_fit_residual')
     return residuals 
 
 
 def fit_nfw_profile_gridscan(data, profile, r200_bounds, conc_bounds = [0,10], rmin = 0, rmax = None, 
-                             n = 100, bin_data=False, bins=None):
+                             n = 100, bin_data=False, bins=None, adaptive=False, n_coarse=9, 
+                             dchi2_refine=11.8, cM_relation=None, marginalize_scatter=False, n_scatter=9):
     """
     Performs an NFW parameter sweep on :math:`r_{200c}` and :math:`c_{200c}`, evaluating
     the squared sum of residuals against the input data for each sample point in the
-    parametre space.
+    parametre space. If `adaptive` is `True`, then rather than evaluating every point of the 
+    regular `n x n` grid, start from a coarse grid and recursively refine only those cells 
+    which lie near the :math:`\\chi^2` valley, interpolating the result back onto the regular grid.
+    If `cM_relation` is given, then instead scan :math:`r_{200c}` only, with the concentration 
+    given by the :math:`c-M` relation, evaluating the whole scan in one vectorized pass.
 
     Parameters
     ----------
@@ -279,12 +900,47 @@ def fit_nfw_profile_gridscan(data, profile, r200_bounds, conc_bounds = [0,10], r
     bins : int or float array, optional
         The `bins` argument to pass to `data.calc_delta_sigma_binned`, if `bin_data` ia set to `True`. 
         Defaults to `None`, though will crash if not provided while `bin_data` is `True`.
+    adaptive : boolean, optional
+        Whether or not to perform a coarse-to-fine scan. If `True`, the parameter space is first 
+        sampled on an `n_coarse x n_coarse` grid, and any cell which has a corner within `dchi2_refine`
+        of the running minimum (or which neighbors such a cell) is split into four, until the 
+        resolution of the regular `n x n` grid is reached. Defaults to `False`.
+    n_coarse : int, optional
+        The number of sample points in each dimension of the initial grid, if `adaptive` is `True`. 
+        Defaults to `9`.
+    dchi2_refine : float, optional
+        The :math:`\\Delta\\chi^2` above the running minimum within which cells are refined, if 
+        `adaptive` is `True`. Since the cost is an unweighted sum of squared residuals, this threshold 
+        is applied after normalizing the cost such that the reduced :math:`\\chi^2` of the running
+        minimum is unity. Defaults to `11.8` (the :math:`3\\sigma` contour for two parameters).
+    cM_relation : string, optional
+        The name of a :math:`c-M` relation along which to scan, in which case only `n` values of 
+        :math:`r_{200c}` are sampled, and `conc_bounds` and `adaptive` are ignored. Options are 
+        `{'child2018'}`. Defaults to `None`, in which case the full :math:`(r_{200c}, c)` grid is scanned.
+    marginalize_scatter : boolean, optional
+        If scanning along a :math:`c-M` relation, whether or not to marginalize the likelihood over 
+        the intrinsic scatter of the relation at each :math:`r_{200c}`, rather than fixing :math:`c` 
+        to the mean relation. The scatter is taken as Gaussian, truncated at :math:`c > 0`, and is 
+        integrated by Gauss-Hermite quadrature. Since the cost is an unweighted sum of squared 
+        residuals, the likelihood is normalized such that the reduced :math:`\\chi^2` of the best 
+        point on the mean relation is unity, and the marginal :math:`-2\\ln L` is then mapped back to 
+        cost units. Defaults to `False`.
+    n_scatter : int, optional
+        The number of quadrature nodes, if `marginalize_scatter` is `True`. Defaults to `9`.
 
     Return
     ------
     list of two 2d numpy arrays
         First element is a meshgrid giving the radius and concentration values of each sample 
         point used. Second element is the :math:`\\chi^2` at each one of those points.
+        If `adaptive` is `True`, then the :math:`\\chi^2` surface is interpolated from the sampled 
+        points, and a third element is appended to the return list; a 2d array of shape `(N, 3)` 
+        giving the radius, concentration, and :math:`\\chi^2` of each of the `N` points which were 
+        actually evaluated.
+        If `cM_relation` is given, then the return is instead a list of three 1d numpy arrays; the 
+        :math:`r_{200c}` samples, the profile :math:`\\chi^2` along the relation at each sample 
+        (marginalized over the scatter, if `marginalize_scatter` is `True`), and the mean 
+        concentration of the relation at each sample.
     """
 
     profile = copy.deepcopy(profile)
@@ -303,6 +959,11 @@ def fit_nfw_profile_gridscan(data, profile, r200_bounds, conc_bounds = [0,10], r
     else:
         r = sources['r']
         dSigma_data = data.calc_delta_sigma()
+    
+    if(cM_relation is not None):
+        return _gridscan_cM(profile, r, dSigma_data, rsamp, cM_relation, marginalize_scatter, n_scatter)
+    if(adaptive):
+        return _gridscan_adaptive(profile, r, dSigma_data, rsamp, csamp, n_coarse, dchi2_refine)
  
     cost = np.zeros((n, n))
     for i in range(n):
@@ -312,3 +973,723 @@ def fit_nfw_profile_gridscan(data, profile, r200_bounds, conc_bounds = [0,10], r
             cost[i][j] = np.sum(residuals**2) 
 
     return [np.meshgrid(rsamp, csamp), cost]
+
+
+def _gridscan_cM(profile, r, dSigma_data, rsamp, cM_relation, marginalize_scatter, n_scatter):
+    """
+    Performs a scan of :math:`r_{200c}` along a :math:`c-M` relation, with all masses, 
+    concentrations and profiles evaluated at once. This function is meant to be called from 
+    `fit_nfw_profile_gridscan` only.
+
+    Parameters
+    ----------
+    profile : `NFW` class instance
+        An instance of a `NFW` object, giving the lens redshift and cosmology.
+    r : float array
+        The radii of the data points.
+    dSigma_data : float array
+        The :math:`\\Delta\\Sigma` of the data points.
+    rsamp : float array
+        The :math:`r_{200c}` values at which to evaluate the cost.
+    cM_relation : string
+        The name of the :math:`c-M` relation.
+    marginalize_scatter : boolean
+        See `fit_nfw_profile_gridscan`.
+    n_scatter : int
+        See `fit_nfw_profile_gridscan`.
+
+    Returns
+    -------
+    list of three 1d numpy arrays
+        See `fit_nfw_profile_gridscan`.
+    """
+    
+    cM_func = cM_dict[cM_relation]
+    c, c_err = cM_func(profile.radius_to_mass(rsamp), profile.zl, profile._cosmo)
+    if(instrumentation.enabled): instrumentation.count(cM_relation)
+    c, c_err = np.asarray(c, dtype=float), np.asarray(c_err, dtype=float)
+    
+    dSigma_nfw = profile.delta_sigma_grid(r, rsamp, c)
+    cost = np.sum((dSigma_nfw - dSigma_data)**2, axis=-1)
+    if(not marginalize_scatter):
+        return [rsamp, cost, c]
+    
+    # likelihood normalization, such that the best point on the mean relation has reduced chi2 = 1
+    dof = max(len(r) - 1, 1)
+    sigma2 = np.min(cost) / dof
+    
+    # Gauss-Hermite nodes of the scatter at each radius, dropping unphysical concentrations 
+    # and renormalizing the weights of the remaining nodes
+    nodes, weights = np.polynomial.hermite.hermgauss(n_scatter)
+    c_nodes = c[:, np.newaxis] + np.sqrt(2) * c_err[:, np.newaxis] * nodes
+    valid = c_nodes > 0
+    weights = np.where(valid, weights, 0)
+    weights = weights / np.sum(weights, axis=1)[:, np.newaxis]
+    
+    dSigma_nfw = profile.delta_sigma_grid(r, np.broadcast_to(rsamp[:, np.newaxis], c_nodes.shape), 
+                                          np.where(valid, c_nodes, c[:, np.newaxis]))
+    chi2 = np.sum((dSigma_nfw - dSigma_data)**2, axis=-1) / sigma2
+    
+    # log-sum-exp over the nodes, relative to the best node at each radius
+    chi2_min = np.min(np.where(valid, chi2, np.inf), axis=1)
+    like = np.sum(weights * np.exp(-(chi2 - chi2_min[:, np.newaxis])/2), axis=1)
+    cost_marginal = sigma2 * (chi2_min - 2*np.log(like))
+    return [rsamp, cost_marginal, c]
+
+
+def _gridscan_adaptive(profile, r, dSigma_data, rsamp, csamp, n_coarse, dchi2_refine):
+    """
+    Performs a coarse-to-fine scan of the :math:`(r_{200c}, c)` parameter space. This function is 
+    meant to be called from `fit_nfw_profile_gridscan` only.
+
+    Parameters
+    ----------
+    profile : `NFW` class instance
+        An instance of a `NFW` object as provided by `analytic_profiles.py`, which will be 
+        modified as each sample point is evaluated.
+    r : float array
+        The halo-centric radial distances of the data to fit to.
+    dSigma_data : float array
+        The :math:`\\Delta\\Sigma` values of the data to fit to.
+    rsamp : float array
+        The radius values of the regular output grid.
+    csamp : float array
+        The concentration values of the regular output grid.
+    n_coarse : int
+        The number of sample points in each dimension of the initial grid.
+    dchi2_refine : float
+        The :math:`\\Delta\\chi^2` above the running minimum within which cells are refined.
+
+    Returns
+    -------
+    list
+        The meshgrid of the regular output grid, the :math:`\\chi^2` interpolated onto that grid, and
+        the `(N, 3)` array of evaluated sample points, as described in `fit_nfw_profile_gridscan`.
+    """
+    
+    # all sample points lie on a lattice with the resolution of the finest level; 
+    # index each point by its integer position on that lattice
+    n = len(rsamp)
+    depth = max(0, int(np.ceil(np.log2((n - 1) / (n_coarse - 1)))))
+    nfine = (n_coarse - 1) * 2**depth + 1
+    rfine = np.linspace(rsamp[0], rsamp[-1], nfine)
+    cfine = np.linspace(csamp[0], csamp[-1], nfine)
+    dof = max(len(r) - 2, 1)
+    
+    evaluated = {}
+    def evaluate(nodes):
+        for node in nodes:
+            if(node in evaluated): continue
+            grid_params = [rfine[node[0]], cfine[node[1]]]
+            residuals = _nfw_fit_residual(grid_params, profile, r, dSigma_data, cM_relation=None)
+            evaluated[node] = np.sum(residuals**2)
+
+    # evaluate the coarse grid; cells are indexed by their lower-left corner
+    step = 2**depth
+    cells = [(i, j) for i in range(0, nfine-1, step) for j in range(0, nfine-1, step)]
+    evaluate([(i, j) for i in range(0, nfine, step) for j in range(0, nfine, step)])
+
+    while(step > 1):
+        
+        # flag cells with any corner below the refinement threshold, as well as their neighbors,
+        # so that a narrow valley passing between sample points is not missed (points where the 
+        # profile is undefined, e.g. at c = 0, have a NaN cost, and are ignored by fmin)
+        cost_min = np.fmin.reduce(list(evaluated.values()))
+        threshold = cost_min * (1 + dchi2_refine / dof)
+        cell_set = set(cells)
+        flagged = set()
+        for (i, j) in cells:
+            corners = [(i, j), (i+step, j), (i, j+step), (i+step, j+step)]
+            if(np.fmin.reduce([evaluated[corner] for corner in corners]) <= threshold):
+                for di in [-step, 0, step]:
+                    for dj in [-step, 0, step]:
+                        if((i+di, j+dj) in cell_set): flagged.add((i+di, j+dj))
+        
+        # split flagged cells into four, and evaluate the new nodes
+        half = step // 2
+        cells = []
+        for (i, j) in flagged:
+            cells.extend([(i, j), (i+half, j), (i, j+half), (i+half, j+half)])
+            evaluate([(i+half, j), (i, j+half), (i+half, j+half), 
+                      (i+step, j+half), (i+half, j+step)])
+        step = half
+    
+    # interpolate the sampled points onto the regular grid
+    nodes = list(evaluated.keys())
+    samples = np.array([[rfine[node[0]], cfine[node[1]], evaluated[node]] for node in nodes])
+    grid = np.meshgrid(rsamp, csamp)
+    cost = interpolate.griddata(samples[:,:2], samples[:,2], (grid[0], grid[1]), method='linear')
+
+    return [grid, cost, samples]
+
+
+def fit_nfw_profile_gridscan_streaming(data, profile, r200_bounds, conc_bounds = [0,10], rmin = 0, 
+                                       rmax = None, n = 100, bin_data=False, bins=None, tile_size=None, 
+                                       dchi2_levels = [2.3, 6.17]):
+    """
+    Performs the same NFW parameter sweep as `fit_nfw_profile_gridscan`, but without ever 
+    materializing the full :math:`\\chi^2` grid. The grid is swept in tiles of concentration 
+    values, each of which is evaluated in a single vectorized call, and only running reductions 
+    are kept; the minimum and its location, the profile and marginalized likelihoods along each
+    axis, and the list of cells inside of each :math:`\\Delta\\chi^2` contour. Memory use is then
+    independent of the grid size (aside from the contour cell lists).
+
+    Parameters
+    ----------
+    data : `obs_len_system` class instance
+        An instance of a `obs_lens_system` object as provided by `lensing_system.py`. 
+        This is an object representing a lensing system, and contains data vectors 
+        describing properties of a cluster's background sources.
+    profile : `NFW` class instance
+        An instance of a `NFW` object as provided by `analytic_profiles.py`. This is
+        an object representing an analytic NFW profile, and computes the predicted 
+        projected surface density.
+    r200_bounds : 2-element list
+        The bounds (tophat prior) for the first fitting parameter, :math:`r_{200c}`.
+    conc_bounds : 2-element list, optional
+        The bounds (tophat prior) for the second fitting parameter, :math:`c`. Defaults to [0,10].
+    rmin : float, optional
+        The minimum radial distance of sources to include in the fit in Mpc. Defaults to 0.
+    rmax : float, optional
+        The maximum radial distance of sources to include in the fit in Mpc. Defaults to None, 
+        in which case rmax will automatically be set to the furthest radial source position. 
+    n : int
+        The number of sample points in each dimension of the parameter grid, which will be 
+        distributed linearly between the limits given by `r200_bounds` and `conc_bounds`.
+    bin_data : boolean, optional
+        Whether or not to average the shears given by the `data` object in radial bins. If True, fit 
+        to the resulting binned averages rather than the input data points. Defaults to `False`.
+    bins : int or float array, optional
+        The `bins` argument to pass to `data.calc_delta_sigma_binned`, if `bin_data` ia set to `True`. 
+        Defaults to `None`, though will crash if not provided while `bin_data` is `True`.
+    tile_size : int, optional
+        The number of concentration values (rows of the grid) to evaluate at once. Defaults to `None`,
+        in which case the tile size is chosen such that each tile holds roughly `4e6` model values.
+    dchi2_levels : float list, optional
+        The :math:`\\Delta\\chi^2` values above the minimum at which to report contours. Defaults to
+        `[2.3, 6.17]`, the :math:`1\\sigma` and :math:`2\\sigma` contours for two parameters.
+
+    Return
+    ------
+    dict
+        A dictionary with the following entries:
+        `'r200c'` and `'c'`; the 1d sample values along each axis.
+        `'cost_min'`; the minimum :math:`\\chi^2` over the grid.
+        `'argmin'`; the indices `[i, j]` of the minimum, where `i` indexes `'c'`, and `j` indexes `'r200c'`.
+        `'r200c_min'` and `'c_min'`; the parameter values at the minimum.
+        `'profile_r200c'` and `'profile_c'`; the minimum :math:`\\chi^2` along each axis, over the other.
+        `'marginal_r200c'` and `'marginal_c'`; the likelihood along each axis, summed over the other, 
+        and normalized to unit sum.
+        `'contours'`; a dictionary, keyed by the entries of `dchi2_levels`, each giving a `(K, 2)` 
+        integer array of the indices `[i, j]` of the `K` cells within that contour.
+        As in `fit_nfw_profile_gridscan`, the cost is an unweighted sum of squared residuals; the
+        :math:`\\Delta\\chi^2` contours and the likelihoods are computed after normalizing the cost 
+        such that the reduced :math:`\\chi^2` at the least squares best fit is unity.
+    """
+
+    rsamp = np.linspace(r200_bounds[0], r200_bounds[1], n)
+    csamp = np.linspace(conc_bounds[0], conc_bounds[1], n)
+    
+    # set radial cuts, get the background data, and ΔΣ
+    data.set_radial_cuts(rmin, rmax)
+    sources = data.get_background()
+    if(bin_data): 
+        if(bins is None): raise Exception('bin_data set to True but bins arg not provided')
+        binned_data = data.calc_delta_sigma_binned(nbins=bins)
+        r = binned_data['r_mean']
+        dSigma_data = binned_data['delta_sigma_mean']
+    else:
+        r = sources['r']
+        dSigma_data = data.calc_delta_sigma()
+    
+    # the cost normalization must be fixed before the sweep in order to accumulate likelihoods, 
+    # so get it from a least squares fit at the center of the grid
+    lstq_profile = copy.deepcopy(profile)
+    lstq_profile.r200c = float(np.mean(r200_bounds))
+    lstq_profile.c = float(np.mean(conc_bounds))
+    lstq_res = optimize.least_squares(_nfw_fit_residual, [lstq_profile.r200c, lstq_profile.c], 
+                                      args=(lstq_profile, r, dSigma_data, None), 
+                                      bounds=([r200_bounds[0], conc_bounds[0]], 
+                                              [r200_bounds[1], conc_bounds[1]]))
+    dof = max(len(r) - 2, 1)
+    var = 2 * lstq_res.cost / dof
+    
+    if(tile_size is None): tile_size = max(1, int(4e6 // (n * len(r))))
+    
+    # running reductions; the marginal likelihoods are accumulated as log-sum-exp's relative 
+    # to the running maximum log-likelihood lnL_max
+    cost_min = np.inf
+    argmin = [0, 0]
+    profile_r = np.full(n, np.inf)
+    profile_c = np.full(n, np.inf)
+    lnL_max = -np.inf
+    marginal_r = np.zeros(n)
+    marginal_c = np.zeros(n)
+    candidates = []
+    
+    for i0 in range(0, n, tile_size):
+        
+        # evaluate this tile of the grid in one pass, with shape (len(ctile), n)
+        ctile = csamp[i0:i0+tile_size]
+        grid_r, grid_c = np.meshgrid(rsamp, ctile)
+        dSigma_nfw = profile.delta_sigma_grid(r, grid_r, grid_c)
+        cost = np.sum((dSigma_nfw - dSigma_data)**2, axis=-1)
+        
+        # points where the profile is undefined (e.g. at c = 0) have a NaN cost, which would 
+        # propagate through every reduction below; treat them as excluded instead
+        cost[~np.isfinite(cost)] = np.inf
+        
+        # update minimum and profile likelihoods
+        k = np.argmin(cost)
+        if(cost.flat[k] < cost_min):
+            cost_min = cost.flat[k]
+            argmin = [int(i0 + k // n), int(k % n)]
+        profile_r = np.minimum(profile_r, np.min(cost, axis=0))
+        profile_c[i0:i0+len(ctile)] = np.min(cost, axis=1)
+
+        # update marginal likelihoods, rescaling previous tiles if the maximum has changed
+        lnL = -cost / (2 * var)
+        lnL_tile_max = np.max(lnL)
+        if(lnL_tile_max > lnL_max):
+            marginal_r *= np.exp(lnL_max - lnL_tile_max)
+            marginal_c *= np.exp(lnL_max - lnL_tile_max)
+            lnL_max = lnL_tile_max
+        L = np.exp(lnL - lnL_max) if np.isfinite(lnL_max) else np.zeros(lnL.shape)
+        marginal_r += np.sum(L, axis=0)
+        marginal_c[i0:i0+len(ctile)] = np.sum(L, axis=1)
+
+        # keep cells which might fall within the widest contour, discarding any 
+        # previous candidates which the updated minimum excludes
+        threshold = cost_min + var * max(dchi2_levels)
+        ii, jj = np.nonzero(cost <= threshold)
+        candidates.append(np.array([ii + i0, jj, cost[ii, jj]]).T)
+        candidates = [cand[cand[:,2] <= threshold] for cand in candidates]
+
+    candidates = np.vstack(candidates)
+    contours = {}
+    for level in dchi2_levels:
+        in_contour = candidates[:,2] <= cost_min + var * level
+        contours[level] = candidates[in_contour][:,:2].astype(int)
+    
+    return {'r200c':rsamp, 'c':csamp, 'cost_min':cost_min, 'argmin':argmin, 
+            'r200c_min':rsamp[argmin[1]], 'c_min':csamp[argmin[0]],
+            'profile_r200c':profile_r, 'profile_c':profile_c, 
+            'marginal_r200c':marginal_r/np.sum(marginal_r), 'marginal_c':marginal_c/np.sum(marginal_c), 
+            'contours':contours}
+
+
+def fit_nfw_profile_mcmc(data, profile, r200_bounds, conc_bounds = [0,10], rmin=0, rmax=None, 
+                         cM_relation=None, bin_data=False, bins=None, nwalkers=32, nsteps=2000, nburn=500, 
+                         stretch=2.0, seed=None, checkpoint=None, checkpoint_every=100):
+    """
+    Samples the posterior of the NFW parameters given a background shear dataset, with an 
+    affine-invariant ensemble sampler (the stretch move of Goodman & Weare 2010). The walkers are
+    updated in two halves, and the likelihood of every walker in a half is evaluated with a single 
+    vectorized NFW evaluation, such that the cost of each step does not scale with the number of 
+    walkers. The parameter bounds are used as uniform priors. Note: This function modifies the input
+    `profile` object; the posterior medians, and standard deviations, will be given in the `r200c`, 
+    `c`, `r200c_err`, and `c_err` attributes of `profile`.
+
+    Parameters
+    ----------
+    data : `obs_len_system` class instance
+        An instance of a `obs_lens_system` object as provided by `lensing_system.py`. 
+        This is an object representing a lensing system, and contains data vectors 
+        describing properties of a cluster's background sources.
+    profile : `NFW` class instance
+        An instance of a `NFW` object as provided by `analytic_profiles.py`. This is
+        an object representing an analytic NFW profile, and computes the predicted 
+        projected surface density. This object is modified by the present function.
+    r200_bounds : 2-element list
+        The bounds (tophat prior) for the first fitting parameter, :math:`r_{200c}`.
+    conc_bounds : 2-element list, optional
+        The bounds (tophat prior) for the second fitting parameter, :math:`c`. Defaults to `[0,10]`.
+    rmin : float, optional
+        The minimum radial distance of sources to include in the fit in Mpc. Defaults to 0.
+    rmax : float, optional
+        The maximum radial distance of sources to include in the fit in Mpc. Defaults to None, 
+        in which case rmax will automatically be set to the furthest radial source position. 
+    cM_relation : string, optional
+        The name of a :math:`c-M` relation to use in the fitting procedure. If `None`, then sample 
+        both :math:`r_200c` and :math:`c`. If provided as a `string`, then sample :math:`r_200c` only, 
+        inferring the concentration of every walker from the :math:`c-M` relation (in this case, the 
+        `conc_bounds` arg need not be passed). Options are `{'child2018'}`. Defaults to `None`.
+    bin_data : boolean, optional
+        Whether or not to average the shears given by the `data` object in radial bins. If True, fit 
+        to the resulting binned averages, with the variance of each given by the squared standard error
+        of its mean. Otherwise, fit to the input data points, with a single variance for all points 
+        estimated from the residuals of a least squares fit. Defaults to `False`.
+    bins : int or float array, optional
+        The `bins` argument to pass to `data.calc_delta_sigma_binned`, if `bin_data` ia set to `True`. 
+        Defaults to `None`, though will crash if not provided while `bin_data` is `True`.
+    nwalkers : int, optional
+        The number of walkers in the ensemble. Must be even. Defaults to `32`.
+    nsteps : int, optional
+        The number of steps to take with each walker. Defaults to `2000`.
+    nburn : int, optional
+        The number of initial steps to discard before computing the posterior summaries given in 
+        `profile`. Defaults to `500`.
+    stretch : float, optional
+        The scale parameter :math:`a` of the stretch move proposal. Defaults to `2.0`.
+    seed : int, optional
+        The seed of the sampler's random stream. Defaults to `None`.
+    checkpoint : string, optional
+        Path to a `.npz` file to which the chain is periodically written. If this file already exists,
+        the sampler resumes from the last step it contains, in which case the checkpoint must have been 
+        written with the same `nwalkers`, `cM_relation` (and so number of parameters), and bounds, and 
+        with no more than `nsteps` steps, else a `ValueError` is raised. Defaults to `None`, in which 
+        case the chain is not written.
+    checkpoint_every : int, optional
+        The number of steps between checkpoints. Defaults to `100`.
+
+    Returns
+    -------
+    dict
+        A dictionary with the following entries:
+        `'chain'`; the walker positions, with shape `(nsteps, nwalkers, ndim)`, where `ndim` is `2` if 
+        `cM_relation` is `None` (giving :math:`r_{200c}` and :math:`c`), and `1` otherwise.
+        `'lnprob'`; the log-posterior of each walker position, with shape `(nsteps, nwalkers)`.
+        `'acceptance_fraction'`; the fraction of accepted proposals, for each walker.
+    """
+
+    if(nwalkers % 2 != 0): raise Exception('nwalkers must be even')
+    
+    # set radial cuts, get the data and its variance
+    data.set_radial_cuts(rmin, rmax)
+    if(bin_data): 
+        if(bins is None): raise Exception('bin_data set to True but bins arg not provided')
+        binned_data = data.calc_delta_sigma_binned(nbins=bins, return_std=True)
+        r = binned_data['r_mean']
+        dSigma_data = binned_data['delta_sigma_mean']
+        dSigma_var = binned_data['delta_sigma_se_mean']**2
+        valid = np.logical_and(np.isfinite(dSigma_data), dSigma_var > 0)
+        r, dSigma_data, dSigma_var = r[valid], dSigma_data[valid], dSigma_var[valid]
+    else:
+        r = data.get_background()['r']
+        dSigma_data = data.calc_delta_sigma()
+    
+    # a least squares fit provides the starting point of the ensemble, and its Fisher errors the 
+    # initial spread (and in the unbinned case, the data variance)
+    lstq_profile = copy.deepcopy(profile)
+    [lstq_res, lstq_err] = fit_nfw_profile_lstq(data, lstq_profile, r200_bounds, conc_bounds, rmin, rmax,
+                                                cM_relation, bin_data=bin_data, bins=bins, errors='fisher')
+    if(not bin_data):
+        dSigma_var = np.full(len(r), np.sum(lstq_res.fun**2) / max(len(r) - len(lstq_res.x), 1))
+    
+    if(cM_relation is None):
+        cM_func = None
+        bounds = np.array([r200_bounds, conc_bounds], dtype=float)
+    else:
+        cM_func = cM_dict[cM_relation]
+        bounds = np.array([r200_bounds], dtype=float)
+    ndim = len(bounds)
+    lnprob_args = (profile, r, dSigma_data, dSigma_var, bounds, cM_func)
+    settings = {'nwalkers':nwalkers, 'ndim':ndim, 'cM_relation':cM_relation, 'bounds':bounds.tolist()}
+    
+    # initialize the sampler, or resume from a checkpoint
+    rng = np.random.default_rng(np.random.SeedSequence(seed))
+    chain = np.zeros((nsteps, nwalkers, ndim))
+    lnprob = np.zeros((nsteps, nwalkers))
+    naccept = np.zeros(nwalkers, dtype=int)
+    if(checkpoint is not None and os.path.exists(checkpoint)):
+        saved = np.load(checkpoint)
+        step0 = int(saved['step'])
+        _check_mcmc_checkpoint(checkpoint, saved, settings, nsteps)
+        chain[:step0] = saved['chain'][:step0]
+        lnprob[:step0] = saved['lnprob'][:step0]
+        naccept = saved['naccept']
+        rng.bit_generator.state = json.loads(str(saved['rng_state']))
+        walkers, walkers_lnprob = chain[step0-1].copy(), lnprob[step0-1].copy()
+    else:
+        step0 = 0
+        spread = 0.1 * np.abs(lstq_err[:ndim]) + 1e-3 * np.abs(lstq_res.x)
+        walkers = lstq_res.x + spread * rng.standard_normal((nwalkers, ndim))
+        walkers = np.clip(walkers, bounds[:,0] + 1e-9, bounds[:,1] - 1e-9)
+        walkers_lnprob = _nfw_log_posterior(walkers, *lnprob_args)
+    
+    halves = [np.arange(0, nwalkers//2), np.arange(nwalkers//2, nwalkers)]
+    for step in range(step0, nsteps):
+        
+        # stretch move; each walker in one half proposes a position along the line joining it 
+        # to a random walker of the complementary half
+        for k in range(2):
+            active, complement = halves[k], halves[1-k]
+            z = ((stretch - 1) * rng.random(len(active)) + 1)**2 / stretch
+            partners = walkers[rng.choice(complement, len(active))]
+            proposal = partners + z[:, np.newaxis] * (walkers[active] - partners)
+            proposal_lnprob = _nfw_log_posterior(proposal, *lnprob_args)
+            
+            ln_ratio = (ndim - 1) * np.log(z) + proposal_lnprob - walkers_lnprob[active]
+            accept = np.log(rng.random(len(active))) < ln_ratio
+            walkers[active[accept]] = proposal[accept]
+            walkers_lnprob[active[accept]] = proposal_lnprob[accept]
+            naccept[active[accept]] += 1
+        
+        chain[step] = walkers
+        lnprob[step] = walkers_lnprob
+        if(checkpoint is not None and ((step+1) % checkpoint_every == 0 or step+1 == nsteps)):
+            _write_mcmc_checkpoint(checkpoint, chain, lnprob, naccept, step+1, rng, settings)
+    
+    # summarize the posterior in the profile object
+    samples = chain[nburn:].reshape(-1, ndim)
+    profile.r200c = float(np.median(samples[:,0]))
+    profile.r200c_err = np.std(samples[:,0])
+    if(cM_relation is None):
+        profile.c = float(np.median(samples[:,1]))
+        profile.c_err = np.std(samples[:,1])
+    else:
+        c_samples, c_intr_scatter = cM_func(profile.radius_to_mass(samples[:,0]), profile.zl, profile._cosmo)
+        if(instrumentation.enabled): instrumentation.count(cM_relation)
+        profile.c = float(np.median(c_samples))
+        profile.c_err = np.std(c_samples) + np.mean(c_intr_scatter)
+    
+    return {'chain':chain, 'lnprob':lnprob, 'acceptance_fraction':naccept/nsteps}
+
+
+def _nfw_log_posterior(params, profile, r, dSigma_data, dSigma_var, bounds, cM_func):
+    """
+    Evaluates the log-posterior of NFW parameters for many walkers at once, assuming Gaussian 
+    data errors, and uniform priors within the parameter bounds. This function is meant to be called 
+    from `fit_nfw_profile_mcmc` only.
+
+    Parameters
+    ----------
+    params : 2d float array
+        The parameters of each walker, with shape `(nwalkers, ndim)`; either [r200c, c] per walker, 
+        or [r200c] if `cM_func` is given.
+    profile : `NFW` class instance
+        An instance of a `NFW` object as provided by `analytic_profiles.py`, giving the lens redshift 
+        and cosmology (its parameters are not used or modified).
+    r : float array
+        The halo-centric radial distances of the data to fit to.
+    dSigma_data : float array
+        The :math:`\\Delta\\Sigma` values of the data to fit to.
+    dSigma_var : float array
+        The variance of each data point.
+    bounds : 2d float array
+        The lower and upper bound of each parameter, with shape `(ndim, 2)`.
+    cM_func : function
+        The c-M relation, as given by an entry of `cM_dict`, or `None` if the concentration is free.
+
+    Returns
+    -------
+    lnprob : float array
+        The log-posterior of each walker (up to a constant), `-inf` outside of the bounds.
+    """
+    
+    lnprob = np.full(len(params), -np.inf)
+    in_bounds = np.all(np.logical_and(params > bounds[:,0], params < bounds[:,1]), axis=1)
+    if(not np.any(in_bounds)): return lnprob
+    
+    r200c = params[in_bounds, 0]
+    if(cM_func is None): 
+        c = params[in_bounds, 1]
+    else:
+        c, _ = cM_func(profile.radius_to_mass(r200c), profile.zl, profile._cosmo)
+        if(instrumentation.enabled): instrumentation.count(cM_func.__name__)
+    
+    dSigma_nfw = profile.delta_sigma_grid(r, r200c, c)
+    lnprob[in_bounds] = -0.5 * np.sum((dSigma_nfw - dSigma_data)**2 / dSigma_var, axis=-1)
+    return lnprob
+
+
+def _check_mcmc_checkpoint(checkpoint, saved, settings, nsteps):
+    """
+    Checks that a checkpoint of the ensemble sampler can be resumed with the current settings, 
+    raising a `ValueError` naming each mismatch if not. This function is meant to be called from 
+    `fit_nfw_profile_mcmc` only.
+
+    Parameters
+    ----------
+    checkpoint : string
+        Path to the `.npz` checkpoint file.
+    saved : `NpzFile`
+        The loaded checkpoint.
+    settings : dict
+        The settings of the current call, as written by `_write_mcmc_checkpoint`.
+    nsteps : int
+        The number of steps of the current call.
+    """
+    # checkpoints written without settings still give the walker and parameter counts
+    saved_settings = json.loads(str(saved['settings'])) if 'settings' in saved else \
+                     {'nwalkers':saved['chain'].shape[1], 'ndim':saved['chain'].shape[2]}
+    mismatches = ['{}={} (checkpoint has {})'.format(key, settings[key], saved_settings[key]) 
+                  for key in saved_settings if saved_settings[key] != settings[key]]
+    if(int(saved['step']) > nsteps):
+        mismatches.append('nsteps={} (checkpoint has {} steps)'.format(nsteps, int(saved['step'])))
+    if(len(mismatches) > 0):
+        raise ValueError('cannot resume from checkpoint {}; {}'.format(checkpoint, ', '.join(mismatches)))
+
+
+def _write_mcmc_checkpoint(checkpoint, chain, lnprob, naccept, step, rng, settings):
+    """
+    Writes the state of the ensemble sampler to disk, replacing any previous checkpoint atomically.
+    This function is meant to be called from `fit_nfw_profile_mcmc` only.
+
+    Parameters
+    ----------
+    checkpoint : string
+        Path to the `.npz` checkpoint file.
+    chain : 3d float array
+        The walker positions.
+    lnprob : 2d float array
+        The log-posterior of each walker position.
+    naccept : int array
+        The number of accepted proposals of each walker.
+    step : int
+        The number of steps taken.
+    rng : `numpy.random.Generator`
+        The sampler's random stream, whose state is saved such that a resumed chain is identical to
+        an uninterrupted one.
+    settings : dict
+        The walker count, parameter count, c-M relation, and bounds of the sampler, which a resumed
+        call must match.
+    """
+    tmp_file = '{}.tmp.npz'.format(checkpoint)
+    np.savez(tmp_file, chain=chain[:step], lnprob=lnprob[:step], naccept=naccept, step=step, 
+             rng_state=json.dumps(rng.bit_generator.state), settings=json.dumps(settings))
+    os.replace(tmp_file, checkpoint)
+
+
+def fit_nfw_profiles_batched(r, dSigma_data, zl, r200_bounds, conc_bounds = [0,10], r200c_init=0.75, 
+                             c_init=3.0, dSigma_var=None, max_iter=200, ftol=1e-8, xtol=1e-8, cosmo=WMAP7):
+    """
+    Fits NFW-predicted :math:`\\Delta\\Sigma(r)` profiles to a stack of binned shear profiles at once, 
+    for example those of many halos as given by `obs_lens_system.calc_delta_sigma_binned`. All of 
+    the independent two-parameter problems are solved together with vectorized Levenberg-Marquardt 
+    steps, with each halo's damping parameter adapted separately, and halos are dropped from the 
+    computation as they converge. Parameters on a bound are held fixed while the gradient points out
+    of the bounds, and steps are otherwise clipped to the bounds. This avoids
+    the per-problem overhead of calling `fit_nfw_profile_lstq` for each of many small profiles.
+
+    Parameters
+    ----------
+    r : 2d float array
+        The radii of the bins of each profile, in proper Mpc, with shape `(N, nbins)`. Bins with 
+        non-finite values (e.g. empty bins) are ignored.
+    dSigma_data : 2d float array
+        The binned :math:`\\Delta\\Sigma` of each profile, with shape `(N, nbins)`.
+    zl : float or float array
+        The lens redshift of each profile.
+    r200_bounds : 2-element list
+        The bounds (tophat prior) for the first fitting parameter, :math:`r_{200c}`.
+    conc_bounds : 2-element list, optional
+        The bounds (tophat prior) for the second fitting parameter, :math:`c`. Defaults to `[0,10]`.
+    r200c_init : float or float array, optional
+        The initial guess of :math:`r_{200c}` for each profile. Defaults to `0.75`.
+    c_init : float or float array, optional
+        The initial guess of :math:`c` for each profile. Defaults to `3.0`.
+    dSigma_var : 2d float array, optional
+        The variance of each bin of each profile, in which case the fit is weighted by the inverse 
+        variance. Defaults to `None`, in which case the fit is unweighted, as in `fit_nfw_profile_lstq`.
+    max_iter : int, optional
+        The maximum number of iterations. Defaults to `200`.
+    ftol : float, optional
+        Tolerance on the relative change of the cost for termination. Defaults to `1e-8`.
+    xtol : float, optional
+        Tolerance on the relative change of the parameters for termination. Defaults to `1e-8`.
+    cosmo : object, optional
+        An AstroPy `cosmology` object. Defaults to `WMAP7`.
+
+    Returns
+    -------
+    dict
+        A dictionary with the following entries, each an array of length `N`: 
+        `'r200c'` and `'c'`; the best fit parameters. 
+        `'r200c_err'` and `'c_err'`; the parameter errors from the Fisher matrix at the best fit (if 
+        `dSigma_var` is not given, the variance of each profile is estimated from its residuals).
+        `'cost'`; half of the (weighted) sum of squared residuals at the best fit.
+        `'niter'`; the number of iterations taken.
+        `'converged'`; whether or not the termination tolerances were reached within `max_iter`.
+        `'stalled'`; whether or not the fit stopped making progress before reaching them (its 
+        damping diverged, e.g. for a profile with no valid bins), in which case it is not converged.
+    """
+    
+    r = np.atleast_2d(r)
+    dSigma_data = np.atleast_2d(dSigma_data)
+    N = len(r)
+    zl = np.broadcast_to(zl, (N,)).astype(float)
+    lower = np.array([r200_bounds[0], conc_bounds[0]], dtype=float)
+    upper = np.array([r200_bounds[1], conc_bounds[1]], dtype=float)
+    
+    # residuals are weighted by the inverse error; bins with undefined values get zero weight
+    if(dSigma_var is None): weights = np.ones(r.shape)
+    else: weights = 1/np.sqrt(dSigma_var)
+    valid = np.isfinite(r) & np.isfinite(dSigma_data) & np.isfinite(weights)
+    weights = np.where(valid, weights, 0)
+    r = np.where(valid, r, 1)
+    dSigma_data = np.where(valid, dSigma_data, 0)
+    
+    model = NFW(1.0, 1.0, zl[0], cosmo=cosmo)
+    def residuals(params, idx):
+        dSigma_nfw = model.delta_sigma_grid(r[idx], params[:,0], params[:,1], zl=zl[idx])
+        return weights[idx] * (dSigma_nfw - dSigma_data[idx])
+    def jacobian(params, idx, f):
+        jac = np.zeros(f.shape + (2,))
+        for k in range(2):
+            h = 1e-7 * np.maximum(np.abs(params[:,k]), 1)
+            step = params.copy()
+            step[:,k] = np.where(step[:,k] + h <= upper[k], step[:,k] + h, step[:,k] - h)
+            jac[..., k] = (residuals(step, idx) - f) / (step[:,k] - params[:,k])[:, np.newaxis]
+        return jac
+    
+    params = np.zeros((N, 2))
+    params[:,0] = r200c_init
+    params[:,1] = c_init
+    params = np.clip(params, lower, upper)
+    f = residuals(params, np.arange(N))
+    cost = 0.5 * np.sum(f**2, axis=1)
+    damping = np.full(N, 1e-3)
+    niter = np.zeros(N, dtype=int)
+    converged = np.zeros(N, dtype=bool)
+    stalled = np.zeros(N, dtype=bool)
+    active = np.arange(N)
+    
+    for it in range(max_iter):
+        if(len(active) == 0): break
+        
+        # damped Gauss-Newton step for each active halo; parameters which sit on a bound, with 
+        # the gradient pointing outward, are held fixed for this step
+        p, f_act = params[active], f[active]
+        jac = jacobian(p, active, f_act)
+        jtj = np.einsum('nbi,nbj->nij', jac, jac)
+        jtf = np.einsum('nbi,nb->ni', jac, f_act)
+        free = ~(((p <= lower) & (jtf > 0)) | ((p >= upper) & (jtf < 0)))
+        damped = jtj + damping[active][:, np.newaxis, np.newaxis] * \
+                       (jtj * np.eye(2) + 1e-12 * np.eye(2))
+        damped = damped * (free[:, :, np.newaxis] & free[:, np.newaxis, :]) + \
+                 np.eye(2) * ~free[:, :, np.newaxis]
+        delta = -np.linalg.solve(damped, (jtf * free)[..., np.newaxis])[..., 0]
+        p_new = np.clip(p + delta, lower, upper)
+        f_new = residuals(p_new, active)
+        cost_new = 0.5 * np.sum(f_new**2, axis=1)
+        niter[active] += 1
+        
+        # accept steps which reduce the cost, and adapt the damping
+        accept = cost_new < cost[active]
+        cost_change = cost[active] - cost_new
+        step_size = np.linalg.norm(p_new - p, axis=1)
+        acc = active[accept]
+        params[acc], f[acc], cost[acc] = p_new[accept], f_new[accept], cost_new[accept]
+        damping[acc] = np.maximum(damping[acc] / 10, 1e-12)
+        damping[active[~accept]] *= 10
+        
+        # converged once an accepted step changes the cost or parameters negligibly; 
+        # halos whose damping diverges can not make further progress, and are dropped as stalled
+        done = accept & ((cost_change <= ftol * cost[active]) | 
+                         (step_size <= xtol * (xtol + np.linalg.norm(p, axis=1))))
+        converged[active[done]] = True
+        stuck = ~done & (damping[active] > 1e12)
+        stalled[active[stuck]] = True
+        active = active[~(done | stuck)]
+    
+    # Fisher errors at the best fit
+    jac = jacobian(params, np.arange(N), f)
+    cov = np.linalg.pinv(np.einsum('nbi,nbj->nij', jac, jac))
+    if(dSigma_var is None):
+        dof = np.maximum(np.sum(valid, axis=1) - 2, 1)
+        cov = cov * (2 * cost / dof)[:, np.newaxis, np.newaxis]
+    
+    return {'r200c':params[:,0], 'c':params[:,1], 
+            'r200c_err':np.sqrt(cov[:,0,0]), 'c_err':np.sqrt(cov[:,1,1]), 
+            'cost':cost, 'niter':niter, 'converged':converged, 'stalled':stalled}
@@ -0,0 +1,137 @@
+import sys
+import csv
+import numpy as np
+from results_store import read_results, _is_fill
+
+'''
+This module summarizes a catalog of fit results (e.g. the `fit_results.hdf5` written by the
+fitting driver) by the fractional bias of the fitted halo parameters with respect to their true
+values, for each fit configuration in the catalog. Usage is as follows:
+
+    import fit_summary
+    summary = fit_summary.summarize(read_results(catalog), by=['rmin', 'bins', 'cM_relation'])
+    fit_summary.write_summary(summary, summary_file)
+
+or, from the command line,
+
+    python fit_summary.py <catalog file> <summary csv file> [config column ...]
+'''
+
+params = ['r200c', 'c']
+
+def fractional_bias(catalog, param):
+    '''
+    Returns the fractional bias of a fitted parameter for each row of a catalog.
+
+    Parameters
+    ----------
+    catalog : dict
+        The catalog columns, as returned by `results_store.read_results()`, including the fitted
+        value of the parameter and its true value `'{param}_true'`.
+    param : string
+        The parameter; `'r200c'` or `'c'`.
+
+    Returns
+    -------
+    1d numpy array
+        The fractional bias `fit/true - 1` of each row.
+    '''
+    return catalog[param] / catalog['{}_true'.format(param)] - 1
+
+
+def summarize(catalog, by):
+    '''
+    Computes summary statistics of the fractional bias of the fitted parameters, over all halos
+    fit with each configuration. Only successful fits with finite results enter the statistics.
+
+    Parameters
+    ----------
+    catalog : dict
+        The catalog columns, as returned by `results_store.read_results()`.
+    by : list of strings
+        The columns identifying a fit configuration (e.g. the keys of the driver's `configs`).
+        Columns missing from the catalog are ignored.
+
+    Returns
+    -------
+    list of dicts
+        One row per configuration, in order of first appearance in the catalog, giving the
+        configuration columns, the number of fits `'nfits'` and of those used `'nused'`, and for
+        each parameter, the mean `'{param}_bias_mean'`, its standard error `'{param}_bias_sem'`,
+        the median `'{param}_bias_median'`, the standard deviation `'{param}_bias_std'`, and the
+        16th and 84th percentiles `'{param}_bias_p16'` and `'{param}_bias_p84'` of the fractional
+        bias.
+    '''
+    by = [name for name in by if name in catalog]
+    nrows = len(next(iter(catalog.values()))) if len(catalog) > 0 else 0
+    keys = [tuple([None if _is_fill(v) else v for v in values])
+            for values in zip(*[catalog[name].tolist() for name in by])] if len(by) > 0 \
+           else [()] * nrows
+    groups = {}
+    for j, key in enumerate(keys):
+        groups.setdefault(key, []).append(j)
+
+    bias = {param:fractional_bias(catalog, param) for param in params}
+    success = catalog['success'] if 'success' in catalog else np.ones(nrows, dtype=bool)
+    summary = []
+    for key, rows in groups.items():
+        rows = np.array(rows)
+        use = success[rows] & np.all([np.isfinite(bias[p][rows]) for p in params], axis=0)
+        row = dict(zip(by, key))
+        row.update({'nfits':len(rows), 'nused':int(np.sum(use))})
+        for param in params:
+            b = bias[param][rows][use]
+            empty = len(b) == 0
+            row.update({
+                '{}_bias_mean'.format(param):np.nan if empty else float(np.mean(b)),
+                '{}_bias_sem'.format(param):np.nan if len(b) < 2 else
+                                            float(np.std(b, ddof=1) / np.sqrt(len(b))),
+                '{}_bias_median'.format(param):np.nan if empty else float(np.median(b)),
+                '{}_bias_std'.format(param):np.nan if len(b) < 2 else float(np.std(b, ddof=1)),
+                '{}_bias_p16'.format(param):np.nan if empty else float(np.percentile(b, 16)),
+                '{}_bias_p84'.format(param):np.nan if empty else float(np.percentile(b, 84))})
+        summary.append(row)
+    return summary
+
+
+def write_summary(summary, out_file):
+    '''
+    Writes a summary given by `summarize()` to a CSV file.
+
+    Parameters
+    ----------
+    summary : list of dicts
+        The summary rows.
+    out_file : string
+        The output file path.
+    '''
+    fields = []
+    for row in summary:
+        fields.extend([k for k in row if k not in fields])
+    with open(out_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(summary)
+
+
+def print_summary(summary):
+    '''
+    Prints a summary given by `summarize()`, one line per configuration.
+
+    Parameters
+    ----------
+    summary : list of dicts
+        The summary rows.
+    '''
+    for row in summary:
+        config = {k:v for k, v in row.items() if k not in ['nfits', 'nused'] and '_bias_' not in k}
+        print('{} ({}/{} fits): {}'.format(config, row['nused'], row['nfits'], ', '.join(
+              ['{} bias {:+.3f} +/- {:.3f} (median {:+.3f})'.format(p, row['{}_bias_mean'.format(p)],
+               row['{}_bias_sem'.format(p)], row['{}_bias_median'.format(p)]) for p in params])))
+
+
+if __name__ == '__main__':
+    # usage: python fit_summary.py <catalog file> <summary csv file> [config column ...]
+    summary = summarize(read_results(sys.argv[1]), by=sys.argv[3:])
+    write_summary(summary, sys.argv[2])
+    print_summary(summary)
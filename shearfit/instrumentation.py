@@ -0,0 +1,204 @@
+import time
+import json
+import threading
+
+'''
+This module provides lightweight instrumentation of the fitting routines; counters of calls to
+functions on the hot path of a fit (e.g. `fit_profile._nfw_fit_residual`, or a c-M relation), and
+timers of the stages of a fit (e.g. reading, binning, the least squares fit, the bootstrap). It is
+disabled by default, in which case each instrumented call site costs a single attribute lookup.
+Usage is as follows:
+
+    import instrumentation
+    instrumentation.enable()
+    ... fit a halo ...
+    report = instrumentation.report()
+    instrumentation.reset()
+
+Counts made in the workers of a `'process'` bootstrap executor are not recorded, since the workers
+do not share the memory of the calling process. Work done by a thread on behalf of another halo 
+than the one being recorded (e.g. reading the next cutout in the background) should be run under 
+`paused()`, and its time added to that halo's report with `add_time()` once it is being fit.
+'''
+
+enabled = False
+_counters = {}
+_timers = {}
+_lock = threading.Lock()
+# the threads in which recording is paused (see paused)
+_local = threading.local()
+
+
+def enable():
+    '''
+    Turns on the recording of counters and timers.
+    '''
+    global enabled
+    enabled = True
+
+
+def disable():
+    '''
+    Turns off the recording of counters and timers. Values recorded so far are kept.
+    '''
+    global enabled
+    enabled = False
+
+
+def reset():
+    '''
+    Clears all recorded counters and timers (e.g. between the fits of two halos).
+    '''
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def count(name, n=1):
+    '''
+    Increments a counter. Call sites on the hot path should first check `enabled`.
+
+    Parameters
+    ----------
+    name : string
+        The name of the counter.
+    n : int, optional
+        The amount to increment the counter by. Defaults to `1`.
+    '''
+    if(not enabled or getattr(_local, 'paused', False)): return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def add_time(name, elapsed, calls=1):
+    '''
+    Adds a wall time measured elsewhere (e.g. by a background thread, under `paused()`) to the 
+    timer of a named stage.
+
+    Parameters
+    ----------
+    name : string
+        The name of the stage.
+    elapsed : float
+        The wall time in seconds.
+    calls : int, optional
+        The number of entries of the stage that the time covers. Defaults to `1`.
+    '''
+    if(not enabled): return
+    with _lock:
+        [total, n] = _timers.get(name, [0.0, 0])
+        _timers[name] = [total + elapsed, n + calls]
+
+
+class _stage:
+    """
+    A context manager which adds its wall time to the timer of a named stage.
+    """
+    def __init__(self, name):
+        self.name = name
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _null_stage:
+    """
+    A context manager which does nothing, returned by `stage()` when instrumentation is disabled.
+    """
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+_null = _null_stage()
+
+
+def stage(name):
+    '''
+    Returns a context manager which times the enclosed block as the stage `name`. Timers of nested
+    stages are recorded independently (the time of an inner stage is included in the outer stage).
+
+    Parameters
+    ----------
+    name : string
+        The name of the stage.
+
+    Returns
+    -------
+    context manager
+        Records the wall time of the block if instrumentation is enabled, and does nothing otherwise.
+    '''
+    if(not enabled or getattr(_local, 'paused', False)): return _null
+    return _stage(name)
+
+
+class paused:
+    """
+    A context manager within which nothing is recorded by the calling thread (other threads are 
+    unaffected), e.g. while a background thread reads the cutout of the next halo, such that its 
+    counts are not attributed to the halo being fit.
+    """
+    def __enter__(self):
+        self._was_paused = getattr(_local, 'paused', False)
+        _local.paused = True
+        return self
+    def __exit__(self, *exc):
+        _local.paused = self._was_paused
+        return False
+
+
+def report():
+    '''
+    Returns the values recorded since the last `reset()`.
+
+    Returns
+    -------
+    dict
+        A dictionary with entries `'counters'`, mapping each counter name to its count, and
+        `'timers'`, mapping each stage name to a dictionary giving its total wall time `'time'` in
+        seconds, and its number of entries `'calls'`. Serializable by `json`.
+    '''
+    with _lock:
+        return {'counters':dict(_counters),
+                'timers':{name:{'time':t[0], 'calls':t[1]} for name, t in _timers.items()}}
+
+
+def aggregate(reports):
+    '''
+    Sums a list of reports (e.g. those of many halo fits, or those gathered from many MPI ranks).
+
+    Parameters
+    ----------
+    reports : list of dicts
+        Reports as returned by `report()`.
+
+    Returns
+    -------
+    dict
+        A report of the same form as returned by `report()`, giving the summed counts, times and
+        calls, with an additional entry `'nreports'` giving the number of reports summed.
+    '''
+    total = {'counters':{}, 'timers':{}, 'nreports':len(reports)}
+    for rep in reports:
+        for name, n in rep['counters'].items():
+            total['counters'][name] = total['counters'].get(name, 0) + n
+        for name, t in rep['timers'].items():
+            agg = total['timers'].setdefault(name, {'time':0.0, 'calls':0})
+            agg['time'] += t['time']
+            agg['calls'] += t['calls']
+    return total
+
+
+def write_report(rep, path):
+    '''
+    Writes a report to a JSON file.
+
+    Parameters
+    ----------
+    rep : dict
+        A report as returned by `report()` or `aggregate()`.
+    path : string
+        The output file path.
+    '''
+    with open(path, 'w') as f:
+        json.dump(rep, f, indent=2, sort_keys=True)
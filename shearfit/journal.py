@@ -0,0 +1,138 @@
+import os
+import json
+import glob
+
+'''
+This module records the progress of a fitting campaign, such that a campaign which is interrupted
+(e.g. by the wall-clock limit of a batch job) can be resumed without repeating completed fits.
+Each rank appends an entry to its own journal file for each (halo, configuration) pair that it
+completes, after the results of the fit have been written. Each append is a single write of whole
+lines to a file opened in append mode, which is synced to disk before returning; a journal cut
+short by a crash can end in at most one partial line, which is ignored when read. Usage is as
+follows:
+
+    done = journal.completed(journal.read_journals('{}/journal/*.jsonl'.format(lensing_dir)))
+    log = journal.journal('{}/journal/rank{}.jsonl'.format(lensing_dir, rank))
+    ... fit the remaining configurations of a halo, and write the results ...
+    log.append([{'halo':halo, 'config':journal.config_key(config)} for config in configs])
+'''
+
+class journal:
+    """
+    This class constructs an object representing an append-only journal of completed work, stored
+    as a file of JSON lines.
+
+    Parameters
+    ----------
+    path : string
+        The path of the journal file. Created if it does not exist, and otherwise appended to
+        (after terminating any partial last line).
+
+    Attributes
+    ----------
+    path : string
+        The path of the journal file.
+
+    Methods
+    -------
+    append(entries)
+        Appends entries to the journal, and syncs them to disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        journal_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(journal_dir): os.makedirs(journal_dir, exist_ok=True)
+        
+        # a journal cut short by a crash may end in a partial line; terminate it, such that the
+        # entries appended next are not joined to it (it is then skipped when read)
+        if(os.path.exists(path) and os.path.getsize(path) > 0):
+            with open(path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if(f.read(1) != b'\n'): f.write(b'\n')
+
+
+    def append(self, entries):
+        '''
+        Appends entries to the journal with a single write, and syncs them to disk.
+
+        Parameters
+        ----------
+        entries : dict, or list of dicts
+            The entries to append. Must be serializable by `json`.
+        '''
+        if(isinstance(entries, dict)): entries = [entries]
+        if(len(entries) == 0): return
+        data = ''.join([json.dumps(entry, sort_keys=True) + '\n' for entry in entries]).encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def read_journals(pattern):
+    '''
+    Reads the entries of all journals matching a glob pattern (e.g. those of every rank of every
+    previous run of a campaign). Lines which are not complete JSON objects (i.e. a partial last line
+    written during a crash) are skipped.
+
+    Parameters
+    ----------
+    pattern : string
+        A glob pattern matching the journal files.
+
+    Returns
+    -------
+    list of dicts
+        The journal entries, in order of journal file name, and then of writing.
+    '''
+    entries = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r') as f:
+            for line in f:
+                if(not line.endswith('\n')): continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if(isinstance(entry, dict)): entries.append(entry)
+    return entries
+
+
+def completed(entries):
+    '''
+    Returns the set of completed (halo, configuration) pairs recorded by journal entries.
+
+    Parameters
+    ----------
+    entries : list of dicts
+        Journal entries, as returned by `read_journals()`, each with a `'halo'` and a `'config'`
+        (as given by `config_key()`).
+
+    Returns
+    -------
+    set of tuples
+        The `(halo, config)` pairs of the entries.
+    '''
+    return set([(entry['halo'], entry['config']) for entry in entries])
+
+
+def config_key(config):
+    '''
+    Returns a canonical string identifying a fit configuration, for matching journal entries
+    across runs.
+
+    Parameters
+    ----------
+    config : dict
+        The fit configuration (keyword arguments of `fit_profile.fit_nfw_profile_lstq`). Must be
+        serializable by `json`.
+
+    Returns
+    -------
+    key : string
+        The configuration as JSON, with sorted keys.
+    '''
+    return json.dumps(config, sort_keys=True)
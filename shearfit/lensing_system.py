@@ -78,6 +78,9 @@ class obs_lens_system:
         self._y2 = None
         self._yt = None
         self._k =None
+        self._sigma_crit = None
+        self._sorter = None
+        self._sorted_sums = None
 
 
     def _check_sources(self):
@@ -108,6 +111,7 @@ class obs_lens_system:
         self._check_sources()
         if(rmin is None): rmin = 0
         if(rmax is None): rmax = np.max(self._r)
+        self._rmin, self._rmax = rmin, rmax
         self._radial_mask = np.logical_and(self._r >= rmin, self._r <= rmax)
         
 
@@ -178,6 +182,11 @@ class obs_lens_system:
 
         self._check_sources()
         
+        # quantities derived from the source data are cached on first use, and are invalid now
+        self._sigma_crit = None
+        self._sorter = None
+        self._sorted_sums = None
+        
         # compute halo-centric projected radial separation of each source, in proper Mpc
         #self._r = np.linalg.norm([np.tan(self._theta1), np.tan(self._theta2)], axis=0) * \
         #                          self._cosmo.comoving_distance(self.zl).value
@@ -254,6 +263,7 @@ class obs_lens_system:
 
     @property
     def r(self): return self._r
+    @r.setter
     def r(self, value):
         raise Exception('Cannot change source \'r\' value; update angular positions instead')
 
@@ -273,7 +283,7 @@ class obs_lens_system:
     
     @property
     def zs(self): return self._zs
-    @theta1.setter
+    @zs.setter
     def zs(self, value): 
         self._zs = value
         self._comp_bg_quantities()
@@ -359,8 +369,13 @@ class obs_lens_system:
             :math:`M_{\\odot}/\\text{pc}^2` 
         '''
         if(zs is None): 
+            # the critical density of every source is computed once, and cached (the distances 
+            # are computed only once per unique source redshift, e.g. per ray-tracing plane)
             self._check_sources()
-            zs = self._zs[self._radial_mask] 
+            if(self._sigma_crit is None): 
+                [zs_unique, zs_index] = np.unique(self._zs, return_inverse=True)
+                self._sigma_crit = self.calc_sigma_crit(zs_unique)[zs_index]
+            return self._sigma_crit[self._radial_mask]
 
         # G in Mpc^3 M_sun^-1 Gyr^-2,
         # speed of light C in Mpc Gyr^-1
@@ -426,30 +441,38 @@ class obs_lens_system:
         
         self._check_sources()
        
-        # load data and sort by increasing radial distance
-        r = self._r[self._radial_mask]
-        sorter = np.argsort(r)
-        r = r[sorter]
+        # the sorted radii and prefix sums are cached, such that the radial cuts select a 
+        # contiguous slice, and the sum over any bin is a difference of two prefix sums 
+        [r_sorted, sums] = self._sorted_prefix_sums()
+        lo = np.searchsorted(r_sorted, self._rmin, side='left')
+        hi = np.searchsorted(r_sorted, self._rmax, side='right')
+        r = r_sorted[lo:hi]
         
-        yt = self._yt[self._radial_mask][sorter]
-        sigma_crit = self.calc_sigma_crit()[sorter]
-        delta_sigma = yt*sigma_crit
+        # bin edges and bin membership, following the conventions of scipy's binned_statistic 
+        # (bins are closed on the left, and the last bin is also closed on the right)
+        if(np.ndim(nbins) == 0): bin_edges = np.linspace(r[0], r[-1], nbins+1)
+        else: bin_edges = np.asarray(nbins, dtype=float)
+        edge_idx = lo + np.searchsorted(r, bin_edges, side='left')
+        edge_idx[-1] = lo + np.searchsorted(r, bin_edges[-1], side='right')
+        bin_sums = np.diff(sums[:, edge_idx], axis=1)
+        count = bin_sums[0]
         
         # get bin means
-        [r_mean, bin_edges, _] = stats.binned_statistic(r, r, statistic='mean', bins=nbins)
-        [delta_sigma_mean,_,_] = stats.binned_statistic(r, delta_sigma, statistic='mean', bins=nbins)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r_mean = bin_sums[1]/count + self._sorted_offsets[0]
+            delta_sigma_mean = bin_sums[2]/count + self._sorted_offsets[1]
         return_arrays = [r_mean, delta_sigma_mean] 
         return_cols = ['r_mean', 'delta_sigma_mean']
        
        # and standard deviations, errors of the mean
         if(return_std):
-            [delta_sigma_std,_,_] = stats.binned_statistic(r, delta_sigma, statistic='std', bins=nbins)
-            [delta_sigma_count,_,_] = stats.binned_statistic(r, delta_sigma, statistic='count', bins=nbins)
-            delta_sigma_se = delta_sigma_std / delta_sigma_count
-            
-            [r_std,_,_] = stats.binned_statistic(r, r, statistic='std', bins=nbins)
-            [r_count,_,_] = stats.binned_statistic(r, r, statistic='count', bins=nbins)
-            r_se = r_std / r_count
+            with np.errstate(divide='ignore', invalid='ignore'):
+                r_std = np.sqrt(np.maximum(bin_sums[3]/count - (bin_sums[1]/count)**2, 0))
+                delta_sigma_std = np.sqrt(np.maximum(bin_sums[4]/count - (bin_sums[2]/count)**2, 0))
+            r_std[count == 0] = np.nan
+            delta_sigma_std[count == 0] = np.nan
+            delta_sigma_se = delta_sigma_std / np.sqrt(count)
+            r_se = r_std / np.sqrt(count)
             
             return_arrays.extend([r_std, r_se, delta_sigma_std, delta_sigma_se]) 
             return_cols.extend(['r_std', 'r_se_mean', 'delta_sigma_std', 'delta_sigma_se_mean']) 
@@ -461,8 +484,9 @@ class obs_lens_system:
         
         # return bin gradient and errors... compute these manually
         if(return_gradients): 
-            bin_gradients  = np.zeros(nbins)
-            for i in range(nbins):
+            delta_sigma = (self._yt * self._sigma_crit)[self._sorter][lo:hi]
+            bin_gradients  = np.zeros(len(bin_edges)-1)
+            for i in range(len(bin_edges)-1):
                 
                 bin_mask = np.logical_and(r > bin_edges[i], r < bin_edges[i+1])
                 if(np.sum(bin_mask) == 0): bin_gradients[i] = float('NaN')
@@ -477,3 +501,31 @@ class obs_lens_system:
         bin_dict = {}
         for i in range(len(return_arrays)): bin_dict[return_cols[i]] = return_arrays[i]
         return bin_dict
+
+
+    def _sorted_prefix_sums(self):
+        """
+        Returns the source radii sorted in increasing order, and the prefix sums over the sorted 
+        sources of the count, :math:`r`, :math:`\\Delta\\Sigma`, :math:`r^2`, and 
+        :math:`\\Delta\\Sigma^2`, from which the sufficient statistics of any radial bin are found 
+        in constant time. The sums of :math:`r` and :math:`\\Delta\\Sigma` are taken relative to their 
+        means over all sources (given in `_sorted_offsets`), to limit the loss of precision in the 
+        variances. Both are computed once, on first use, for all sources (ignoring radial cuts), 
+        and cached until the source data changes.
+
+        Returns
+        -------
+        list
+            The sorted radii, and a 2d float array of shape `(5, N+1)`, giving the prefix sums.
+        """
+        if(self._sorted_sums is None):
+            self._sorter = np.argsort(self._r, kind='stable')
+            r = self._r[self._sorter]
+            self.calc_sigma_crit()
+            delta_sigma = (self._yt * self._sigma_crit)[self._sorter]
+            self._sorted_offsets = [np.mean(r), np.mean(delta_sigma)]
+            dr, dds = r - self._sorted_offsets[0], delta_sigma - self._sorted_offsets[1]
+            sums = np.zeros((5, len(r)+1))
+            sums[:, 1:] = np.cumsum([np.ones(len(r)), dr, dds, dr**2, dds**2], axis=1)
+            self._sorted_sums = [r, sums]
+        return self._sorted_sums
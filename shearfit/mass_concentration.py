@@ -7,6 +7,27 @@ This module contains a collection of concentration-mass relations as given in th
 the functions below take a halo mass as an argument, and will return a predicted concentration.
 '''
 
+_colossus_cosmologies = {}
+def _set_colossus_cosmology(cosmo):
+    """
+    Sets the current COLOSSUS cosmology to match the `astropy` cosmology `cosmo`. The COLOSSUS 
+    cosmology object (and its internally cached interpolation tables) is built once per distinct 
+    set of parameters and reused, since the c-M relations may be called on every iteration of a fit.
+
+    Parameters
+    ----------
+    cosmo : `astropy` `cosmology` object instance
+        The cosmology to set.
+    """
+    params = {'Om0':cosmo.Om0, 'Ob0':cosmo.Ob0, 'H0':cosmo.H0.value, 'sigma8':0.8, 
+              'ns':0.963, 'relspecies':False}
+    key = tuple(sorted(params.items()))
+    if(key not in _colossus_cosmologies):
+        _colossus_cosmologies[key] = colcos.setCosmology('OuterRim', params)
+    if(colcos.getCurrent() is not _colossus_cosmologies[key]):
+        colcos.setCurrent(_colossus_cosmologies[key])
+
+
 def child2018(m200c, z, cosmo, fit='nfw_stack'):
     """
     Computes the predicted halo concentration, given a M_200c halo mass, using the 
@@ -33,9 +54,7 @@ def child2018(m200c, z, cosmo, fit='nfw_stack'):
     
     # draw a concentration from gaussian with scale and location defined by Child+2018
     # colossus expects input mass with h^(-1) dependence, so multiply through before passing
-    cosmo_colossus = colcos.setCosmology('OuterRim',
-                     {'Om0':cosmo.Om0, 'Ob0':cosmo.Ob0, 'H0':cosmo.H0.value, 'sigma8':0.8, 
-                      'ns':0.963, 'relspecies':False})
+    _set_colossus_cosmology(cosmo)
     m200c_h = m200c * cosmo.h
     c200c = mass_conc(m200c_h, '200c', z, model='child18')
     c_err = c200c/3
@@ -1,67 +1,160 @@
+import os
 import sys
 import pdb
 import time
 import glob
-import h5py
+import argparse
 import numpy as np
-from mpi4py import MPI
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import example_run as fitter
+import instrumentation
+import scheduling
+import backends
+import journal
+import cutout_manifest
+import fit_summary
+import telemetry
+from fit_cache import fit_cache
+from prefetch import prefetcher
+from results_store import results_store, merge_results, readable
 
-def parallel_profile_fit(lensing_dir):
+def parallel_profile_fit(lensing_dir, backend='mpi', nworkers=None):
+    """
+    Fits all halo cutouts of a ray-tracing campaign, with each of a list of fit configurations 
+    (see the toggles below), writing the results to a catalog `fit_results.hdf5` in `lensing_dir`, 
+    and a summary of the fractional bias of the fitted parameters for each configuration to 
+    `fit_bias_summary.csv`.
+
+    Parameters
+    ----------
+    lensing_dir : string
+        The directory containing the halo cutouts.
+    backend : string, optional
+        How to run in parallel; `'mpi'` runs one process per MPI rank (and must be launched with 
+        e.g. `mpirun`), `'pool'` runs a local pool of worker processes, and `'serial'` fits all 
+        halos in this process. Defaults to `'mpi'`.
+    nworkers : int, optional
+        The number of worker processes of the `'pool'` backend. Defaults to `None`, in which case 
+        the number of CPUs is used.
+    """
     
     # toggle this on to test communication without actually performing fits
     dry_run = False
-    # toggle this on to redo fits even if files exist
-    overwrite = True
+    # toggle this on to redo fits even if cached results exist
+    overwrite = False
+    # toggle this on to continue an interrupted campaign, skipping the (halo, configuration) pairs 
+    # recorded as complete in the journals of previous runs; if off, previous results are removed
+    resume = True
+    # toggle this on to rescan the cutouts even if a manifest exists
+    rescan = False
+    # how to divide the cutouts between ranks; 'static' gives each rank an equal, contiguous share 
+    # up front, 'cost' gives each rank an equal share of the predicted cost up front (from a model 
+    # recalibrated on the measured costs of each run), and 'dynamic' hands out chunks of chunk 
+    # cutouts to ranks as they become free 
+    schedule = 'dynamic'
+    chunk = 1
+    # the number of cutouts to read ahead of the one being fit, in a background thread of each 
+    # rank, and a cap on their total size in memory (0 reads each cutout only when it is fit)
+    prefetch = 2
+    prefetch_mem = 4e9
+    # toggle this on to record per-halo call counts and stage timings, written to 
+    # instrumentation.json in lensing_dir
+    instrument = False
+    # toggle this on to log the stage timings, size, and throughput of each halo to a telemetry 
+    # log per rank in lensing_dir/telemetry, reduced at the end of the run into a report of the 
+    # load imbalance, throughput, and slowest halos
+    log_telemetry = True
+    # the fit configurations to run for each cutout (keyword arguments of fit_nfw_profile_lstq); 
+    # each cutout is read once, and the results of all configurations are written together (a 
+    # bootstrap is only cached if seeded)
+    configs = [{'rmin':0.3, 'bin_data':True, 'bins':30, 'bootstrap':True, 'seed':0}, 
+               {'rmin':0.3, 'bin_data':True, 'bins':30, 'bootstrap':True, 'seed':0, 
+                'cM_relation':'child2018'}]
 
     # -----------------------------------------
     # ---------- define communicator ----------
-    comm= MPI.COMM_WORLD
+    # (with the pool and serial backends, this is a single process, acting as the only rank)
+    comm = backends.get_comm(backend)
     rank = comm.Get_rank()
     numranks = comm.Get_size()
-    if(rank==0):
+    pool = None
+    if(backend == 'mpi' and rank==0):
         print('\n---------- starting with {} MPI processes ----------'.format(numranks))
-        sys.stdout.flush()
+    elif(backend == 'pool'):
+        if(nworkers is None): nworkers = os.cpu_count()
+        pool = ProcessPoolExecutor(nworkers)
+        print('\n---------- starting with {} worker processes ----------'.format(nworkers))
+    elif(backend == 'serial'):
+        print('\n---------- starting serial run ----------')
+    sys.stdout.flush()
     comm.Barrier()
 
 
-    # --------------------------------------
-    # ---------- find all cutouts ----------
-    #all_cutouts = np.array(glob.glob('{}/halo*'.format(lensing_dir)))
-    all_cutouts = np.array(glob.glob('{}/halo_244960324069_0'.format(lensing_dir)))
-
-
-    # ----------------------------------------------------------------------
-    # ---------- remove cutouts with missing or incomplete mocks -----------
-    if(rank == 0): 
-        print('found {} total halo mocks'.format(len(all_cutouts))) 
-        print('removing empty and truncated cutouts') 
-    nofile_mask = np.array([len(glob.glob('{}/*mock*'.format(c))) != 0 for c in all_cutouts])
-    all_cutouts = all_cutouts[nofile_mask]
-    cutout_mock_planes = np.array( [[int(s.split('plane')[-1]) 
-                                        for s in list(h5py.File(glob.glob(
-                                        '{}/*lensing_mocks.hdf5'.format(c))[0], 'r').keys())]
-                                        for c in all_cutouts] )
-    empty_mask = [len(plane) > 0 for plane in cutout_mock_planes]
-    all_cutouts = all_cutouts[empty_mask]
-    cutout_mock_planes = cutout_mock_planes[empty_mask]
-    
-    cutout_dens_depth = np.array( [max([int(s.split('plane')[-1].split('_')[0]) 
-                                        for s in glob.glob('{}/dtfe_dens/*plane*'.format(c))])
-                                        for c in all_cutouts] )
-    cutout_mock_depth = np.array( [max(planes) for planes in cutout_mock_planes] )
-
-    truncated_mask = np.array( [cutout_dens_depth[i] == cutout_mock_depth[i] 
-                                for i in range(len(all_cutouts))] )
-    all_cutouts = all_cutouts[truncated_mask]
+    # ---------------------------------------------------------------
+    # ---------- find all cutouts, and remove incomplete ones ----------
+    # the cutouts are scanned once, and their metadata and validity written to a manifest which is 
+    # loaded on later runs (delete it, or toggle rescan, if the cutouts change)
+    cutout_pattern = '{}/halo_244960324069_0'.format(lensing_dir)
+    #cutout_pattern = '{}/halo*'.format(lensing_dir)
+    manifest_file = '{}/cutout_manifest.hdf5'.format(lensing_dir)
+    # (decided on one rank, since the build is collective)
+    build = comm.bcast(rescan or not os.path.exists(manifest_file), root=0)
+    if(build):
+        if(rank == 0): print('scanning cutouts for manifest')
+        manifest = cutout_manifest.build_manifest(cutout_pattern, manifest_file, executor=pool,
+                                                  comm=comm if backend == 'mpi' else None)
+    else:
+        manifest = cutout_manifest.load_manifest(manifest_file)
+    valid = manifest['valid']
+    all_cutouts = manifest['path'][valid]
+    all_masses = manifest['mass'][valid]
+    all_nsources = manifest['nsources'][valid]
+    all_makeplot = np.log10(all_masses) > 14.5
     
     if(rank == 0): 
-        print('removing cutouts missing concentrations')
-   
-    conc_mask = np.array( [len(np.genfromtxt('{}/properties.csv'.format(c), 
-                               delimiter=',', names=True).dtype ) == 11 
-                           for c in all_cutouts] ) 
-    all_cutouts = all_cutouts[conc_mask]
+        print('found {} total halo mocks'.format(len(valid))) 
+        print('removed {} empty, truncated, or concentration-less cutouts'.format(np.sum(~valid)))
+    
+
+    # --------------------------------------------------------------
+    # ---------- skip work completed by previous runs ----------
+    # each rank appends the fit results of all of its halos to its own table for this run, and 
+    # then records each completed (halo, configuration) pair in its own journal; the tables of all 
+    # runs are merged into one catalog once all ranks are done
+    results_dir = '{}/fit_results'.format(lensing_dir)
+    journal_dir = '{}/journal'.format(lensing_dir)
+    run = comm.bcast(time.strftime('%Y%m%d-%H%M%S'), root=0)
+    if(rank == 0):
+        if not os.path.exists(results_dir): os.makedirs(results_dir)
+        if(resume):
+            # journal entries only count if the results they refer to can still be read
+            entries = journal.read_journals('{}/*.jsonl'.format(journal_dir))
+            intact = {f:readable('{}/{}'.format(results_dir, f)) 
+                      for f in set([entry['results'] for entry in entries])}
+            done = journal.completed([entry for entry in entries if intact[entry['results']]])
+        else:
+            for f in glob.glob('{}/*.hdf5'.format(results_dir)) + \
+                     glob.glob('{}/*.jsonl'.format(journal_dir)):
+                os.remove(f)
+            done = set()
+    else:
+        done = None
+    done = comm.bcast(done, root=0)
+    
+    config_keys = [journal.config_key(config) for config in configs]
+    halo_names = [os.path.basename(os.path.normpath(c)) for c in all_cutouts]
+    remaining = [[config for config, key in zip(configs, config_keys) if (name, key) not in done] 
+                 for name in halo_names]
+    todo = np.array([len(r) > 0 for r in remaining], dtype=bool)
+    if(rank == 0 and resume):
+        print('resuming; {} of {} mocks have completed all configurations'.format(
+              np.sum(~todo), len(todo)))
+    all_cutouts = all_cutouts[todo]
+    all_masses = all_masses[todo]
+    all_nsources = all_nsources[todo]
+    all_makeplot = all_makeplot[todo]
+    remaining = [r for r, t in zip(remaining, todo) if t]
+    halo_names = [n for n, t in zip(halo_names, todo) if t]
     
     if(rank == 0):
         print('distributing {} mocks to {} ranks'.format(len(all_cutouts), numranks))
@@ -70,8 +163,26 @@ def parallel_profile_fit(lensing_dir):
 
     # -------------------------------------------------
     # ---------- distribute cutouts to ranks ----------
-    this_rank_halos = np.array_split(all_cutouts, numranks)[rank]
-    print("rank {} gets {} mocks".format(rank, len(this_rank_halos)), flush=True)
+    cost_model_file = '{}/cost_model.json'.format(lensing_dir)
+    if(schedule == 'static'):
+        this_rank_halos = scheduling.static_schedule(len(all_cutouts), comm)
+        print("rank {} gets {} mocks".format(rank, len(this_rank_halos)), flush=True)
+    elif(schedule == 'cost'):
+        model = scheduling.load_cost_model(cost_model_file)
+        costs = model.predict(all_nsources, configs, all_makeplot)
+        [this_rank_halos, loads] = scheduling.lpt_schedule(costs, comm)
+        print("rank {} gets {} mocks".format(rank, len(this_rank_halos)), flush=True)
+        if(rank == 0): 
+            print('predicted cost {:.1f} s; max/mean rank load {:.2f}'.format(
+                  np.sum(costs), np.max(loads)/np.mean(loads)), flush=True)
+    elif(schedule == 'dynamic' and backend != 'mpi'):
+        # a single rank takes all halos (the workers of a pool take them as they become free)
+        this_rank_halos = scheduling.static_schedule(len(all_cutouts), comm)
+    elif(schedule == 'dynamic'):
+        this_rank_halos = scheduling.dynamic_schedule(len(all_cutouts), comm, chunk=chunk)
+        if(rank == 0): print("ranks take mocks on demand in chunks of {}".format(chunk), flush=True)
+    else:
+        raise ValueError('schedule must be \'static\', \'cost\', or \'dynamic\'')
     comm.Barrier()
     #sys.stdout.flush()
     #comm.Barrier()
@@ -80,35 +191,282 @@ def parallel_profile_fit(lensing_dir):
     # ----------------------------------------------------------------------------
     # ---------------- do profile fitting on mocks for this rank -----------------
     
+    # fit results are cached under a hash of the source data, fit configuration, and code 
+    # version, so that a rerun only redoes the fits affected by whatever has changed
+    cache_dir = '{}/fit_cache'.format(lensing_dir)
+    
+    # the results of every halo are written by this rank, whether fit here or by a pool worker
+    rank_results = '{}_rank{}.hdf5'.format(run, rank)
+    store = results_store('{}/{}'.format(results_dir, rank_results))
+    log = journal.journal('{}/{}_rank{}.jsonl'.format(journal_dir, run, rank))
+    telemetry_dir = '{}/telemetry'.format(lensing_dir)
+    if(log_telemetry): tlog = journal.journal('{}/{}_rank{}.jsonl'.format(telemetry_dir, run, rank))
+    fit_reports = []
+    halo_costs = []
+    worker_busy = {}
+    nhalos = 0
+    cache_hits = 0
+    cache_misses = 0
+    
+    def fit_args(i):
+        return [all_cutouts[i], remaining[i], all_makeplot[i], cache_dir, overwrite, instrument, 
+                (rank==0 and pool is None), dry_run]
+    def fit_here(loaded):
+        waited = 0.0
+        for i, [data, read_stats] in loaded:
+            if(rank==0): 
+                print('\n---------- working on halo {}/{} with mass {:.2E}----------'.format(
+                        i+1, len(all_cutouts), all_masses[i]))
+                sys.stdout.flush()
+            fit = _fit_halo(*fit_args(i), data=data, read_stats=read_stats)
+            fit.update({'wait':loaded.wait_time - waited, 'read_ahead':True})
+            waited = loaded.wait_time
+            yield i, fit
+    
+    # fit each halo here as this rank is given it, or submit them all to the pool and collect 
+    # them as they complete
     start = time.time()
-    for i in range(len(this_rank_halos)):
-
-        cutout = this_rank_halos[i]
-        mass = np.genfromtxt('{}/properties.csv'.format(cutout), delimiter=',', names=True)['sod_halo_mass']
-        if(np.log10(mass) > 14.5) : makeplot=True
-        else: makeplot=False
-        
-        if(rank==0): 
-            print('\n---------- working on halo {}/{} with mass {:.2E}----------'.format(
-                    i+1, len(this_rank_halos), mass))
-            sys.stdout.flush()
-
-        if( (len(glob.glob('{}/profile_fits/*0.3rmin.npy'.format(cutout))) < 4 or overwrite) and not dry_run):
-            fitter.sim_example_run(halo_cutout_dir = cutout, makeplot=makeplot, showfig=False, 
-                                   stdout=(rank==0), bin_data=True, rbins=30, rmin=0.3)
+    if(pool is None):
+        # the next cutouts are read while this one is fit (the size of a loaded cutout is 
+        # estimated at 150 bytes per source in its lensing mock)
+        load = lambda i: _load_halo(all_cutouts[i], dry_run)
+        loaded = prefetcher(this_rank_halos, load, depth=0 if dry_run else prefetch, 
+                            max_bytes=prefetch_mem, 
+                            nbytes=lambda i: 150 * all_nsources[i])
+        fits = fit_here(loaded)
+    else:
+        futures = {pool.submit(_fit_halo, *fit_args(i)):i for i in this_rank_halos}
+        fits = ((futures[future], future.result()) for future in as_completed(futures))
+    
+    for i, fit in fits:
+        nhalos += 1
+        # (along with the halo properties not carried by the fitted profile)
+        store.append([dict(row, m200c_true=all_masses[i], nsources=all_nsources[i]) 
+                      for row in fit['rows']])
+        log.append([{'halo':halo_names[i], 'config':journal.config_key(config), 
+                     'results':rank_results} for config in remaining[i]])
+        cache_hits += fit['hits']
+        cache_misses += fit['misses']
+        worker_busy[fit['pid']] = worker_busy.get(fit['pid'], 0.0) + fit['time']
+        if(pool is not None):
+            print('finished halo {} ({}/{}) in {:.2f} s'.format(
+                  halo_names[i], nhalos, len(this_rank_halos), fit['time']), flush=True)
+        # the measured cost, for recalibrating the cost model (unless any fit was cached, or 
+        # only some configurations were run)
+        if(not dry_run and fit['hits'] == 0 and len(remaining[i]) == len(configs)): 
+            halo_costs.append([all_nsources[i], all_makeplot[i], _halo_cost(fit)])
+        if(instrument): 
+            fit_reports.append(dict(fit['report'], halo=halo_names[i], rank=rank))
+        if(log_telemetry):
+            # (a halo read ahead of its fit contributes only its wait for the read to its time)
+            read_stats = fit['read_stats']
+            wait = fit.get('wait', 0.0)
+            tlog.append({'halo':halo_names[i], 'rank':rank, 'worker':fit['pid'], 
+                         'nsources':int(read_stats.get('nsources', all_nsources[i])), 
+                         'nconfigs':len(remaining[i]), 
+                         'nfev':int(sum([row['nfev'] for row in fit['rows']])), 
+                         'bytes_read':int(read_stats.get('bytes_read', 0)), 
+                         'start':fit['start'] - wait, 'end':fit['start'] + fit['time'], 
+                         'time':wait + fit['time'], 
+                         'stages':dict(fit['stages'], wait=wait, 
+                                       read=read_stats.get('read_time', 0.0), 
+                                       prepare=read_stats.get('prepare_time', 0.0))})
     
     # -------------------------------------------------------------------------------
     # -------------------------------------------------------------------------------
     
     end = time.time()
 
-    # all done
-    comm.Barrier()
+    # all done; measure how long each rank (or pool worker) sat idle, waiting for work or for the 
+    # other ranks
+    read_wait = loaded.wait_time if pool is None else 0.0
+    if(pool is None):
+        dynamic = isinstance(this_rank_halos, scheduling.dynamic_schedule)
+        wait_time = this_rank_halos.wait_time if dynamic else 0.0
+        balance = scheduling.report_balance(comm, end-start, nhalos, wait_time=wait_time)
+        if(dynamic): this_rank_halos.close()
+        unit = 'rank'
+    else:
+        pool.shutdown()
+        balance = [{'rank':w, 'busy':busy, 'idle':end-start-busy} 
+                   for w, busy in enumerate(worker_busy.values())]
+        unit = 'worker'
     if(rank == 0): print('\n')
     comm.Barrier()
-    print('rank {} finished {} halos in {:.2f} s'.format(
-          rank, len(this_rank_halos), end-start))
+    print('rank {} finished {} halos in {:.2f} s ({} cached fits reused, {} fits performed, '\
+          '{:.2f} s waiting on reads)'.format(
+          rank, nhalos, end-start, cache_hits, cache_misses, read_wait))
+    comm.Barrier()
+    if(rank == 0 and len(balance) > 0):
+        for row in balance:
+            print('{} {} busy for {:.2f} s, idle for {:.2f} s'.format(
+                  unit, row['rank'], row['busy'], row['idle']))
+        busy = np.array([row['busy'] for row in balance])
+        idle = np.array([row['idle'] for row in balance])
+        print('{} schedule: total idle {:.2f} s ({:.1f}% of {} time); max/mean busy {:.2f}'.format(
+              schedule, np.sum(idle), 100*np.sum(idle)/np.sum(busy+idle), unit, 
+              np.max(busy)/np.mean(busy)))
+    
+    # reduce the telemetry logs of all ranks
+    if(log_telemetry):
+        comm.Barrier()
+        if(rank == 0):
+            report = telemetry.summarize(journal.read_journals(
+                                         '{}/{}_rank*.jsonl'.format(telemetry_dir, run)))
+            telemetry.write_report(report, '{}/{}_report.json'.format(telemetry_dir, run))
+            telemetry.print_report(report)
+    
+    # merge the per-rank result tables into one catalog; the rows of this run are already on 
+    # disk in the table of each rank (written as each halo completed, for resuming), so only the 
+    # table names and row counts are gathered, and rank 0 reads the tables, along with those of 
+    # any previous runs
+    written = comm.gather([rank_results, store.nrows], root=0)
+    if(rank == 0):
+        catalog = '{}/fit_results.hdf5'.format(lensing_dir)
+        if(os.path.exists(catalog)): os.remove(catalog)
+        rank_tables = [f for f in sorted(glob.glob('{}/*.hdf5'.format(results_dir))) if readable(f)]
+        missing = [f for f, n in written if n > 0 and '{}/{}'.format(results_dir, f) not in rank_tables]
+        if(len(missing) > 0):
+            raise RuntimeError('result tables {} were written by this run, but cannot be '\
+                               'read'.format(missing))
+        # (keeping only the last result of a fit repeated after being cut off before its journal 
+        # entry was written)
+        config_columns = sorted(set([name for config in configs for name in config]))
+        merged = merge_results(rank_tables, catalog, unique=['halo'] + config_columns)
+        print('wrote {} fit results to {} ({} from this run)'.format(
+              merged.nrows, catalog, sum([n for _, n in written])))
+        
+        # summarize the fractional bias of the fitted parameters for each configuration
+        if(merged.nrows > 0):
+            summary = fit_summary.summarize(merged.read(), by=config_columns)
+            fit_summary.write_summary(summary, '{}/fit_bias_summary.csv'.format(lensing_dir))
+            fit_summary.print_summary(summary)
+    
+    # gather the measured halo costs, and recalibrate the cost model on them, along with those 
+    # of previous runs
+    halo_costs = comm.gather(halo_costs, root=0)
+    if(rank == 0):
+        halo_costs = np.array([c for rank_costs in halo_costs for c in rank_costs]).reshape(-1, 3)
+        model = scheduling.load_cost_model(cost_model_file)
+        cost_log = results_store('{}/halo_costs.hdf5'.format(lensing_dir))
+        features = model.features(halo_costs[:,0], configs, halo_costs[:,1].astype(bool))
+        cost_log.append([dict(zip(model.terms, f), time=t) for f, t in zip(features, halo_costs[:,2])])
+        if(cost_log.nrows > 0):
+            logged = cost_log.read()
+            rel_err = model.calibrate(np.array([logged[term] for term in model.terms]).T, 
+                                      logged['time'])
+            model.save(cost_model_file)
+            print('recalibrated cost model on {} halos (rms relative error {:.2f}): {}'.format(
+                  cost_log.nrows, rel_err, model.coeffs))
+    
+    # gather the per-halo reports, and write them out along with their total
+    if(instrument):
+        all_reports = comm.gather(fit_reports, root=0)
+        if(rank == 0):
+            all_reports = [rep for rank_reports in all_reports for rep in rank_reports]
+            total = instrumentation.aggregate(all_reports)
+            instrumentation.write_report({'total':total, 'fits':all_reports}, 
+                                         '{}/instrumentation.json'.format(lensing_dir))
+            print('instrumentation: {}'.format(total))
+
+
+def _halo_cost(fit):
+    """
+    Returns the measured wall time of processing one halo, including reading it, as modeled by a 
+    `scheduling.cost_model`. The time of a halo read ahead of its fit (by the prefetcher) does not 
+    include the reading and preparation of its cutout, which are added from its read statistics.
+
+    Parameters
+    ----------
+    fit : dict
+        The result of the halo, as returned by `_fit_halo`, with `'read_ahead'` set if its cutout 
+        was loaded before the fit.
+
+    Returns
+    -------
+    float
+        The wall time in seconds.
+    """
+    if(not fit.get('read_ahead', False)): return fit['time']
+    read_stats = fit['read_stats']
+    return fit['time'] + read_stats.get('read_time', 0.0) + read_stats.get('prepare_time', 0.0)
+
+
+def _load_halo(cutout, dry_run):
+    """
+    Loads one halo cutout ahead of its fit (e.g. in the background thread of a `prefetcher`), 
+    without recording into the instrumentation, whose counters meanwhile belong to the halo being 
+    fit; the read is instead added to the report of its own halo by `_fit_halo`, from its read 
+    statistics.
+
+    Returns
+    -------
+    list
+        The data of the cutout, as returned by `example_run.load_sim_data` (or `None` if 
+        `dry_run`), and its read statistics.
+    """
+    read_stats = {}
+    if(dry_run): return [None, read_stats]
+    with instrumentation.paused():
+        return [fitter.load_sim_data(cutout, read_stats=read_stats), read_stats]
+
+
+def _fit_halo(cutout, configs, makeplot, cache_dir, overwrite, instrument, stdout, dry_run, 
+              data=None, read_stats=None):
+    """
+    Fits one halo cutout with each of a list of configurations, in this process or in a pool 
+    worker, and returns the results to be written by the calling rank. If the cutout has already 
+    been loaded (by `_load_halo`), its `data` is used rather than read again, and the 
+    `read_stats` of that load are added to the instrumentation report, as the `'read'` stage 
+    and the `'hdf5_bytes_read'` counter.
+
+    Returns
+    -------
+    dict
+        The result rows `'rows'` (see `example_run._result_row`), the Unix time at which it 
+        started `'start'` and its wall time `'time'`, the wall time of each stage `'stages'` 
+        (`'fit'`, and `'other'` than the fits and reading), the read statistics `'read_stats'` 
+        of the cutout, whether read here or ahead (see `example_run.load_sim_data`), the numbers 
+        of cache hits `'hits'` and misses `'misses'`, the instrumentation report `'report'` (if 
+        `instrument`), and the ID of the process `'pid'`.
+    """
+    start = time.time()
+    cache = fit_cache(cache_dir, refresh=overwrite)
+    rows = []
+    read_ahead = data is not None
+    if(read_stats is None): read_stats = {}
+    if(instrument): 
+        instrumentation.enable()
+        instrumentation.reset()
+        if(read_ahead):
+            instrumentation.add_time('read', read_stats.get('read_time', 0.0) + 
+                                             read_stats.get('prepare_time', 0.0))
+            instrumentation.count('hdf5_bytes_read', read_stats.get('bytes_read', 0))
+    if(not dry_run):
+        if(data is None):
+            with instrumentation.stage('read'):
+                data = fitter.load_sim_data(cutout, read_stats=read_stats)
+        rows = fitter.sim_sweep_run(halo_cutout_dir = cutout, configs=configs, makeplot=makeplot, 
+                                    showfig=False, stdout=stdout, cache=cache, out_file=False, 
+                                    data=data)
+    elapsed = time.time() - start
+    fit_time = sum([row['fit_time'] for row in rows])
+    load_time = 0.0 if read_ahead else \
+                read_stats.get('read_time', 0.0) + read_stats.get('prepare_time', 0.0)
+    return {'rows':rows, 'start':start, 'time':elapsed, 
+            'stages':{'fit':fit_time, 'other':max(elapsed - fit_time - load_time, 0.0)}, 
+            'read_stats':read_stats, 'hits':cache.hits, 'misses':cache.misses, 
+            'report':instrumentation.report() if instrument else None, 'pid':os.getpid()}
 
 
 if __name__ == '__main__':
-    parallel_profile_fit(sys.argv[1])
+    parser = argparse.ArgumentParser(description='Fit NFW profiles to all halo cutouts in a '
+                                                 'directory, in parallel.')
+    parser.add_argument('lensing_dir', help='the directory containing the halo cutouts')
+    parser.add_argument('--backend', choices=backends.backends, default='mpi', 
+                        help='run under MPI (launch with mpirun), with a local process pool, or '
+                             'serially (default: mpi)')
+    parser.add_argument('--nworkers', type=int, default=None, 
+                        help='the number of processes of the pool backend (default: all CPUs)')
+    args = parser.parse_args()
+    parallel_profile_fit(args.lensing_dir, backend=args.backend, nworkers=args.nworkers)
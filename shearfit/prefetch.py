@@ -0,0 +1,100 @@
+import time
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+This module overlaps the reading of input data with computation on previously read data; while
+one item (e.g. a halo cutout) is being processed, the next few are loaded by a background thread.
+Since reading is dominated by waiting on the filesystem (during which the thread does not hold the
+GIL), this hides most of the read time of all but the first item. Items are taken from the input
+iterator only by the consuming thread, such that iterators which communicate (e.g. a
+`scheduling.dynamic_schedule`, which accesses an MPI window) are never advanced from the
+background thread. Usage is as follows:
+
+    for item, data in prefetch.prefetcher(items, load, depth=2):
+        ... process data ...
+'''
+
+class prefetcher:
+    """
+    This class constructs an iterator which yields items along with their loaded data, loading up
+    to `depth` items ahead of the one being processed in a background thread. The number of items
+    loaded ahead is further limited by a cap on their total (estimated) size in memory.
+
+    Parameters
+    ----------
+    items : iterable
+        The items to load (e.g. the paths of halo cutouts), in the order in which to yield them.
+    load : function
+        A function of one item, returning its data. Called in the background thread.
+    depth : int, optional
+        The maximum number of items loaded (or being loaded) ahead of the item being processed.
+        Defaults to `2`. If `0`, each item is loaded when it is requested, without a background
+        thread.
+    max_bytes : float, optional
+        The maximum total size in bytes of the items loaded ahead, as estimated by `nbytes`. An item
+        is always loaded if no others are loaded ahead, such that an item larger than the cap is
+        still processed. Defaults to `None`, in which case there is no cap.
+    nbytes : function, optional
+        A function of one item, returning an estimate of the size of its data in bytes, made
+        before it is loaded (e.g. from the number of sources given in a manifest). Required if
+        `max_bytes` is given.
+
+    Attributes
+    ----------
+    wait_time : float
+        The total wall time in seconds spent by the consuming thread waiting for data to be loaded.
+    """
+
+    def __init__(self, items, load, depth=2, max_bytes=None, nbytes=None):
+        if(max_bytes is not None and nbytes is None):
+            raise ValueError('nbytes must be given along with max_bytes')
+        self._items = iter(items)
+        self._load = load
+        self.depth = int(depth)
+        self.max_bytes = max_bytes
+        self._nbytes = nbytes
+        self.wait_time = 0.0
+
+
+    def __iter__(self):
+        if(self.depth <= 0):
+            for item in self._items:
+                start = time.perf_counter()
+                data = self._load(item)
+                self.wait_time += time.perf_counter() - start
+                yield item, data
+            return
+
+        # pending holds [item, size, future] for each item loaded ahead, in order; an item taken
+        # from the iterator which does not yet fit under the memory cap waits in next_item
+        pending = collections.deque()
+        next_item = []
+        exhausted = False
+        with ThreadPoolExecutor(1) as loader:
+            
+            def fill():
+                nonlocal next_item, exhausted
+                while(len(pending) < self.depth and not exhausted):
+                    if(len(next_item) == 0):
+                        try:
+                            item = next(self._items)
+                        except StopIteration:
+                            exhausted = True
+                            return
+                        size = self._nbytes(item) if self._nbytes is not None else 0
+                        next_item = [item, size]
+                    if(self.max_bytes is not None and len(pending) > 0 and
+                       sum([p[1] for p in pending]) + next_item[1] > self.max_bytes): return
+                    pending.append(next_item + [loader.submit(self._load, next_item[0])])
+                    next_item = []
+            
+            # start loading the items after the next one before waiting on it
+            fill()
+            while(len(pending) > 0):
+                [item, _, future] = pending.popleft()
+                fill()
+                start = time.perf_counter()
+                data = future.result()
+                self.wait_time += time.perf_counter() - start
+                yield item, data
@@ -0,0 +1,274 @@
+import sys
+import glob
+import json
+import h5py
+import numpy as np
+
+class results_store:
+    """
+    This class constructs an object representing a columnar table of fit results in an HDF5 file,
+    to which rows are appended as fits complete. Each column is a resizable dataset, such that a
+    whole campaign of fits (e.g. all of the halos fit by one MPI rank) is written to a single file,
+    rather than to many small files per halo. The files of many ranks are combined with
+    `merge_results()`.
+
+    Columns are created as they first appear in an appended row, with a type inferred from their
+    values; string columns (and any column holding a list or `None` alongside strings) are stored
+    as variable-length strings, with lists encoded as JSON. A column is widened (from boolean, to
+    integer, to float, to string) if a later value does not fit its type, rather than the value
+    being truncated. Rows missing a column are filled with `NaN` for floats, `-1` for integers,
+    `False` for booleans, and `''` for strings.
+
+    Parameters
+    ----------
+    path : string
+        The path of the HDF5 file. Created if it does not exist, and otherwise appended to.
+
+    Attributes
+    ----------
+    path : string
+        The path of the HDF5 file.
+    nrows : int
+        The number of rows in the table.
+
+    Methods
+    -------
+    append(rows)
+        Appends rows (dictionaries) to the table.
+    read()
+        Returns the table as a dictionary of column arrays.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with h5py.File(path, 'a') as f:
+            self.nrows = int(f.attrs.get('nrows', 0))
+
+
+    def append(self, rows):
+        '''
+        Appends rows to the table, and flushes them to disk.
+
+        Parameters
+        ----------
+        rows : dict, or list of dicts
+            The rows to append (e.g. as given by `example_run._result_row`).
+        '''
+        if(isinstance(rows, dict)): rows = [rows]
+        if(len(rows) == 0): return
+        names = []
+        for row in rows:
+            names.extend([k for k in row if k not in names])
+        columns = {name:[row.get(name) for row in rows] for name in names}
+        self._append_columns(columns, len(rows))
+
+
+    def _append_columns(self, columns, n):
+        with h5py.File(self.path, 'a') as f:
+            for name in f.keys():
+                if(name not in columns): columns[name] = [None] * n
+            for name, values in columns.items():
+                if(name not in f):
+                    dtype = _column_dtype(values)
+                    dset = f.create_dataset(name, shape=(self.nrows,), maxshape=(None,),
+                                            dtype=dtype, chunks=True,
+                                            fillvalue=_fill_value(dtype))
+                    # the rows before the column appeared are written explicitly, since HDF5 
+                    # cannot read the unwritten entries of a string column from a read-only file
+                    if(self.nrows > 0): dset[:] = _column_values([None] * self.nrows, dtype)
+                else:
+                    dset = f[name]
+                    dtype = _widened_dtype(dset.dtype, values)
+                    if(dtype != dset.dtype): dset = _rewrite_column(f, name, dtype)
+                dset.resize((self.nrows + n,))
+                dset[self.nrows:] = _column_values(values, dset.dtype)
+            self.nrows += n
+            f.attrs['nrows'] = self.nrows
+
+
+    def read(self):
+        '''
+        Returns the contents of the table.
+
+        Returns
+        -------
+        dict
+            The table columns, as 1d numpy arrays of length `nrows` (string columns are returned
+            as arrays of `str` objects).
+        '''
+        return read_results(self.path)
+
+
+def read_results(path):
+    '''
+    Returns the contents of a results file written by a `results_store`.
+
+    Parameters
+    ----------
+    path : string
+        The path of the HDF5 file.
+
+    Returns
+    -------
+    dict
+        The table columns, as 1d numpy arrays (string columns are returned as arrays of `str`
+        objects).
+    '''
+    with h5py.File(path, 'r') as f:
+        return {name:(f[name].asstr()[:] if _is_string(f[name].dtype) else f[name][:])
+                for name in f.keys()}
+
+
+def merge_results(in_files, out_file, unique=None):
+    '''
+    Concatenates the tables of many results files (e.g. one per MPI rank) into one catalog. The
+    columns of the output are the union of the columns of the inputs.
+
+    Parameters
+    ----------
+    in_files : list of strings
+        The paths of the results files to merge, in the order in which to concatenate them.
+    out_file : string
+        The path of the merged output file. Must not be one of `in_files`. Appended to if it
+        already exists.
+    unique : list of strings, optional
+        Columns which together identify a row (e.g. the halo and the fit configuration). If given,
+        only the last row of each identity is kept (e.g. that of a fit which was repeated after
+        an interrupted run); a column missing from a file matches the fill values of that column
+        in others. Defaults to `None`, in which case all rows are kept.
+
+    Returns
+    -------
+    `results_store` class instance
+        The merged table.
+    '''
+    tables = [read_results(path) for path in in_files]
+    tables = [table for table in tables if len(table) > 0]
+    keep = [np.ones(len(next(iter(table.values()))), dtype=bool) for table in tables]
+    
+    if(unique is not None):
+        # mark the rows of each identity seen in a later table, or later in the same table
+        seen = set()
+        for table, mask in zip(reversed(tables), reversed(keep)):
+            columns = [[None if _is_fill(v) else v for v in table[name].tolist()] 
+                       if name in table else [None] * len(mask) for name in unique]
+            for j in reversed(range(len(mask))):
+                key = tuple([column[j] for column in columns])
+                mask[j] = key not in seen
+                seen.add(key)
+
+    out = results_store(out_file)
+    for table, mask in zip(tables, keep):
+        if(np.sum(mask) == 0): continue
+        out._append_columns({name:list(values[mask]) for name, values in table.items()}, 
+                            int(np.sum(mask)))
+    return out
+
+
+def _is_fill(value):
+    # whether a value read from a column is the fill value of a missing entry
+    if(isinstance(value, str)): return value == ''
+    if(isinstance(value, float)): return np.isnan(value)
+    if(isinstance(value, bool)): return False
+    if(isinstance(value, int)): return value == -1
+    return False
+
+
+def readable(path):
+    '''
+    Returns whether or not a results file exists and can be read (e.g. it was not left corrupt by
+    a crash during a write).
+
+    Parameters
+    ----------
+    path : string
+        The path of the HDF5 file.
+
+    Returns
+    -------
+    bool
+        Whether or not the file can be read.
+    '''
+    try:
+        read_results(path)
+        return True
+    except (OSError, KeyError, ValueError):
+        return False
+
+
+_string_dtype = h5py.string_dtype('utf-8')
+def _is_string(dtype):
+    return h5py.check_string_dtype(dtype) is not None
+
+
+def _column_dtype(values):
+    # the narrowest of bool, int, float, and string which can hold all (non-None) values
+    values = [v for v in values if v is not None]
+    if(any([isinstance(v, (str, bytes, list, tuple, dict)) for v in values])): return _string_dtype
+    if(all([isinstance(v, (bool, np.bool_)) for v in values]) and len(values) > 0):
+        return np.dtype(bool)
+    if(all([isinstance(v, (int, np.integer)) and not isinstance(v, (bool, np.bool_))
+            for v in values]) and len(values) > 0):
+        return np.dtype(np.int64)
+    return np.dtype(np.float64)
+
+
+_dtype_order = ['bool', 'int', 'float', 'string']
+def _dtype_kind(dtype):
+    if(_is_string(dtype)): return 'string'
+    if(dtype == bool): return 'bool'
+    if(np.issubdtype(dtype, np.integer)): return 'int'
+    return 'float'
+
+
+def _widened_dtype(dtype, values):
+    # the type of an existing column, widened if needed to hold new values (e.g. a float appended
+    # to an integer column, which would otherwise be truncated)
+    if(all([v is None for v in values])): return dtype
+    new_dtype = _column_dtype(values)
+    if(_dtype_order.index(_dtype_kind(new_dtype)) > _dtype_order.index(_dtype_kind(dtype))):
+        return new_dtype
+    return dtype
+
+
+def _rewrite_column(f, name, dtype):
+    # replaces a column by one of a wider type holding the same values (missing values are
+    # filled with the fill value of the new type)
+    values = f[name].asstr()[:] if _is_string(f[name].dtype) else f[name][:]
+    values = [None if _is_fill(v) else v for v in values.tolist()]
+    del f[name]
+    dset = f.create_dataset(name, shape=(len(values),), maxshape=(None,), dtype=dtype, chunks=True,
+                            fillvalue=_fill_value(dtype))
+    if(len(values) > 0): dset[:] = _column_values(values, dtype)
+    return dset
+
+
+def _fill_value(dtype):
+    if(_is_string(dtype)): return ''
+    if(dtype == bool): return False
+    if(np.issubdtype(dtype, np.integer)): return -1
+    return np.nan
+
+
+def _column_values(values, dtype):
+    fill = _fill_value(dtype)
+    if(_is_string(dtype)):
+        values = ['' if v is None else v if isinstance(v, str) else
+                  v.decode() if isinstance(v, bytes) else json.dumps(v, default=_json_default)
+                  for v in values]
+        return np.array(values, dtype=_string_dtype)
+    return np.array([fill if v is None else v for v in values], dtype=dtype)
+
+
+def _json_default(obj):
+    # numpy scalars and arrays in list-valued columns (e.g. parameter bounds)
+    if(isinstance(obj, np.generic)): return obj.item()
+    if(isinstance(obj, np.ndarray)): return obj.tolist()
+    raise TypeError('{} is not serializable in a results column'.format(type(obj)))
+
+
+if __name__ == '__main__':
+    # usage: python results_store.py <merged output file> <rank file glob>
+    in_files = sorted(glob.glob(sys.argv[2]))
+    merged = merge_results(in_files, sys.argv[1])
+    print('merged {} rows from {} files into {}'.format(merged.nrows, len(in_files), sys.argv[1]))
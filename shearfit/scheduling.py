@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import heapq
+import numpy as np
+from scipy import optimize
+
+'''
+This module assigns the halos of a fitting campaign to MPI ranks. With a static schedule, each
+rank is given a fixed, contiguous share of the halos up front; with a dynamic schedule, ranks
+take the next halo (or chunk of halos) from a shared counter whenever they finish their previous
+one, such that ranks which draw expensive halos (e.g. massive halos with many sources, or those
+which are plotted) do not hold up the others. The counter is a single integer in an MPI window
+held by rank 0, incremented with an atomic fetch-and-add, so that no rank is reserved to hand out
+work. Where dynamic scheduling is unavailable, a static schedule can instead be balanced by the
+predicted cost of each halo, from a `cost_model` calibrated on the measured costs of previous
+campaigns. Usage is as follows:
+
+    schedule = scheduling.dynamic_schedule(len(cutouts), comm, chunk=1)
+    for i in schedule:
+        ... fit cutouts[i] ...
+    schedule.close()
+
+or
+
+    model = scheduling.load_cost_model(cost_model_file)
+    costs = model.predict(nsources, configs, makeplot)
+    [indices, loads] = scheduling.lpt_schedule(costs, comm)
+'''
+
+def static_schedule(n, comm):
+    '''
+    Returns the indices of the items assigned to this rank by splitting `n` items into contiguous
+    blocks of (nearly) equal size, one per rank.
+
+    Parameters
+    ----------
+    n : int
+        The total number of items.
+    comm : `mpi4py` communicator
+        The communicator over which to divide the items.
+
+    Returns
+    -------
+    indices : int array
+        The indices of the items assigned to this rank.
+    '''
+    return np.array_split(np.arange(n), comm.Get_size())[comm.Get_rank()]
+
+
+class dynamic_schedule:
+    """
+    This class constructs an iterator over the indices of items which are handed out to the ranks
+    of a communicator on demand, from a counter shared by all ranks. Each index is yielded by
+    exactly one rank. Must be constructed, and closed, by all ranks of the communicator.
+
+    Parameters
+    ----------
+    n : int
+        The total number of items.
+    comm : `mpi4py` communicator
+        The communicator over which to divide the items.
+    chunk : int, optional
+        The number of consecutive items taken from the counter at once. Larger chunks reduce the
+        number of accesses to the counter, at the cost of a coarser balance of the work. Defaults
+        to `1`.
+
+    Attributes
+    ----------
+    n : int
+        The total number of items.
+    chunk : int
+        The number of items taken from the counter at once.
+    count : int
+        The number of items yielded to this rank so far.
+    wait_time : float
+        The total wall time in seconds spent by this rank waiting on the counter.
+
+    Methods
+    -------
+    close()
+        Frees the shared counter.
+    """
+
+    def __init__(self, n, comm, chunk=1):
+        from mpi4py import MPI
+        self._MPI = MPI
+        self.n = n
+        self.chunk = int(chunk)
+        self.count = 0
+        self.wait_time = 0.0
+        self._comm = comm
+
+        # the counter lives in the memory of rank 0, and starts at zero
+        itemsize = MPI.INT64_T.Get_size()
+        size = itemsize if comm.Get_rank() == 0 else 0
+        self._win = MPI.Win.Allocate(size, itemsize, comm=comm)
+        if(comm.Get_rank() == 0):
+            self._win.Lock(0)
+            self._win.Put(np.zeros(1, dtype=np.int64), 0)
+            self._win.Unlock(0)
+        comm.Barrier()
+
+
+    def _fetch(self):
+        # atomically add chunk to the counter, returning its previous value
+        start = time.perf_counter()
+        increment = np.array([self.chunk], dtype=np.int64)
+        value = np.zeros(1, dtype=np.int64)
+        self._win.Lock(0, self._MPI.LOCK_SHARED)
+        self._win.Fetch_and_op(increment, value, 0, 0, self._MPI.SUM)
+        self._win.Unlock(0)
+        self.wait_time += time.perf_counter() - start
+        return int(value[0])
+
+
+    def __iter__(self):
+        while True:
+            first = self._fetch()
+            if(first >= self.n): return
+            for i in range(first, min(first + self.chunk, self.n)):
+                self.count += 1
+                yield i
+
+
+    def close(self):
+        '''
+        Frees the shared counter. Must be called by all ranks, after all ranks have finished
+        iterating.
+        '''
+        self._comm.Barrier()
+        self._win.Free()
+
+
+def report_balance(comm, busy_time, nitems, wait_time=0.0):
+    '''
+    Measures the time that each rank spends idle at the end of a campaign (waiting on the slowest
+    rank), and summarizes the balance of the work across ranks. Must be called by all ranks, as
+    soon as each has finished its work.
+
+    Parameters
+    ----------
+    comm : `mpi4py` communicator
+        The communicator over which the work was divided.
+    busy_time : float
+        The wall time in seconds spent by this rank on its work (including `wait_time`).
+    nitems : int
+        The number of items processed by this rank.
+    wait_time : float, optional
+        The wall time in seconds spent by this rank waiting for work during the campaign (e.g.
+        the `wait_time` of a `dynamic_schedule`), counted as idle. Defaults to `0`.
+
+    Returns
+    -------
+    list of dicts, or None
+        On rank 0, one dictionary per rank giving its `'rank'`, number of items `'nitems'`, busy
+        time `'busy'` and idle time `'idle'` in seconds, where idle time is the time spent waiting
+        for work plus that spent waiting for the other ranks to finish. `None` on other ranks.
+    '''
+    finished = time.perf_counter()
+    comm.Barrier()
+    idle = time.perf_counter() - finished + wait_time
+    row = {'rank':comm.Get_rank(), 'nitems':int(nitems), 'busy':busy_time - wait_time, 'idle':idle}
+    return comm.gather(row, root=0)
+
+
+def lpt_schedule(costs, comm):
+    '''
+    Returns the indices of the items assigned to this rank by a longest-processing-time greedy
+    partition; items are taken in order of decreasing predicted cost, and each is given to the
+    rank with the least total predicted cost so far. The partition is deterministic, such that all
+    ranks compute the same assignment from the same costs without communicating.
+
+    Parameters
+    ----------
+    costs : float array
+        The predicted cost of each item (e.g. from `cost_model.predict()`).
+    comm : `mpi4py` communicator
+        The communicator over which to divide the items.
+
+    Returns
+    -------
+    indices : int array
+        The indices of the items assigned to this rank, in order of decreasing cost.
+    loads : float array
+        The total predicted cost assigned to each rank.
+    '''
+    numranks = comm.Get_size()
+    order = np.argsort(-np.asarray(costs), kind='stable')
+    heap = [(0.0, r) for r in range(numranks)]
+    assignment = np.empty(len(costs), dtype=int)
+    for i in order:
+        [load, r] = heapq.heappop(heap)
+        assignment[i] = r
+        heapq.heappush(heap, (load + costs[i], r))
+    loads = np.zeros(numranks)
+    for load, r in heap: loads[r] = load
+    return order[assignment[order] == comm.Get_rank()], loads
+
+
+_default_costs = {'read':5e-7, 'fit':0.3, 'fit_unbinned':2e-6, 'bootstrap':6e-3, 
+                  'bootstrap_unbinned':5e-8, 'plot':30.0}
+class cost_model:
+    """
+    This class constructs a linear model of the wall time to fit one halo cutout, as a sum of the
+    costs of its stages; reading the sources, the least squares fit of each configuration, the
+    bootstrap realizations of each configuration, and the gridscan and plot. Each stage cost is
+    the product of a coefficient, in seconds, and a feature of the halo and the fit configurations:
+
+        `'read'`: the number of sources
+        `'fit'`: the number of configurations
+        `'fit_unbinned'`: the number of sources, times the number of unbinned configurations
+        `'bootstrap'`: the total number of bootstrap realizations of binned configurations
+        `'bootstrap_unbinned'`: the number of sources, times the total number of bootstrap
+                                realizations of unbinned configurations
+        `'plot'`: whether or not the halo is plotted (with a gridscan)
+
+    The coefficients are calibrated from measured wall times with `calibrate()`.
+
+    Parameters
+    ----------
+    coeffs : dict, optional
+        The coefficient of each stage. Stages not given take default values, measured on a single
+        core.
+
+    Attributes
+    ----------
+    terms : list of strings
+        The names of the stages.
+    coeffs : dict
+        The coefficient of each stage.
+
+    Methods
+    -------
+    features(nsources, configs, makeplot)
+        Returns the features of each halo.
+    predict(nsources, configs, makeplot)
+        Returns the predicted wall time of each halo.
+    calibrate(features, times, prior_weight)
+        Fits the coefficients to measured wall times.
+    save(path)
+        Writes the coefficients to a JSON file.
+    """
+
+    terms = ['read', 'fit', 'fit_unbinned', 'bootstrap', 'bootstrap_unbinned', 'plot']
+
+    def __init__(self, coeffs=None):
+        self.coeffs = dict(_default_costs)
+        if(coeffs is not None): self.coeffs.update(coeffs)
+
+
+    def features(self, nsources, configs, makeplot):
+        '''
+        Returns the features of each halo, which multiply the stage coefficients.
+
+        Parameters
+        ----------
+        nsources : int array
+            The number of sources in each halo cutout.
+        configs : list of dicts
+            The fit configurations run on each halo (keyword arguments of 
+            `fit_profile.fit_nfw_profile_lstq`).
+        makeplot : bool array
+            Whether or not each halo is plotted.
+
+        Returns
+        -------
+        features : 2d float array
+            The features of each halo, with shape `(len(nsources), len(terms))`.
+        '''
+        nsources = np.asarray(nsources, dtype=float)
+        unbinned = [not config.get('bin_data', False) for config in configs]
+        nboot = [config.get('bootN', 1000) if config.get('bootstrap', False) else 0 
+                 for config in configs]
+        nboot_binned = sum([nb for nb, ub in zip(nboot, unbinned) if not ub])
+        nboot_unbinned = sum([nb for nb, ub in zip(nboot, unbinned) if ub])
+        ones = np.ones(len(nsources))
+        return np.array([nsources, len(configs) * ones, sum(unbinned) * nsources, 
+                         nboot_binned * ones, nboot_unbinned * nsources, 
+                         np.asarray(makeplot, dtype=float)]).T
+
+
+    def predict(self, nsources, configs, makeplot):
+        '''
+        Returns the predicted wall time of each halo, in seconds.
+
+        Parameters
+        ----------
+        nsources : int array
+            The number of sources in each halo cutout.
+        configs : list of dicts
+            The fit configurations run on each halo.
+        makeplot : bool array
+            Whether or not each halo is plotted.
+
+        Returns
+        -------
+        costs : float array
+            The predicted wall time of each halo.
+        '''
+        features = self.features(nsources, configs, makeplot)
+        return features @ np.array([self.coeffs[term] for term in self.terms])
+
+
+    def calibrate(self, features, times, prior_weight=1.0):
+        '''
+        Fits the coefficients to the measured wall times of halos by non-negative least squares. 
+        Since the features of a single campaign are often degenerate (e.g. every halo is fit with 
+        the same configurations), each coefficient is also weakly constrained to its current 
+        value, in proportion to `prior_weight`; coefficients which are not constrained by the 
+        measurements are then left nearly unchanged.
+
+        Parameters
+        ----------
+        features : 2d float array
+            The features of each measured halo, as returned by `features()`.
+        times : float array
+            The measured wall time of each halo, in seconds.
+        prior_weight : float, optional
+            The weight of the constraint of each coefficient to its current value, relative to 
+            that of the measurement of one halo. Defaults to `1`.
+
+        Returns
+        -------
+        rel_err : float
+            The RMS relative error of the calibrated model over the measured halos.
+        '''
+        features = np.asarray(features, dtype=float)
+        times = np.asarray(times, dtype=float)
+        prior = np.array([self.coeffs[term] for term in self.terms])
+        
+        # solve for the coefficients in units of their current values, with one additional 
+        # equation per coefficient pulling it toward 1
+        w = np.sqrt(prior_weight) * np.sqrt(np.mean(times**2))
+        A = np.vstack([features * prior, w * np.eye(len(prior))])
+        b = np.hstack([times, w * np.ones(len(prior))])
+        [scale, _] = optimize.nnls(A, b)
+        self.coeffs = {term:float(c) for term, c in zip(self.terms, scale * prior)}
+        
+        predicted = features @ (scale * prior)
+        return float(np.sqrt(np.mean(((predicted - times) / times)**2)))
+
+
+    def save(self, path):
+        '''
+        Writes the coefficients to a JSON file.
+
+        Parameters
+        ----------
+        path : string
+            The output file path.
+        '''
+        with open(path, 'w') as f:
+            json.dump(self.coeffs, f, indent=2, sort_keys=True)
+
+
+def load_cost_model(path):
+    '''
+    Loads a cost model written by `cost_model.save()`.
+
+    Parameters
+    ----------
+    path : string
+        The path of the JSON file of coefficients.
+
+    Returns
+    -------
+    `cost_model` class instance
+        The model with the saved coefficients, or with the default coefficients if `path` does 
+        not exist.
+    '''
+    if(not os.path.exists(path)): return cost_model()
+    with open(path, 'r') as f:
+        return cost_model(json.load(f))
@@ -0,0 +1,181 @@
+import os
+import sys
+import pickle
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+'''
+This module places a set of numpy arrays in a single block of shared memory, which one process
+fills, and which any other process on the same node attaches to by name, such that many workers
+(e.g. those of a process pool) read one copy of the data rather than each holding their own. The
+arrays of an attached block are read-only views of the shared memory; nothing is copied on attach.
+Usage is as follows:
+
+    block = shared_arrays.shared_arrays({'r':r, 'dSigma':dSigma})
+    ... pass block.name (or block itself, which is pickled as its name) to the workers ...
+    ... in a worker:
+    r = shared_arrays.shared_arrays(name=name).arrays['r']
+    ... once the workers are done:
+    block.unlink()
+'''
+
+_align = 64
+# the blocks open in this process; numpy views do not keep a block mapped, so each is kept here 
+# (rather than only by its shared_arrays instance, which may be collected while its arrays are 
+# still in use) until it is explicitly closed
+_open_blocks = set()
+
+class shared_arrays:
+    """
+    This class constructs an object representing a set of named numpy arrays stored in one block of
+    shared memory, either by creating the block and copying arrays into it (in which case this
+    process owns the block, and should `unlink()` it once no longer needed), or by attaching to an
+    existing block by name. The block is laid out as a header, giving the name, offset, shape and
+    type of each array, along with any metadata, followed by the arrays, each aligned to 64 bytes.
+    An instance is pickled as the name of its block, such that passing it to another process (e.g.
+    as an argument of a pool task) attaches that process to the block, rather than copying the
+    arrays.
+
+    Parameters
+    ----------
+    arrays : dict of numpy arrays, optional
+        The arrays to copy into a new block. Must not have an object dtype.
+    name : string, optional
+        The name of an existing block to attach to. Exactly one of `arrays` and `name` must be given.
+    meta : object, optional
+        Metadata to store in the header of a new block, along with the arrays (e.g. scalars
+        describing them). Must be picklable. Defaults to `None`.
+
+    Attributes
+    ----------
+    name : string
+        The name of the shared memory block.
+    arrays : dict of numpy arrays
+        Read-only views of the arrays in the block.
+    meta : object
+        The metadata stored with the arrays.
+    nbytes : int
+        The size of the block in bytes.
+    owner : bool
+        Whether or not this process created the block.
+
+    Methods
+    -------
+    close()
+        Releases this process's views of the block.
+    unlink()
+        Releases this process's views of the block, and frees it once all processes release it.
+    """
+
+    def __init__(self, arrays=None, name=None, meta=None):
+        if((arrays is None) == (name is None)):
+            raise ValueError('exactly one of arrays and name must be given')
+        if(arrays is not None):
+            self._create(arrays, meta)
+        else:
+            self._attach(name)
+
+
+    def _create(self, arrays, meta):
+        arrays = {key:np.ascontiguousarray(value) for key, value in arrays.items()}
+        layout = {}
+        offset = 0
+        for key, value in arrays.items():
+            if(value.dtype.hasobject):
+                raise TypeError('array {} has an object dtype, and cannot be shared'.format(key))
+            layout[key] = [offset, value.shape, value.dtype.str]
+            offset = _aligned(offset + value.nbytes)
+        # (the pid of the resource tracker of this process tells attaching processes whether they
+        # share it; see _attach)
+        resource_tracker.ensure_running()
+        header = pickle.dumps({'layout':layout, 'meta':meta,
+                               'tracker':getattr(resource_tracker._resource_tracker, '_pid', None)})
+        start = _aligned(8 + len(header))
+        size = start + offset
+
+        # on Linux, writing past the free space of /dev/shm kills the process with SIGBUS, rather
+        # than raising an exception, so check that the block fits first
+        if(os.path.isdir('/dev/shm')):
+            stat = os.statvfs('/dev/shm')
+            if(size > stat.f_bavail * stat.f_frsize):
+                raise MemoryError('a {:.3g} MB shared memory block does not fit in the free space '\
+                                  'of /dev/shm'.format(size/1e6))
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        _open_blocks.add(self._shm)
+        self.owner = True
+        self._shm.buf[:8] = np.uint64(len(header)).tobytes()
+        self._shm.buf[8:8+len(header)] = header
+        self._map(layout, start)
+        for key, value in arrays.items():
+            view = self.arrays[key]
+            view.flags.writeable = True
+            view[...] = value
+            view.flags.writeable = False
+        self.meta = meta
+
+
+    def _attach(self, name):
+        if(sys.version_info >= (3, 13)):
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        _open_blocks.add(self._shm)
+        self.owner = False
+        nheader = int(np.frombuffer(self._shm.buf[:8], dtype=np.uint64)[0])
+        header = pickle.loads(bytes(self._shm.buf[8:8+nheader]))
+        self._map(header['layout'], _aligned(8 + nheader))
+        self.meta = header['meta']
+
+        # before Python 3.13, attaching registers the block with the resource tracker of this
+        # process, which frees the block when this process exits (even if the owner, and other
+        # processes, are still using it); unregister it, unless the tracker is that of the owner
+        # (e.g. in the workers of a process pool started by the owner, which inherit the tracker, 
+        # without its pid if spawned), where registering again has no effect, and unregistering 
+        # would remove the owner's registration
+        tracker = getattr(resource_tracker._resource_tracker, '_pid', None)
+        if(sys.version_info < (3, 13) and tracker is not None and tracker != header['tracker']):
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+
+
+    def _map(self, layout, start):
+        self.arrays = {}
+        for key, [offset, shape, dtype] in layout.items():
+            view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self._shm.buf,
+                              offset=start + offset)
+            view.flags.writeable = False
+            self.arrays[key] = view
+
+
+    @property
+    def name(self): return self._shm.name
+
+    @property
+    def nbytes(self): return self._shm.size
+
+
+    def close(self):
+        '''
+        Releases this process's views of the block (the block itself remains, until unlinked). Any
+        other references to the arrays must be released first.
+        '''
+        self.arrays = {}
+        _open_blocks.discard(self._shm)
+        self._shm.close()
+
+
+    def unlink(self):
+        '''
+        Releases this process's views of the block, and requests that the block be freed, which
+        happens once every process has released it. Should be called once, by the owner.
+        '''
+        self.close()
+        self._shm.unlink()
+
+
+    def __reduce__(self):
+        return (shared_arrays, (None, self.name))
+
+
+def _aligned(n):
+    return -(-n // _align) * _align
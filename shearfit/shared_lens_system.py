@@ -0,0 +1,128 @@
+import numpy as np
+from lensing_system import obs_lens_system
+from shared_arrays import shared_arrays
+
+'''
+This module provides an `obs_lens_system` backed by shared memory, for sharing one copy of the 
+source catalog of a halo between the processes of a node. Usage is as follows:
+
+    shared = shared_lens_system.shared_obs_lens_system(lens)
+    ... pass shared (or shared.name) to the workers, which use it as an obs_lens_system ...
+    ... in a worker, given only the name:
+    lens = shared_lens_system.shared_obs_lens_system(name=name)
+    ... once the workers are done:
+    shared.unlink()
+'''
+
+class shared_obs_lens_system(obs_lens_system):
+    """
+    This class constructs an `obs_lens_system` whose source data is held in shared memory, such 
+    that the processes of one node (e.g. the workers of a process pool fitting the same halo) use 
+    a single copy of the source catalog, rather than each holding their own. One process creates 
+    the shared system from an `obs_lens_system` with its sources set, copying the source data 
+    vectors, along with the derived quantities which are otherwise computed on first use (the 
+    critical surface density of each source, and the radially sorted prefix sums), into a block of 
+    shared memory (see `shared_arrays.py`). Other processes attach to the block by name, without 
+    copying or recomputing anything. An instance is pickled as the name of its block, such that 
+    passing it to a worker process attaches the worker.
+    
+    The source data vectors of an attached system are read-only. Radial cuts are set per process, 
+    as for an `obs_lens_system`, and setting a source property (e.g. `zs`) replaces the shared 
+    data with a private copy in that process only. The creating process owns the block, and should 
+    call `unlink()` once all processes are done with it.
+
+    Parameters
+    ----------
+    lens : `obs_lens_system` class instance, optional
+        The lensing system whose source data to place in shared memory. Its sources must be set.
+    name : string, optional
+        The name of the shared memory block of an existing shared system to attach to. Exactly 
+        one of `lens` and `name` must be given.
+
+    Attributes
+    ----------
+    name : string
+        The name of the shared memory block.
+    nbytes : int
+        The size of the shared memory block in bytes.
+    owner : bool
+        Whether or not this process created the shared memory block.
+
+    Methods
+    -------
+    close()
+        Releases this process's views of the shared source data.
+    unlink()
+        Releases this process's views of the shared source data, and frees the block once all 
+        processes release it.
+    """
+    
+    _shared = ['theta1', 'theta2', 'zs', 'r', 'y1', 'y2', 'yt', 'phi', 'k', 'rho', 'sigma_crit']
+
+    def __init__(self, lens=None, name=None):
+        if((lens is None) == (name is None)):
+            raise ValueError('exactly one of lens or name must be given')
+        if(lens is not None):
+            lens._check_sources()
+            lens.calc_sigma_crit()
+            [r_sorted, sums] = lens._sorted_prefix_sums()
+            values = {key:getattr(lens, '_{}'.format(key)) for key in self._shared}
+            # (unset data vectors, e.g. the convergence if none was given, are held as None)
+            arrays = {key:value for key, value in values.items() 
+                      if value is not None and not np.asarray(value).dtype.hasobject}
+            arrays.update({'sorter':lens._sorter, 'r_sorted':r_sorted, 'sorted_sums':sums})
+            meta = {'zl':lens.zl, 'cosmo':lens._cosmo, 'has_shear12':lens._has_shear12, 
+                    'has_kappa':lens._has_kappa, 'has_rho':lens._has_rho, 
+                    'sorted_offsets':lens._sorted_offsets, 
+                    'unset':{key:value for key, value in values.items() if key not in arrays}}
+            self._block = shared_arrays(arrays, meta=meta)
+        else:
+            self._block = shared_arrays(name=name)
+        
+        meta = self._block.meta
+        arrays = self._block.arrays
+        super().__init__(meta['zl'], cosmo=meta['cosmo'])
+        for key in self._shared:
+            setattr(self, '_{}'.format(key), arrays[key] if key in arrays else meta['unset'][key])
+        self._sorter = arrays['sorter']
+        self._sorted_sums = [arrays['r_sorted'], arrays['sorted_sums']]
+        self._sorted_offsets = meta['sorted_offsets']
+        self._has_shear12 = meta['has_shear12']
+        self._has_kappa = meta['has_kappa']
+        self._has_rho = meta['has_rho']
+        self._has_sources = True
+        self.set_radial_cuts(None, None)
+
+    
+    @property
+    def name(self): return self._block.name
+
+    @property
+    def nbytes(self): return self._block.nbytes
+
+    @property
+    def owner(self): return self._block.owner
+
+
+    def close(self):
+        '''
+        Releases this process's views of the shared source data. The system cannot be used after.
+        '''
+        for key in self._shared: setattr(self, '_{}'.format(key), None)
+        self._sorter = self._sorted_sums = self._radial_mask = None
+        self._has_sources = False
+        self._block.close()
+
+
+    def unlink(self):
+        '''
+        Releases this process's views of the shared source data, and requests that the shared 
+        memory block be freed, which happens once every process has released it. Should be called 
+        once, by the process which created the system.
+        '''
+        self.close()
+        self._block._shm.unlink()
+
+
+    def __reduce__(self):
+        return (shared_obs_lens_system, (None, self.name))
@@ -0,0 +1,156 @@
+import sys
+import json
+import numpy as np
+from journal import read_journals
+
+'''
+This module reduces the per-halo telemetry of a fitting campaign into a report of its throughput,
+its load balance across ranks (or pool workers), and its slowest and most pathological halos, for
+sizing allocations and finding cutouts which cost far more than their size suggests. Each rank of
+the fitting driver appends one record per halo to its own log of JSON lines (written with a
+`journal.journal`), giving:
+
+    'halo'         the name of the halo cutout
+    'rank'         the MPI rank which processed it
+    'worker'       the ID of the process which fit it (a pool worker, or the rank itself)
+    'nsources'     the number of sources fit
+    'nconfigs'     the number of fit configurations run
+    'nfev'         the total number of residual evaluations of its fits
+    'bytes_read'   the number of bytes of source data read
+    'start', 'end' the Unix times at which the rank started and finished processing it
+    'time'         the wall time in seconds spent on it by the process which fit it
+    'stages'       the wall time in seconds of each stage; 'read' and 'prepare' (the critical
+                   surface densities and sorted sums) of the cutout, 'wait' for a cutout being read
+                   in the background, 'fit', and 'other' (plotting and writing)
+
+The reads of prefetched cutouts overlap the fits of the previous ones, such that the 'read' and
+'prepare' stages are not included in 'time' for those halos (only 'wait' is). Usage is as follows:
+
+    report = telemetry.summarize(journal.read_journals('{}/telemetry/*.jsonl'.format(lensing_dir)))
+    telemetry.print_report(report)
+
+or, from the command line,
+
+    python telemetry.py <telemetry log glob> [report json file]
+'''
+
+stages = ['read', 'prepare', 'wait', 'fit', 'other']
+
+def summarize(records, nslowest=10, outlier_factor=5):
+    '''
+    Reduces per-halo telemetry records into a report of the campaign.
+
+    Parameters
+    ----------
+    records : list of dicts
+        The records of all ranks (e.g. as returned by `journal.read_journals()`).
+    nslowest : int, optional
+        The number of slowest halos to report. Defaults to `10`.
+    outlier_factor : float, optional
+        Halos whose time per source exceeds the median over all halos by more than this factor are
+        reported as outliers. Defaults to `5`.
+
+    Returns
+    -------
+    dict
+        The number of halos `'nhalos'`, sources `'nsources'`, and bytes read `'bytes_read'`; the
+        wall time `'span'` in seconds from the first start to the last finish, and the throughput
+        `'halos_per_s'`, `'sources_per_s'`, and `'bytes_per_s'` over it; the total time of each
+        stage `'stages'`; one entry per process `'workers'`, giving its `'rank'`, `'worker'`,
+        `'nhalos'`, `'nsources'`, and `'busy'` and `'idle'` time in the span; the ratio of the
+        maximum to the mean busy time `'imbalance'`; and the `'slowest'` halos, and the
+        `'outliers'` in time per source, as lists of records (with an added `'s_per_msource'`),
+        from slowest to fastest. Serializable by `json`.
+    '''
+    if(len(records) == 0):
+        return {'nhalos':0, 'nsources':0, 'bytes_read':0, 'span':0.0, 'halos_per_s':np.nan,
+                'sources_per_s':np.nan, 'bytes_per_s':np.nan, 'stages':{}, 'workers':[],
+                'imbalance':np.nan, 'slowest':[], 'outliers':[]}
+
+    span = max([r['end'] for r in records]) - min([r['start'] for r in records])
+    nsources = int(sum([r['nsources'] for r in records]))
+    bytes_read = int(sum([r['bytes_read'] for r in records]))
+    per_second = lambda n: n / span if span > 0 else np.nan
+    report = {'nhalos':len(records), 'nsources':nsources, 'bytes_read':bytes_read, 'span':span,
+              'halos_per_s':per_second(len(records)), 'sources_per_s':per_second(nsources),
+              'bytes_per_s':per_second(bytes_read),
+              'stages':{s:float(sum([r['stages'].get(s, 0.0) for r in records])) for s in stages}}
+
+    # load balance
+    workers = {}
+    for r in records:
+        w = workers.setdefault((r['rank'], r['worker']), {'rank':r['rank'], 'worker':r['worker'],
+                                                         'nhalos':0, 'nsources':0, 'busy':0.0})
+        w['nhalos'] += 1
+        w['nsources'] += r['nsources']
+        w['busy'] += r['time']
+    workers = sorted(workers.values(), key=lambda w: (w['rank'], w['worker']))
+    for w in workers: w['idle'] = max(span - w['busy'], 0.0)
+    busy = np.array([w['busy'] for w in workers])
+    report['workers'] = workers
+    report['imbalance'] = float(np.max(busy) / np.mean(busy)) if np.mean(busy) > 0 else np.nan
+
+    # stragglers, by total time, and by time per source
+    records = [dict(r, s_per_msource=1e6 * r['time'] / max(r['nsources'], 1)) for r in records]
+    by_time = sorted(records, key=lambda r: r['time'], reverse=True)
+    report['slowest'] = by_time[:nslowest]
+    median = np.median([r['s_per_msource'] for r in records])
+    report['outliers'] = sorted([r for r in records if r['s_per_msource'] > outlier_factor * median],
+                                key=lambda r: r['s_per_msource'], reverse=True)
+    return report
+
+
+def print_report(report):
+    '''
+    Prints a report given by `summarize()`.
+
+    Parameters
+    ----------
+    report : dict
+        The report.
+    '''
+    if(report['nhalos'] == 0):
+        print('telemetry: no halos processed')
+        return
+    print('telemetry: {} halos, {:.3g} sources, {:.3g} GB read in {:.2f} s; {:.3g} halos/s, '\
+          '{:.3g} sources/s, {:.3g} MB/s'.format(
+          report['nhalos'], report['nsources'], report['bytes_read']/1e9, report['span'],
+          report['halos_per_s'], report['sources_per_s'], report['bytes_per_s']/1e6))
+    print('time by stage: {}'.format(', '.join(['{} {:.2f} s'.format(s, t)
+                                                for s, t in report['stages'].items()])))
+    for w in report['workers']:
+        print('rank {} (pid {}): {} halos, {:.3g} sources, busy {:.2f} s, idle {:.2f} s'.format(
+              w['rank'], w['worker'], w['nhalos'], w['nsources'], w['busy'], w['idle']))
+    print('load imbalance (max/mean busy): {:.2f}'.format(report['imbalance']))
+    print('slowest halos:')
+    for r in report['slowest']:
+        print('    {} (rank {}): {:.2f} s, {} sources, {:.3g} s per million sources'.format(
+              r['halo'], r['rank'], r['time'], r['nsources'], r['s_per_msource']))
+    if(len(report['outliers']) > 0):
+        print('outliers in time per source:')
+        for r in report['outliers']:
+            print('    {} (rank {}): {:.3g} s per million sources ({:.2f} s, {} sources, {} '\
+                  'residual evaluations)'.format(r['halo'], r['rank'], r['s_per_msource'],
+                                                  r['time'], r['nsources'], r['nfev']))
+
+
+def write_report(report, path):
+    '''
+    Writes a report given by `summarize()` to a JSON file.
+
+    Parameters
+    ----------
+    report : dict
+        The report.
+    path : string
+        The output file path.
+    '''
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=lambda obj: obj.item())
+
+
+if __name__ == '__main__':
+    # usage: python telemetry.py <telemetry log glob> [report json file]
+    report = summarize(read_journals(sys.argv[1]))
+    print_report(report)
+    if(len(sys.argv) > 2): write_report(report, sys.argv[2])
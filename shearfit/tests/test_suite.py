@@ -1,6 +1,14 @@
+import os
+import sys
+import pickle
+import tempfile
+import threading
 import pdb
 import esutil
+import h5py
 import numpy as np
+from scipy import stats
+from concurrent import futures
 from unittest import TestCase
 import astropy.units as units
 import clusterlensing.nfw as cl
@@ -12,6 +20,25 @@ from ..lensing_system import obs_lens_system
 from ..mass_concentration import child2018 as cm
 from lenstronomy.GalKin.cosmo import Cosmo as lenstronomy
 
+# the fitting modules import one another by name, rather than relative to the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fit_profile
+import example_run
+import instrumentation
+import results_store
+import csv
+import json
+import journal
+import telemetry
+import backends
+import fit_summary
+import scheduling
+import cutout_manifest
+import parallel_fitting_driver
+from fit_cache import fit_cache
+from prefetch import prefetcher
+from shared_lens_system import shared_obs_lens_system
+
 
 def _test_halo():
     '''
@@ -26,6 +53,98 @@ def _test_halo():
     return halo
 
 
+def _test_lens(nsources=2000, seed=0, noisef=0.1):
+    '''
+    Returns a lensing system with background sources sheared by an NFW halo, plus shape noise, to 
+    use for the fitting tests provided here
+
+    Parameters
+    ----------
+    nsources : int
+        The number of background sources
+    seed : int
+        The seed of the random source positions, redshifts, and noise
+    noisef : float
+        The variance of the noise, as a fraction of the true tangential shear
+
+    Returns
+    -------
+    lens : `obs_lens_system` object
+        The lensing system
+    true_NFW : `NFW` object
+        The halo which sheared the sources
+    '''
+    halo = {'r':1.2, 'c':4.0, 'zl':0.3}
+    rng = np.random.default_rng(seed)
+    fov = 600
+    theta1 = (rng.random(nsources) - 0.5) * fov
+    theta2 = (rng.random(nsources) - 0.5) * fov
+    zs = halo['zl'] + 0.1 + rng.random(nsources)
+    
+    lens = obs_lens_system(halo['zl'])
+    lens.set_background(theta1, theta2, zs, yt=np.zeros(nsources))
+    true_NFW = NFW(halo['r'], halo['c'], halo['zl'])
+    yt = true_NFW.delta_sigma(lens.get_background()['r']) / lens.calc_sigma_crit()
+    lens.yt = yt * (1 + np.sqrt(noisef) * rng.standard_normal(nsources))
+    return lens, true_NFW
+
+
+def _write_test_cutout(cutout_dir, plane_z, nper_plane, seed=0, zl=0.5, box_radius=100.0):
+    '''
+    Writes a synthetic halo cutout, of the form read by `_read_sim_data` in `example_run.py`, with 
+    random sources, some of which lie outside of the FOV, to use for the tests provided here
+
+    Parameters
+    ----------
+    cutout_dir : string
+        The directory to write the cutout to
+    plane_z : 1d numpy array
+        The redshift of each source plane
+    nper_plane : int
+        The number of sources per plane
+    seed : int
+        The seed of the source data
+    zl : float
+        The halo redshift
+    box_radius : float
+        The half-width of the cutout in arcseconds
+
+    Returns
+    -------
+    planes : list of dicts
+        The source positions `'xr1'`, `'xr2'`, shears `'sr1'`, `'sr2'`, and convergence `'kr0'` 
+        written for each plane
+    '''
+    rng = np.random.default_rng(seed)
+    with open(os.path.join(cutout_dir, 'properties.csv'), 'w') as f:
+        f.write('halo_redshift,sod_halo_radius,sod_halo_cdelta,sod_halo_cdelta_error,'\
+                'sod_halo_mass,boxRadius_arcsec\n')
+        f.write('{},1.0,4.0,0.5,1e14,{}\n'.format(zl, box_radius))
+    planes = []
+    with h5py.File(os.path.join(cutout_dir, 'halo_lensing_mocks.hdf5'), 'w') as f:
+        for i in range(len(plane_z)):
+            plane = {key:rng.standard_normal(nper_plane) for key in ['sr1', 'sr2', 'kr0']}
+            plane['xr1'] = (rng.random(nper_plane) - 0.5) * 2.5 * box_radius
+            plane['xr2'] = (rng.random(nper_plane) - 0.5) * 2.5 * box_radius
+            group = f.create_group('plane{}'.format(i))
+            group['zs'] = [plane_z[i]]
+            for key, values in plane.items(): group[key] = values
+            planes.append(plane)
+    return planes
+
+
+class _rank_comm:
+    """
+    A stand-in for an MPI communicator giving only its rank and size, with which the schedules of
+    all ranks of a campaign can be computed in one process
+    """
+    def __init__(self, rank, size):
+        self.rank = rank
+        self.size = size
+    def Get_rank(self): return self.rank
+    def Get_size(self): return self.size
+
+
 class TestNFW(TestCase):
 
     def test_radius_to_mass(self, cosmo=WMAP7, tolerance=1e-6):
@@ -199,3 +318,1090 @@ class TestNFW(TestCase):
         # compute fractional difference and assert error tolerance
         fdiff = (this_rho - halotools_rho) / (halotools_rho)
         self.assertTrue( max(fdiff) <= tolerance)
+    
+    
+    def test_delta_sigma_grid(self, tolerance=1e-10):
+        '''
+        This function tests the vectorized differential surface density calculation of the `NFW` 
+        class in `analytic_profiles.py`, against the scalar calculation of the same class, for 
+        a grid of radii and concentrations
+        
+        Parameters
+        ----------
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the vectorized 
+            and scalar calculations is above this value, then the test is failed.
+        '''
+        
+        # declare halo objects and parameter grid
+        halo = _test_halo()
+        r_bins = np.linspace(0.1, halo['r']*3, 100)
+        this_NFW = NFW(halo['r'], halo['c'], halo['zl'])
+        [grid_r, grid_c] = np.meshgrid(np.linspace(0.5, 4, 5), np.linspace(1, 10, 4))
+        
+        # compute differential surface mass density over the full grid at once
+        grid_dsig = this_NFW.delta_sigma_grid(r_bins, grid_r, grid_c)
+        self.assertEqual(grid_dsig.shape, (4, 5, len(r_bins)))
+        
+        # compute fractional difference at each grid point and assert error tolerance
+        for i in range(grid_r.shape[0]):
+            for j in range(grid_r.shape[1]):
+                point_NFW = NFW(grid_r[i][j], grid_c[i][j], halo['zl'])
+                point_dsig = point_NFW.delta_sigma(r_bins)
+                fdiff = np.abs(grid_dsig[i][j] - point_dsig) / np.abs(point_dsig)
+                self.assertTrue( max(fdiff) <= tolerance)
+
+
+
+class TestFitting(TestCase):
+
+    def test_gridscan_adaptive(self, n=65, n_coarse=9, tolerance=0.05):
+        '''
+        This function tests the adaptive parameter sweep of `fit_nfw_profile_gridscan` in 
+        `fit_profile.py`, against the dense sweep, over the default concentration bounds (which 
+        include :math:`c = 0`, where the profile is undefined)
+        
+        Parameters
+        ----------
+        n : int
+            The number of sample points in each dimension of the dense grid; `n - 1` should be a 
+            power of two multiple of `n_coarse - 1`, such that the adaptive samples lie on it
+        n_coarse : int
+            The number of sample points in each dimension of the initial adaptive grid
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the minimum cost
+            of the adaptive and dense sweeps is above this value, then the test is failed.
+        '''
+        
+        # scan the same data densely and adaptively
+        lens, true_NFW = _test_lens()
+        guess = NFW(0.75, 3.0, lens.zl)
+        [grid, cost] = fit_profile.fit_nfw_profile_gridscan(lens, guess, [0.3, 2.0], n=n, 
+                                                            bin_data=True, bins=15)
+        [_, _, samples] = fit_profile.fit_nfw_profile_gridscan(lens, guess, [0.3, 2.0], n=n, 
+                                                               bin_data=True, bins=15, adaptive=True,
+                                                               n_coarse=n_coarse)
+        
+        # the valley must have been refined beyond the coarse grid
+        self.assertTrue( len(samples) > n_coarse**2)
+        
+        # compare the minima, and their locations to within one grid cell
+        k = np.unravel_index(np.nanargmin(cost), cost.shape)
+        best = samples[np.nanargmin(samples[:,2])]
+        fdiff = (best[2] - cost[k]) / cost[k]
+        self.assertTrue( abs(fdiff) <= tolerance)
+        self.assertTrue( abs(best[0] - grid[0][k]) <= 1.7/(n-1) * (1 + 1e-9))
+        self.assertTrue( abs(best[1] - grid[1][k]) <= 10/(n-1) * (1 + 1e-9))
+
+
+    def test_gridscan_streaming(self, n=50, tile_size=1, tolerance=1e-10):
+        '''
+        This function tests the tiled parameter sweep of `fit_nfw_profile_gridscan_streaming` in 
+        `fit_profile.py`, against the dense sweep of `fit_nfw_profile_gridscan`, over the default 
+        concentration bounds (which include :math:`c = 0`, where the profile is undefined)
+        
+        Parameters
+        ----------
+        n : int
+            The number of sample points in each dimension of the grid
+        tile_size : int
+            The number of grid rows per tile of the streaming sweep; with one, the first tile is
+            undefined throughout
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the streaming and 
+            dense reductions is above this value, then the test is failed.
+        '''
+        
+        # scan the same data densely and in tiles
+        lens, true_NFW = _test_lens()
+        guess = NFW(0.75, 3.0, lens.zl)
+        [grid, cost] = fit_profile.fit_nfw_profile_gridscan(lens, guess, [0.3, 2.0], n=n, 
+                                                            bin_data=True, bins=15)
+        stream = fit_profile.fit_nfw_profile_gridscan_streaming(lens, guess, [0.3, 2.0], n=n, 
+                                                                bin_data=True, bins=15, 
+                                                                tile_size=tile_size)
+        
+        # compare the minimum and its location
+        cost = np.where(np.isfinite(cost), cost, np.inf)
+        k = np.unravel_index(np.argmin(cost), cost.shape)
+        self.assertEqual(stream['argmin'], [k[0], k[1]])
+        self.assertTrue( abs(stream['cost_min'] - cost[k]) / cost[k] <= tolerance)
+        
+        # compare the profile likelihoods, which are undefined only along c = 0
+        for [stream_profile, dense_profile] in [[stream['profile_r200c'], np.min(cost, axis=0)], 
+                                                [stream['profile_c'], np.min(cost, axis=1)]]:
+            finite = np.isfinite(dense_profile)
+            self.assertTrue( np.array_equal(finite, np.isfinite(stream_profile)))
+            fdiff = np.abs(stream_profile[finite] - dense_profile[finite]) / dense_profile[finite]
+            self.assertTrue( max(fdiff) <= tolerance)
+        
+        # the marginal likelihoods must be normalized, and vanish where the profile is undefined
+        for marginal in [stream['marginal_r200c'], stream['marginal_c']]:
+            self.assertTrue( np.all(np.isfinite(marginal)))
+            self.assertTrue( abs(np.sum(marginal) - 1) <= tolerance)
+        self.assertEqual(stream['marginal_c'][0], 0)
+
+
+    def test_bootstrap_executors(self, bootN=40, seed=7):
+        '''
+        This function tests that the bootstrap errors of `fit_nfw_profile_lstq` in `fit_profile.py`
+        are reproducible given a seed, regardless of whether the realizations are run serially, or 
+        distributed over a thread or process pool
+        
+        Parameters
+        ----------
+        bootN : int
+            The number of bootstrap realizations
+        seed : int
+            The seed of the bootstrap realizations
+        '''
+        
+        lens, true_NFW = _test_lens()
+        boot_err = {}
+        for executor in [None, 'thread', 'process']:
+            guess = NFW(0.75, 3.0, lens.zl)
+            [res, boot_err[executor]] = fit_profile.fit_nfw_profile_lstq(
+                                        lens, guess, [0.3, 2.0], bin_data=True, bins=15, bootstrap=True, 
+                                        bootN=bootN, seed=seed, executor=executor, nworkers=2)
+            self.assertEqual(res.boot_n, bootN)
+        
+        # the errors must be identical, not only within noise
+        self.assertTrue( np.array_equal(boot_err[None], boot_err['thread']))
+        self.assertTrue( np.array_equal(boot_err[None], boot_err['process']))
+
+
+    def test_bootstrap_weights_engine(self, bootN=300, seed=7, tolerance=0.15):
+        '''
+        This function tests the `'weights'` bootstrap engine of `fit_nfw_profile_lstq` in 
+        `fit_profile.py`, against the `'resample'` engine, which re-bins each realization
+        
+        Parameters
+        ----------
+        bootN : int
+            The number of bootstrap realizations
+        seed : int
+            The seed of the bootstrap realizations
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the bootstrap errors 
+            of the two engines is above this value, then the test is failed. The engines draw 
+            different realizations, so this allows for the Monte-Carlo noise of the errors.
+        '''
+        
+        lens, true_NFW = _test_lens()
+        boot_err = {}
+        for engine in ['resample', 'weights']:
+            guess = NFW(0.75, 3.0, lens.zl)
+            [res, boot_err[engine]] = fit_profile.fit_nfw_profile_lstq(
+                                      lens, guess, [0.3, 2.0], bin_data=True, bins=15, bootstrap=True, 
+                                      bootN=bootN, seed=seed, boot_engine=engine)
+        
+        fdiff = (boot_err['weights'] - boot_err['resample']) / boot_err['resample']
+        self.assertTrue( max(np.abs(fdiff)) <= tolerance)
+
+
+    def test_bootstrap_warm_start(self, bootN=100, seed=7, tolerance=1e-4):
+        '''
+        This function tests the warm-started bootstrap of `fit_nfw_profile_lstq` in `fit_profile.py`,
+        against the bootstrap started from the initial parameters, over the same realizations
+        
+        Parameters
+        ----------
+        bootN : int
+            The number of bootstrap realizations
+        seed : int
+            The seed of the bootstrap realizations
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the warm and cold 
+            bootstrap errors is above this value, then the test is failed.
+        '''
+        
+        lens, true_NFW = _test_lens()
+        boot_err = {}
+        boot_nfev = {}
+        for warm_start in [False, True, 'previous']:
+            guess = NFW(0.75, 3.0, lens.zl)
+            [res, boot_err[warm_start]] = fit_profile.fit_nfw_profile_lstq(
+                                          lens, guess, [0.3, 2.0], bin_data=True, bins=15, 
+                                          bootstrap=True, bootN=bootN, seed=seed, warm_start=warm_start)
+            boot_nfev[warm_start] = res.boot_nfev
+        
+        # the same realizations must give the same errors, with fewer residual evaluations
+        for warm_start in [True, 'previous']:
+            fdiff = (boot_err[warm_start] - boot_err[False]) / boot_err[False]
+            self.assertTrue( max(np.abs(fdiff)) <= tolerance)
+            self.assertTrue( boot_nfev[warm_start] < boot_nfev[False])
+
+
+    def test_fisher_errors(self, bootN=300, seed=7, tolerance=0.25):
+        '''
+        This function tests the Fisher matrix errors of `fit_nfw_profile_lstq` in `fit_profile.py`,
+        against the bootstrap errors, for a binned fit
+        
+        Parameters
+        ----------
+        bootN : int
+            The number of bootstrap realizations
+        seed : int
+            The seed of the bootstrap realizations
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the Fisher and 
+            bootstrap errors is above this value, then the test is failed.
+        '''
+        
+        lens, true_NFW = _test_lens()
+        guess = NFW(0.75, 3.0, lens.zl)
+        [res, fisher_err] = fit_profile.fit_nfw_profile_lstq(lens, guess, [0.3, 2.0], bin_data=True, 
+                                                             bins=15, errors='fisher')
+        self.assertEqual(res.cov.shape, (2, 2))
+        self.assertTrue( np.allclose(np.sqrt(np.diag(res.cov)), fisher_err))
+        
+        guess = NFW(0.75, 3.0, lens.zl)
+        [res, boot_err] = fit_profile.fit_nfw_profile_lstq(lens, guess, [0.3, 2.0], bin_data=True, 
+                                                           bins=15, bootstrap=True, bootN=bootN, 
+                                                           seed=seed, warm_start=True)
+        fdiff = (np.array(fisher_err) - boot_err) / boot_err
+        self.assertTrue( max(np.abs(fdiff)) <= tolerance)
+        
+        # the two estimates cannot be combined
+        with self.assertRaises(Exception):
+            fit_profile.fit_nfw_profile_lstq(lens, guess, [0.3, 2.0], bin_data=True, bins=15, 
+                                             bootstrap=True, errors='fisher')
+
+
+    def test_mcmc_checkpoint(self, nwalkers=16, nsteps=40, seed=3):
+        '''
+        This function tests the checkpointing of `fit_nfw_profile_mcmc` in `fit_profile.py`; that a 
+        chain resumed from a checkpoint is identical to an uninterrupted one, and that resuming with
+        different sampler settings is refused
+        
+        Parameters
+        ----------
+        nwalkers : int
+            The number of walkers
+        nsteps : int
+            The number of steps of the full chain
+        seed : int
+            The seed of the sampler
+        '''
+        
+        lens, true_NFW = _test_lens()
+        kwargs = {'bin_data':True, 'bins':15, 'nwalkers':nwalkers, 'nburn':0, 'seed':seed, 
+                  'checkpoint_every':10}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            full = fit_profile.fit_nfw_profile_mcmc(lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], 
+                                                    nsteps=nsteps, **kwargs)
+            
+            # interrupt a chain halfway, and resume it
+            checkpoint = os.path.join(tmp_dir, 'chain.npz')
+            fit_profile.fit_nfw_profile_mcmc(lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], 
+                                             nsteps=nsteps//2, checkpoint=checkpoint, **kwargs)
+            resumed = fit_profile.fit_nfw_profile_mcmc(lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], 
+                                                       nsteps=nsteps, checkpoint=checkpoint, **kwargs)
+            self.assertTrue( np.array_equal(full['chain'], resumed['chain']))
+            self.assertTrue( np.array_equal(full['acceptance_fraction'], 
+                                            resumed['acceptance_fraction']))
+            
+            # resuming with a different ensemble, model, or bounds must fail
+            for changes in [{'nwalkers':nwalkers+2}, {'cM_relation':'child2018'}, 
+                            {'r200_bounds':[0.3, 2.5]}, {'nsteps':nsteps//4}]:
+                args = dict(kwargs, r200_bounds=[0.3, 2.0], nsteps=nsteps, checkpoint=checkpoint)
+                args.update(changes)
+                with self.assertRaisesRegex(ValueError, 'cannot resume'):
+                    fit_profile.fit_nfw_profile_mcmc(lens, NFW(0.75, 3.0, lens.zl), **args)
+
+
+    def test_fit_batched(self, nhalos=4, tolerance=1e-5):
+        '''
+        This function tests the batched fitting of `fit_nfw_profiles_batched` in `fit_profile.py`, 
+        against fitting each profile separately with `fit_nfw_profile_lstq`, and that a profile 
+        which can not be fit (with no valid bins) is reported as stalled, rather than converged
+        
+        Parameters
+        ----------
+        nhalos : int
+            The number of profiles to fit at once
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the batched and 
+            separate best fit parameters is above this value, then the test is failed.
+        '''
+        
+        # bin the data of several lenses, with different sources and noise
+        r, dSigma, lstq_fits = [], [], []
+        for seed in range(nhalos):
+            lens, true_NFW = _test_lens(seed=seed, noisef=0.05*(seed+1))
+            binned_data = lens.calc_delta_sigma_binned(nbins=15)
+            r.append(binned_data['r_mean'])
+            dSigma.append(binned_data['delta_sigma_mean'])
+            [res, _] = fit_profile.fit_nfw_profile_lstq(lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], 
+                                                        bin_data=True, bins=15)
+            lstq_fits.append(res.x)
+        
+        r.append(r[0])
+        dSigma.append(np.full(len(r[0]), np.nan))
+        batched = fit_profile.fit_nfw_profiles_batched(np.array(r), np.array(dSigma), lens.zl, 
+                                                       [0.3, 2.0], r200c_init=0.75, c_init=3.0)
+        self.assertEqual(batched['converged'].tolist(), [True] * nhalos + [False])
+        self.assertEqual(batched['stalled'].tolist(), [False] * nhalos + [True])
+        fdiff = (np.array([batched['r200c'], batched['c']]).T[:nhalos] - lstq_fits) / lstq_fits
+        self.assertTrue( np.max(np.abs(fdiff)) <= tolerance)
+
+
+
+    def test_fit_cache(self):
+        '''
+        This function tests the caching of fit results by `fit_nfw_profile_lstq` in `fit_profile.py`,
+        with the `fit_cache` class in `fit_cache.py`; that a repeated fit is read from the cache, and
+        that a change to either the source data or the fit configuration is not, nor is a bootstrap 
+        without a seed
+        '''
+        
+        lens, true_NFW = _test_lens()
+        def fit(cache, rmin=0, **kwargs):
+            profile = NFW(0.75, 3.0, lens.zl)
+            [res, _] = fit_profile.fit_nfw_profile_lstq(lens, profile, [0.3, 2.0], rmin=rmin, 
+                                                        bin_data=True, bins=15, cache=cache, **kwargs)
+            return res, profile
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = fit_cache(tmp_dir)
+            [res, profile] = fit(cache)
+            self.assertEqual([cache.hits, cache.misses], [0, 1])
+            
+            # the same fit is a hit, and gives the same result
+            [cached_res, cached_profile] = fit(cache)
+            self.assertEqual([cache.hits, cache.misses], [1, 1])
+            self.assertTrue( np.array_equal(res.x, cached_res.x))
+            self.assertEqual([profile.r200c, profile.c], [cached_profile.r200c, cached_profile.c])
+            
+            # a change to the configuration, or to the data, is a miss
+            fit(cache, rmin=0.1)
+            self.assertEqual([cache.hits, cache.misses], [1, 2])
+            lens.yt = lens.yt * 1.01
+            fit(cache)
+            self.assertEqual([cache.hits, cache.misses], [1, 3])
+            
+            # unless refreshing, in which case the cache is never read
+            fit(cache)
+            self.assertEqual([cache.hits, cache.misses], [2, 3])
+            refreshed = fit_cache(tmp_dir, refresh=True)
+            fit(refreshed)
+            self.assertEqual([refreshed.hits, refreshed.misses], [0, 1])
+            self.assertEqual(len(os.listdir(tmp_dir)), 3)
+            
+            # a seeded bootstrap is cached, and an unseeded one neither read nor written
+            for _ in range(2): fit(cache, bootstrap=True, bootN=20, seed=5)
+            self.assertEqual([cache.hits, cache.misses], [3, 4])
+            [res, profile] = fit(cache, bootstrap=True, bootN=20)
+            [res2, profile2] = fit(cache, bootstrap=True, bootN=20)
+            self.assertEqual([cache.hits, cache.misses], [3, 4])
+            self.assertEqual(len(os.listdir(tmp_dir)), 4)
+            self.assertNotEqual(profile.r200c_err, profile2.r200c_err)
+
+
+
+    def test_instrumentation(self):
+        '''
+        This function tests the counters and stage timers of `instrumentation.py`, as recorded by 
+        `fit_nfw_profile_lstq` in `fit_profile.py`
+        '''
+        
+        lens, true_NFW = _test_lens()
+        instrumentation.enable()
+        try:
+            instrumentation.reset()
+            [res, _] = fit_profile.fit_nfw_profile_lstq(lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], 
+                                                        bin_data=True, bins=15)
+            report = instrumentation.report()
+            
+            # every residual evaluation is counted, including the two per finite-difference Jacobian
+            self.assertEqual(report['counters']['nfw_fit_residual'], res.nfev + 2*res.njev)
+            self.assertEqual(report['timers']['lstq_fit']['calls'], 1)
+            self.assertTrue( report['timers']['lstq_fit']['time'] > 0)
+            
+            total = instrumentation.aggregate([report, report])
+            self.assertEqual(total['nreports'], 2)
+            self.assertEqual(total['counters']['nfw_fit_residual'], 
+                             2 * report['counters']['nfw_fit_residual'])
+        finally:
+            instrumentation.disable()
+        
+        # nothing is recorded once disabled
+        fit_profile.fit_nfw_profile_lstq(lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], bin_data=True, 
+                                         bins=15)
+        self.assertEqual(instrumentation.report(), report)
+        instrumentation.reset()
+
+
+    def test_bootstrap_early_stopping(self, bootN=1000, boot_tol=0.1, boot_batch=50, seed=7):
+        '''
+        This function tests the convergence-based early stopping of the bootstrap of 
+        `fit_nfw_profile_lstq` in `fit_profile.py`; that it stops once the errors are precise to 
+        `boot_tol`, and gives the errors of the first realizations of the full bootstrap
+        
+        Parameters
+        ----------
+        bootN : int
+            The maximum number of bootstrap realizations
+        boot_tol : float
+            The target relative precision of the bootstrap errors
+        boot_batch : int
+            The number of realizations per batch
+        seed : int
+            The seed of the bootstrap realizations
+        '''
+        
+        lens, true_NFW = _test_lens()
+        [res, boot_err] = fit_profile.fit_nfw_profile_lstq(
+                          lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], bin_data=True, bins=15, 
+                          bootstrap=True, bootN=bootN, boot_tol=boot_tol, boot_batch=boot_batch, 
+                          seed=seed)
+        self.assertTrue( res.boot_n < bootN)
+        self.assertEqual(res.boot_n % boot_batch, 0)
+        self.assertTrue( np.all(res.boot_err_rel <= boot_tol))
+        
+        [_, first_err] = fit_profile.fit_nfw_profile_lstq(
+                         lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], bin_data=True, bins=15, 
+                         bootstrap=True, bootN=res.boot_n, seed=seed)
+        self.assertTrue( np.array_equal(boot_err, first_err))
+
+
+    def test_gridscan_cM(self, n=40, tolerance=1e-8):
+        '''
+        This function tests the vectorized parameter sweep along a c-M relation of 
+        `fit_nfw_profile_gridscan` in `fit_profile.py`, against scalar evaluations of the `NFW` class 
+        at each sample point, and against the least squares fit along the same relation
+        
+        Parameters
+        ----------
+        n : int
+            The number of :math:`r_{200c}` samples
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the vectorized and 
+            scalar costs is above this value, then the test is failed.
+        '''
+        
+        lens, true_NFW = _test_lens()
+        [rsamp, cost, csamp] = fit_profile.fit_nfw_profile_gridscan(
+                               lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], n=n, bin_data=True, bins=15, 
+                               cM_relation='child2018')
+        self.assertEqual(cost.shape, (n,))
+        
+        binned_data = lens.calc_delta_sigma_binned(nbins=15)
+        for i in range(n):
+            point_NFW = NFW(rsamp[i], csamp[i], lens.zl)
+            point_cost = np.sum((point_NFW.delta_sigma(binned_data['r_mean']) - 
+                                 binned_data['delta_sigma_mean'])**2)
+            self.assertTrue( abs(cost[i] - point_cost) / point_cost <= tolerance)
+        
+        # the minimum lies within one sample of the least squares fit along the relation
+        lstq_NFW = NFW(0.75, 3.0, lens.zl)
+        fit_profile.fit_nfw_profile_lstq(lens, lstq_NFW, [0.3, 2.0], bin_data=True, bins=15, 
+                                         cM_relation='child2018')
+        self.assertTrue( abs(rsamp[np.argmin(cost)] - lstq_NFW.r200c) <= rsamp[1] - rsamp[0])
+        
+        # marginalizing over the scatter of the relation does not move the valley
+        [_, cost_marg, _] = fit_profile.fit_nfw_profile_gridscan(
+                            lens, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], n=n, bin_data=True, bins=15, 
+                            cM_relation='child2018', marginalize_scatter=True)
+        self.assertTrue( np.all(np.isfinite(cost_marg)))
+        self.assertTrue( abs(np.argmin(cost_marg) - np.argmin(cost)) <= 1)
+
+
+    def test_fit_log_mass(self, tolerance=1e-5):
+        '''
+        This function tests the fits of `fit_nfw_profile_lstq` in `fit_profile.py` in the log-mass 
+        parameterization, against those in the :math:`(r_{200c}, c)` parameterization, with and 
+        without a c-M relation, as well as the mass to radius conversion of the `NFW` class in 
+        `analytic_profiles.py` which it uses
+        
+        Parameters
+        ----------
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the best fit 
+            parameters or Fisher errors of the two parameterizations is above this value, then 
+            the test is failed.
+        '''
+        
+        lens, true_NFW = _test_lens()
+        for cM_relation in [None, 'child2018']:
+            fits = []
+            for log_mass in [False, True]:
+                profile = NFW(0.75, 3.0, lens.zl)
+                [_, err] = fit_profile.fit_nfw_profile_lstq(lens, profile, [0.3, 2.0], bin_data=True, 
+                                                            bins=15, cM_relation=cM_relation, 
+                                                            log_mass=log_mass, errors='fisher')
+                fits.append(np.array([profile.r200c, profile.c, err[0], err[1]]))
+            fdiff = (fits[1] - fits[0]) / fits[0]
+            self.assertTrue( max(np.abs(fdiff)) <= tolerance)
+        
+        # the conversion from mass to radius inverts the conversion from radius to mass, including 
+        # after a change of redshift, which invalidates the cached critical density
+        r200c = np.linspace(0.3, 2.0, 10)
+        for zl in [lens.zl, 0.8]:
+            true_NFW.zl = zl
+            fdiff = (true_NFW.mass_to_radius(true_NFW.radius_to_mass(r200c)) - r200c) / r200c
+            self.assertTrue( max(np.abs(fdiff)) <= 1e-12)
+        self.assertEqual(true_NFW.radius_to_mass(1.0), NFW(1.0, 4.0, 0.8).radius_to_mass())
+
+
+    def test_delta_sigma_binned(self, nbins=12, tolerance=1e-8):
+        '''
+        This function tests the binned differential surface density of the `obs_lens_system` class 
+        in `lensing_system.py`, which is computed from cached prefix sums of the sorted sources, 
+        against a direct binning with `scipy.stats.binned_statistic`, under several radial cuts, and
+        after the source data changes
+        
+        Parameters
+        ----------
+        nbins : int
+            The number of radial bins
+        tolerance : float
+            The error tolerance to assert; if the fractional difference between the cached and 
+            direct binning is above this value, then the test is failed.
+        '''
+        
+        lens, true_NFW = _test_lens()
+        for [rmin, rmax, scale] in [[0, None, 1], [0.2, 1.5, 1], [0.5, None, 1], [0.2, 1.5, 2]]:
+            if(scale != 1): lens.yt = lens.yt * scale
+            lens.set_radial_cuts(rmin, rmax)
+            binned_data = lens.calc_delta_sigma_binned(nbins=nbins, return_std=True)
+            
+            r = lens.get_background()['r']
+            delta_sigma = lens.calc_delta_sigma()
+            for [col, values, statistic] in [['r_mean', r, 'mean'], 
+                                             ['delta_sigma_mean', delta_sigma, 'mean'], 
+                                             ['delta_sigma_std', delta_sigma, 'std']]:
+                [expected, _, _] = stats.binned_statistic(r, values, statistic=statistic, bins=nbins)
+                fdiff = np.abs(binned_data[col] - expected) / np.abs(expected)
+                self.assertTrue( np.max(fdiff) <= tolerance)
+
+
+
+    def test_read_source_planes(self, nplanes=4, nper_plane=500, seed=0):
+        '''
+        This function tests the reading of a halo cutout by `_read_sim_data` in `example_run.py`, 
+        against a direct read of every plane of a synthetic ray-trace file, with the foreground 
+        planes and the sources outside of the FOV then removed
+        
+        Parameters
+        ----------
+        nplanes : int
+            The number of source planes of the synthetic cutout
+        nper_plane : int
+            The number of sources per plane
+        seed : int
+            The seed of the synthetic source data
+        '''
+        
+        zl, box_radius = 0.5, 100.0
+        plane_z = np.linspace(0.3, 1.5, nplanes)
+        with tempfile.TemporaryDirectory() as cutout_dir:
+            # (with one plane in front of the lens)
+            planes = _write_test_cutout(cutout_dir, plane_z, nper_plane, seed=seed, zl=zl, 
+                                        box_radius=box_radius)
+            instrumentation.enable()
+            try:
+                instrumentation.reset()
+                [lens, true_profile] = example_run._read_sim_data(cutout_dir)
+                bytes_read = instrumentation.report()['counters']['hdf5_bytes_read']
+            finally:
+                instrumentation.disable()
+                instrumentation.reset()
+        
+        # select the expected sources directly
+        fov_radius = box_radius * 0.9
+        expected = {key:[] for key in ['xr1', 'xr2', 'sr1', 'sr2', 'kr0', 'zs']}
+        for plane, z in zip(planes, plane_z):
+            if(z < zl): continue
+            mask = (np.abs(plane['xr1']) < fov_radius) & (np.abs(plane['xr2']) < fov_radius)
+            for key in ['xr1', 'xr2', 'sr1', 'sr2', 'kr0']: expected[key].append(plane[key][mask])
+            expected['zs'].append(np.full(np.sum(mask), z))
+        expected = {key:np.hstack(values) for key, values in expected.items()}
+        for key in ['xr1', 'xr2']: expected[key] = (np.pi/180) * (expected[key]/3600)
+        
+        self.assertEqual(true_profile.zl, zl)
+        self.assertEqual(len(lens._zs), len(expected['zs']))
+        self.assertEqual(bytes_read, 5 * 8 * nper_plane * np.sum(plane_z >= zl))
+        for [attr, key] in [['_theta1', 'xr1'], ['_theta2', 'xr2'], ['_zs', 'zs'], ['_y1', 'sr1'], 
+                            ['_y2', 'sr2'], ['_k', 'kr0']]:
+            self.assertTrue( np.array_equal(getattr(lens, attr), expected[key]))
+
+
+
+class TestCampaign(TestCase):
+
+    def test_results_store(self):
+        '''
+        This function tests the columnar table of `results_store.py`; that columns appearing in 
+        later rows are filled in earlier ones, and that a column is widened, rather than truncated,
+        when a later value does not fit its type
+        '''
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'fits.hdf5')
+            store = results_store.results_store(path)
+            store.append({'halo':'a', 'nbins':15, 'success':True, 'r200c':1.0})
+            store.append([{'halo':'b', 'nbins':12.5, 'success':3, 'bounds':[0.3, 2.0]}, 
+                          {'halo':'c', 'nbins':None, 'r200c':'failed'}])
+            self.assertEqual(results_store.results_store(path).nrows, 3)
+            table = store.read()
+        
+        self.assertEqual(table['halo'].tolist(), ['a', 'b', 'c'])
+        self.assertTrue( np.array_equal(table['nbins'], [15, 12.5, np.nan], equal_nan=True))
+        self.assertEqual(table['success'].tolist(), [1, 3, -1])
+        self.assertEqual(table['r200c'].tolist(), ['1.0', '', 'failed'])
+        self.assertEqual(table['bounds'].tolist(), ['', '[0.3, 2.0]', ''])
+    
+    
+    def test_merge_results(self):
+        '''
+        This function tests the merging of the results files of many ranks by `merge_results` in 
+        `results_store.py`, keeping either all rows, or only the last of each identity
+        '''
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, 'fits_rank{}.hdf5'.format(i)) for i in range(3)]
+            results_store.results_store(paths[0]).append(
+                [{'halo':'a', 'rmin':0.1, 'r200c':1.0}, {'halo':'b', 'rmin':0.1, 'r200c':1.1}])
+            results_store.results_store(paths[1]).append(
+                [{'halo':'a', 'rmin':0.1, 'r200c':1.2}, {'halo':'a', 'rmin':0.2, 'r200c':0.9}])
+            results_store.results_store(paths[2]).append(
+                [{'halo':'c', 'r200c':0.8}, {'halo':'c', 'rmin':None, 'r200c':0.7}])
+            
+            merged = results_store.merge_results(paths, os.path.join(tmp_dir, 'all.hdf5'))
+            self.assertEqual(merged.read()['r200c'].tolist(), [1.0, 1.1, 1.2, 0.9, 0.8, 0.7])
+            
+            # a repeated fit replaces the earlier one, and a missing column matches its fill value
+            merged = results_store.merge_results(paths, os.path.join(tmp_dir, 'unique.hdf5'), 
+                                                 unique=['halo', 'rmin'])
+            table = merged.read()
+        self.assertEqual(table['halo'].tolist(), ['b', 'a', 'a', 'c'])
+        self.assertEqual(table['r200c'].tolist(), [1.1, 1.2, 0.9, 0.7])
+
+    
+    
+    def test_cutout_manifest(self):
+        '''
+        This function tests the scan of halo cutouts by `build_manifest` in `cutout_manifest.py`, 
+        serially, over an MPI communicator (of one rank), and with a thread pool, on synthetic cutouts 
+        which are complete, missing a density plane, or missing their properties file, and that a 
+        pattern matching no cutouts is refused
+        '''
+        
+        props_cols = ['halo_redshift', 'sod_halo_mass', 'sod_halo_radius', 'sod_halo_cdelta', 
+                      'sod_halo_cdelta_error', 'boxRadius_arcsec', 'c6', 'c7', 'c8', 'c9', 'c10']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for [halo, nplanes, ndens, props] in [['halo_a', 3, 3, True], ['halo_b', 2, 1, True], 
+                                                  ['halo_c', 2, 2, False]]:
+                cutout = os.path.join(tmp_dir, halo)
+                os.makedirs(os.path.join(cutout, 'dtfe_dens'))
+                with h5py.File(os.path.join(cutout, '{}_lensing_mocks.hdf5'.format(halo)), 'w') as f:
+                    for i in range(nplanes): f.create_group('plane{}'.format(i))['xr1'] = np.zeros(10)
+                for i in range(ndens):
+                    open(os.path.join(cutout, 'dtfe_dens', 'plane{}_dens.bin'.format(i)), 'w').close()
+                if(props):
+                    with open(os.path.join(cutout, 'properties.csv'), 'w') as f:
+                        f.write('{}\n'.format(','.join(props_cols)))
+                        f.write('0.5,1e14,{}\n'.format(','.join(['1'] * 9)))
+            
+            pattern = os.path.join(tmp_dir, 'halo*')
+            manifest = cutout_manifest.build_manifest(pattern, os.path.join(tmp_dir, 'manifest.hdf5'))
+            from mpi4py import MPI
+            ranked = cutout_manifest.build_manifest(pattern, os.path.join(tmp_dir, 'ranked.hdf5'), 
+                                                    comm=MPI.COMM_SELF)
+            with futures.ThreadPoolExecutor(2) as executor:
+                pooled = cutout_manifest.build_manifest(pattern, os.path.join(tmp_dir, 'pooled.hdf5'), 
+                                                        executor=executor)
+            with self.assertRaisesRegex(ValueError, 'no cutouts match'):
+                cutout_manifest.build_manifest(os.path.join(tmp_dir, 'none*'), 
+                                               os.path.join(tmp_dir, 'empty.hdf5'))
+            self.assertFalse( os.path.exists(os.path.join(tmp_dir, 'empty.hdf5')))
+        
+        self.assertEqual(manifest['halo'].tolist(), ['halo_a', 'halo_b', 'halo_c'])
+        self.assertEqual(manifest['valid'].tolist(), [True, False, False])
+        self.assertEqual(manifest['nsources'].tolist(), [30, 20, 20])
+        self.assertEqual(manifest['mock_depth'].tolist(), [2, 1, 1])
+        self.assertEqual(manifest['dens_depth'].tolist(), [2, 0, 1])
+        self.assertEqual(manifest['zl'][0], 0.5)
+        self.assertTrue( np.isnan(manifest['zl'][2]))
+        for other in [ranked, pooled]:
+            for name in manifest:
+                self.assertTrue( np.array_equal(manifest[name], other[name], 
+                                                equal_nan=(manifest[name].dtype == float)))
+
+    
+    
+    def test_schedules(self, n=23, numranks=4, chunk=3):
+        '''
+        This function tests the static and dynamic schedules of `scheduling.py`; that every item is
+        assigned to exactly one rank
+        
+        Parameters
+        ----------
+        n : int
+            The number of items to schedule
+        numranks : int
+            The number of ranks of the static schedule
+        chunk : int
+            The number of items taken at once from the counter of the dynamic schedule
+        '''
+        
+        # contiguous blocks differing in size by at most one item
+        static = [scheduling.static_schedule(n, _rank_comm(rank, numranks)) 
+                  for rank in range(numranks)]
+        self.assertTrue( np.array_equal(np.hstack(static), np.arange(n)))
+        self.assertTrue( np.ptp([len(indices) for indices in static]) <= 1)
+        
+        # the dynamic schedule of a single rank takes every item, in order, from the shared counter
+        from mpi4py import MPI
+        schedule = scheduling.dynamic_schedule(n, MPI.COMM_SELF, chunk=chunk)
+        self.assertEqual(list(schedule), list(range(n)))
+        self.assertEqual(schedule.count, n)
+        schedule.close()
+        
+        [balance] = scheduling.report_balance(MPI.COMM_SELF, busy_time=2.0, nitems=n, wait_time=0.5)
+        self.assertEqual([balance['rank'], balance['nitems'], balance['busy']], [0, n, 1.5])
+        self.assertTrue( balance['idle'] >= 0.5)
+    
+    
+    def test_cost_model_schedule(self, nhalos=60, numranks=3, seed=1):
+        '''
+        This function tests the cost model and longest-processing-time schedule of `scheduling.py`;
+        that a model calibrated on measured times reproduces them, and that the schedule assigns 
+        every halo to exactly one rank, with the loads it reports
+        
+        Parameters
+        ----------
+        nhalos : int
+            The number of synthetic halos
+        numranks : int
+            The number of ranks to schedule over
+        seed : int
+            The seed of the synthetic halo sizes
+        '''
+        
+        # times measured for a campaign whose costs follow known coefficients
+        rng = np.random.default_rng(seed)
+        true_model = scheduling.cost_model({'read':1e-6, 'fit':0.5, 'fit_unbinned':1e-6, 
+                                            'bootstrap':1e-2, 'plot':20.0})
+        nsources = rng.integers(1e4, 1e6, nhalos)
+        configs = [{'bin_data':True, 'bootstrap':True, 'bootN':200}, {'bin_data':False}]
+        makeplot = rng.random(nhalos) < 0.3
+        times = true_model.predict(nsources, configs, makeplot)
+        
+        # the calibration reproduces the times; terms which no halo exercises keep their values, and
+        # terms which are degenerate (here, those constant over halos) are only fixed in their sum
+        model = scheduling.cost_model()
+        rel_err = model.calibrate(model.features(nsources, configs, makeplot), times, 
+                                  prior_weight=1e-6)
+        self.assertTrue( rel_err <= 1e-4)
+        self.assertTrue( abs(model.coeffs['plot'] / 20.0 - 1) <= 1e-4)
+        self.assertEqual(model.coeffs['bootstrap_unbinned'], 
+                         scheduling._default_costs['bootstrap_unbinned'])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cost_model.json')
+            model.save(path)
+            self.assertEqual(scheduling.load_cost_model(path).coeffs, model.coeffs)
+        
+        # every halo is assigned once, in order of decreasing cost on each rank
+        costs = model.predict(nsources, configs, makeplot)
+        schedule = [scheduling.lpt_schedule(costs, _rank_comm(rank, numranks)) 
+                    for rank in range(numranks)]
+        assigned = np.hstack([indices for indices, _ in schedule])
+        self.assertTrue( np.array_equal(np.sort(assigned), np.arange(nhalos)))
+        for rank, [indices, loads] in enumerate(schedule):
+            self.assertTrue( np.all(np.diff(costs[indices]) <= 0))
+            self.assertTrue( np.isclose(loads[rank], np.sum(costs[indices])))
+        
+        # the greedy partition of a small case, which is also the optimal one
+        [indices, loads] = scheduling.lpt_schedule(np.array([7, 5, 4, 3, 1]), _rank_comm(0, 2))
+        self.assertEqual(indices.tolist(), [0, 3])
+        self.assertEqual(loads.tolist(), [10, 10])
+
+    
+    
+    def test_journal(self):
+        '''
+        This function tests the journals of completed fits of `journal.py`; that a journal cut off 
+        partway through writing a line is read up to that line, and can be appended to again
+        '''
+        
+        configs = [{'rmin':0.1, 'bins':15}, {'bins':15, 'rmin':0.2}]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log = journal.journal(os.path.join(tmp_dir, 'journal', 'run0_rank0.jsonl'))
+            log.append([{'halo':'a', 'config':journal.config_key(config)} for config in configs])
+            log.append({'halo':'b', 'config':journal.config_key(configs[0])})
+            journal.journal(os.path.join(tmp_dir, 'journal', 'run0_rank1.jsonl')).append(
+                {'halo':'c', 'config':journal.config_key(configs[1])})
+            
+            # tear the last line of the first journal
+            with open(log.path, 'rb+') as f:
+                f.truncate(os.path.getsize(log.path) - 5)
+            pattern = os.path.join(tmp_dir, 'journal', '*.jsonl')
+            done = journal.completed(journal.read_journals(pattern))
+            self.assertEqual(done, {('a', journal.config_key(configs[0])), 
+                                    ('a', journal.config_key({'rmin':0.2, 'bins':15})), 
+                                    ('c', journal.config_key(configs[1]))})
+            
+            # an entry appended after the torn line is not lost
+            journal.journal(log.path).append({'halo':'b', 'config':journal.config_key(configs[0])})
+            done = journal.completed(journal.read_journals(pattern))
+            self.assertTrue( ('b', journal.config_key(configs[0])) in done)
+            self.assertEqual(len(journal.read_journals(pattern)), 4)
+
+    
+    
+    def test_backends(self, n=10):
+        '''
+        This function tests the communicators of the execution backends of `backends.py`; that the 
+        stand-in of the pool and serial backends acts as the only rank of a campaign, and that an 
+        unknown backend is refused
+        
+        Parameters
+        ----------
+        n : int
+            The number of items to schedule
+        '''
+        
+        for backend in ['pool', 'serial']:
+            comm = backends.get_comm(backend)
+            self.assertEqual([comm.Get_rank(), comm.Get_size()], [0, 1])
+            self.assertEqual(comm.bcast({'a':1}, root=0), {'a':1})
+            self.assertEqual(comm.gather(3, root=0), [3])
+            self.assertEqual(comm.allgather(3), [3])
+            self.assertTrue( np.array_equal(scheduling.static_schedule(n, comm), np.arange(n)))
+            [balance] = scheduling.report_balance(comm, busy_time=1.0, nitems=n)
+            self.assertEqual(balance['nitems'], n)
+        
+        from mpi4py import MPI
+        self.assertTrue( backends.get_comm('mpi') is MPI.COMM_WORLD)
+        with self.assertRaises(ValueError):
+            backends.get_comm('threads')
+
+    
+    
+    def test_prefetcher(self, n=8):
+        '''
+        This function tests the reading ahead of `prefetcher` in `prefetch.py`; that items are 
+        yielded in order with their data, and that no more than `depth` items, and no more than 
+        fit under the memory cap, are loaded ahead of the item being processed. It also tests that 
+        the cost of a halo read ahead, as used to calibrate the cost model of the fitting driver, 
+        includes its read time.
+        
+        Parameters
+        ----------
+        n : int
+            The number of items
+        '''
+        
+        for [depth, max_bytes] in [[0, None], [1, None], [3, None], [3, 250]]:
+            started = []
+            threads = set()
+            def load(i):
+                started.append(i)
+                threads.add(threading.get_ident())
+                return i**2
+            loaded = prefetcher(range(n), load, depth=depth, max_bytes=max_bytes, 
+                                nbytes=lambda i: 100)
+            ahead = depth if max_bytes is None else min(depth, max_bytes // 100)
+            for k, [i, data] in enumerate(loaded):
+                self.assertEqual([i, data], [k, k**2])
+                self.assertTrue( len(started) <= k + 1 + ahead)
+            self.assertEqual(started, list(range(n)))
+            self.assertEqual(threads == {threading.get_ident()}, depth == 0)
+            self.assertTrue( loaded.wait_time >= 0)
+        
+        # an item larger than the cap is still loaded
+        loaded = prefetcher(range(3), lambda i: i, depth=2, max_bytes=10, nbytes=lambda i: 100)
+        self.assertEqual([data for _, data in loaded], [0, 1, 2])
+        
+        fit = {'time':2.0, 'read_stats':{'read_time':0.5, 'prepare_time':0.25}}
+        self.assertEqual(parallel_fitting_driver._halo_cost(fit), 2.0)
+        self.assertEqual(parallel_fitting_driver._halo_cost(dict(fit, read_ahead=True)), 2.75)
+
+    
+    
+    def test_prefetch_instrumentation(self, nper_plane=[400, 900, 300], depth=2):
+        '''
+        This function tests the instrumentation of the halos of the fitting driver whose cutouts 
+        are read ahead, by `_load_halo` in a `prefetcher`, and then fit by `_fit_halo`; that the 
+        report of each halo records its own read, rather than that of the cutout being read in the 
+        background meanwhile
+        
+        Parameters
+        ----------
+        nper_plane : list of ints
+            The number of sources per plane of each synthetic cutout
+        depth : int
+            The number of cutouts read ahead
+        '''
+        
+        plane_z = np.array([0.8, 1.0, 1.2])
+        configs = [{'rmin':0.1, 'bin_data':True, 'bins':10}]
+        fits = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cutouts = [os.path.join(tmp_dir, 'halo_{}'.format(i)) for i in range(len(nper_plane))]
+            for i, cutout in enumerate(cutouts):
+                os.makedirs(cutout)
+                _write_test_cutout(cutout, plane_z, nper_plane[i], seed=i)
+            load = lambda i: parallel_fitting_driver._load_halo(cutouts[i], False)
+            try:
+                for i, [data, read_stats] in prefetcher(range(len(cutouts)), load, depth=depth):
+                    fits.append(parallel_fitting_driver._fit_halo(
+                                cutouts[i], configs, False, os.path.join(tmp_dir, 'cache'), True, 
+                                True, False, False, data=data, read_stats=read_stats))
+            finally:
+                instrumentation.disable()
+                instrumentation.reset()
+        
+        for n, fit in zip(nper_plane, fits):
+            [read_stats, report] = [fit['read_stats'], fit['report']]
+            self.assertEqual(read_stats['bytes_read'], 5 * 8 * n * len(plane_z))
+            self.assertEqual(report['counters']['hdf5_bytes_read'], read_stats['bytes_read'])
+            self.assertEqual(report['timers']['read']['calls'], 1)
+            self.assertTrue( np.isclose(report['timers']['read']['time'], 
+                                        read_stats['read_time'] + read_stats['prepare_time']))
+            self.assertEqual(len(fit['rows']), len(configs))
+
+    
+    
+    def test_fit_summary(self, nhalos=50, seed=0):
+        '''
+        This function tests the summary of the fractional bias of a catalog of fits by `summarize` 
+        in `fit_summary.py`, against statistics computed directly for each configuration, on a 
+        catalog merged from results files
+        
+        Parameters
+        ----------
+        nhalos : int
+            The number of halos fit with each configuration
+        seed : int
+            The seed of the synthetic fit results
+        '''
+        
+        rng = np.random.default_rng(seed)
+        rows = []
+        for config in [{'rmin':0.3, 'bins':20}, {'rmin':0.3, 'bins':20, 'cM_relation':'child2018'}]:
+            for i in range(nhalos):
+                r200c_true, c_true = rng.uniform(0.5, 2), rng.uniform(2, 8)
+                rows.append(dict(config, halo='halo{}'.format(i), r200c_true=r200c_true, 
+                                 c_true=c_true, r200c=r200c_true * rng.normal(1.05, 0.1), 
+                                 c=c_true * rng.normal(0.9, 0.2), success=bool(i % 10 != 0)))
+        rows[1]['c'] = np.nan
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'fits.hdf5')
+            results_store.results_store(path).append(rows)
+            summary = fit_summary.summarize(results_store.read_results(path), 
+                                            by=['rmin', 'bins', 'cM_relation', 'not_a_column'])
+            summary_file = os.path.join(tmp_dir, 'summary.csv')
+            fit_summary.write_summary(summary, summary_file)
+            with open(summary_file) as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 2)
+        
+        # one row per configuration, where a missing c-M relation matches none
+        self.assertEqual([row['cM_relation'] for row in summary], [None, 'child2018'])
+        for k, row in enumerate(summary):
+            config_rows = rows[k*nhalos:(k+1)*nhalos]
+            used = [r for r in config_rows if r['success'] and np.isfinite(r['c'])]
+            self.assertEqual([row['nfits'], row['nused']], [nhalos, len(used)])
+            for param in ['r200c', 'c']:
+                bias = np.array([r[param] / r['{}_true'.format(param)] - 1 for r in used])
+                self.assertTrue( np.isclose(row['{}_bias_mean'.format(param)], np.mean(bias)))
+                self.assertTrue( np.isclose(row['{}_bias_median'.format(param)], np.median(bias)))
+                self.assertTrue( np.isclose(row['{}_bias_std'.format(param)], np.std(bias, ddof=1)))
+                self.assertTrue( np.isclose(row['{}_bias_sem'.format(param)], 
+                                            np.std(bias, ddof=1) / np.sqrt(len(bias))))
+
+    
+    
+    def test_telemetry(self):
+        '''
+        This function tests the reduction of per-halo telemetry by `summarize` in `telemetry.py`, 
+        on the logs of two ranks, one of which draws a pathologically slow halo
+        '''
+        
+        def record(halo, rank, start, time, nsources):
+            return {'halo':halo, 'rank':rank, 'worker':100 + rank, 'nsources':nsources, 
+                    'nconfigs':2, 'nfev':20, 'bytes_read':nsources * 40, 'start':start, 
+                    'end':start + time, 'time':time, 
+                    'stages':{'read':0.1 * time, 'fit':0.9 * time}}
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs = [journal.journal(os.path.join(tmp_dir, 'run_rank{}.jsonl'.format(rank))) 
+                    for rank in range(2)]
+            logs[0].append([record('a', 0, 0.0, 1.0, 1000), record('b', 0, 1.0, 1.0, 1000), 
+                            record('c', 0, 2.0, 1.0, 1000)])
+            logs[1].append([record('d', 1, 0.0, 1.0, 1000), record('e', 1, 1.0, 7.0, 200)])
+            report = telemetry.summarize(journal.read_journals(os.path.join(tmp_dir, '*.jsonl')))
+            telemetry.write_report(report, os.path.join(tmp_dir, 'report.json'))
+            with open(os.path.join(tmp_dir, 'report.json')) as f:
+                self.assertEqual(json.load(f)['nhalos'], 5)
+        
+        self.assertEqual([report['nhalos'], report['nsources'], report['span']], [5, 4200, 8.0])
+        self.assertEqual(report['bytes_per_s'], 4200 * 40 / 8.0)
+        self.assertTrue( np.isclose(report['stages']['fit'], 0.9 * 11))
+        self.assertEqual([[w['rank'], w['nhalos'], w['busy'], w['idle']] for w in report['workers']], 
+                         [[0, 3, 3.0, 5.0], [1, 2, 8.0, 0.0]])
+        self.assertEqual(report['imbalance'], 8.0 / 5.5)
+        self.assertEqual([r['halo'] for r in report['slowest']][:2], ['e', 'a'])
+        self.assertEqual([r['halo'] for r in report['outliers']], ['e'])
+        self.assertEqual(telemetry.summarize([])['nhalos'], 0)
+
+    
+    
+    def test_shared_lens_system(self, nbins=12):
+        '''
+        This function tests the shared memory lensing system of `shared_lens_system.py`; that a 
+        system created from a lens, pickled, and attached by name (in this process, and in a worker
+        process) gives the same binned differential surface density as the source lens
+        
+        Parameters
+        ----------
+        nbins : int
+            The number of radial bins
+        '''
+        
+        lens, true_NFW = _test_lens()
+        lens.set_radial_cuts(0.2, 1.5)
+        expected = lens.calc_delta_sigma_binned(nbins=nbins, return_std=True)
+        
+        shared = shared_obs_lens_system(lens)
+        try:
+            self.assertTrue( shared.owner)
+            attached = pickle.loads(pickle.dumps(shared))
+            self.assertFalse( attached.owner)
+            self.assertEqual(attached.name, shared.name)
+            self.assertEqual(len(pickle.dumps(shared)), len(pickle.dumps(attached)))
+            
+            # radial cuts are set per process and per system, over the same shared sources
+            attached.set_radial_cuts(0.2, 1.5)
+            binned = [attached.calc_delta_sigma_binned(nbins=nbins, return_std=True)]
+            with futures.ProcessPoolExecutor(1) as pool:
+                binned.append(pool.submit(_binned_in_worker, shared).result())
+            for result in binned:
+                for col in ['r_mean', 'delta_sigma_mean', 'delta_sigma_se_mean']:
+                    self.assertTrue( np.array_equal(result[col], expected[col], equal_nan=True))
+            self.assertTrue( np.array_equal(attached.calc_delta_sigma(), lens.calc_delta_sigma()))
+            
+            # the shared source data is read-only, and a fit of it matches one of the source lens
+            with self.assertRaises(ValueError):
+                attached.zs[0] = 0
+            [res, _] = fit_profile.fit_nfw_profile_lstq(attached, NFW(0.75, 3.0, lens.zl), [0.3, 2.0], 
+                                                        bin_data=True, bins=15)
+            [lens_res, _] = fit_profile.fit_nfw_profile_lstq(lens, NFW(0.75, 3.0, lens.zl), 
+                                                             [0.3, 2.0], bin_data=True, bins=15)
+            self.assertTrue( np.array_equal(res.x, lens_res.x))
+            attached.close()
+        finally:
+            shared.unlink()
+
+
+
+def _binned_in_worker(lens):
+    '''
+    Returns the binned differential surface density of a lensing system, as computed in a worker 
+    process, for `TestCampaign.test_shared_lens_system`
+    '''
+    lens.set_radial_cuts(0.2, 1.5)
+    return lens.calc_delta_sigma_binned(nbins=12, return_std=True)